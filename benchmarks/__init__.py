@@ -0,0 +1,7 @@
+"""Tools for measuring the forum's performance against generated data.
+
+These are run from the root of the repository, with DATABASE_URL
+pointing to a database that can be thrown away, e.g.:
+
+    DATABASE_URL=postgresql://foo@localhost/tsohabench python -m benchmarks.seed
+"""
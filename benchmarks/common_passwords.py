@@ -0,0 +1,125 @@
+"""Compares the common password lookup against the Python set it replaced:
+the time to load the list, the memory it takes, and the time per lookup.
+
+Each variant is measured in a fresh process. The sorted file is built
+first if needed, like the first lookup in a server process would. Unlike
+the other benchmarks, this doesn't need a database."""
+
+import argparse
+import gzip
+import importlib.util
+import json
+import random
+import subprocess
+import sys
+import time
+from types import ModuleType
+from typing import Any, Callable, Container, Dict, List
+
+VALIDATION_PATH = "forum/validation.py"
+SOURCE_PATH = "forum/common_passwords.txt.gz"
+
+def load_validation() -> ModuleType:
+    """Imports forum/validation.py by itself. Importing it through the
+    forum package would start the whole server."""
+
+    spec = importlib.util.spec_from_file_location("validation", VALIDATION_PATH)
+    assert spec is not None and spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def load_set() -> Container[str]:
+    """The list as it used to be loaded, into a set in each process."""
+
+    passwords = set()
+    with gzip.open(SOURCE_PATH, "rt") as passwords_file:
+        for password in passwords_file.readlines():
+            passwords.add(password.strip())
+    return passwords
+
+def load_sorted_file() -> Container[str]:
+    """The list searched from the memory-mapped sorted file."""
+
+    common_passwords: Container[str] = load_validation().COMMON_PASSWORDS
+    "" in common_passwords # pylint: disable = W0104
+    return common_passwords
+
+VARIANTS: Dict[str, Callable[[], Container[str]]] = {
+    "set": load_set,
+    "sorted file": load_sorted_file,
+}
+
+def memory_usage() -> Dict[str, int]:
+    """Returns the process's resident memory in kilobytes, split into the
+    private memory and the file-backed memory shared with other processes."""
+
+    usage = {}
+    with open("/proc/self/status", encoding = "utf-8") as status:
+        for line in status:
+            key, _, value = line.partition(":")
+            if key in ("RssAnon", "RssFile"):
+                usage[key] = int(value.split()[0])
+    return usage
+
+def measure(variant: str, lookups: int) -> Dict[str, Any]:
+    """Loads the list the given way and measures it."""
+
+    before = memory_usage()
+    start = time.perf_counter()
+    passwords = VARIANTS[variant]()
+    load_time = time.perf_counter() - start
+    after = memory_usage()
+
+    rng = random.Random(0)
+    with gzip.open(SOURCE_PATH, "rt") as passwords_file:
+        sample = rng.sample([password.strip() for password in passwords_file], lookups // 2)
+    # Half of the lookups hit, half are near misses.
+    candidates = sample + [password + "!" for password in sample]
+    rng.shuffle(candidates)
+    start = time.perf_counter()
+    hits = sum(1 for password in candidates if password in passwords)
+    lookup_time = time.perf_counter() - start
+    assert hits >= len(sample)
+
+    return {
+        "variant": variant,
+        "load_ms": load_time * 1000,
+        "private_kb": after.get("RssAnon", 0) - before.get("RssAnon", 0),
+        "shared_kb": after.get("RssFile", 0) - before.get("RssFile", 0),
+        "lookup_us": lookup_time / len(candidates) * 1000000,
+    }
+
+def main() -> None:
+    """Measures each variant in a subprocess and prints a comparison."""
+
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument("--lookups", type = int, default = 20000)
+    parser.add_argument("--json", action = "store_true", help = "Print the results as JSON.")
+    parser.add_argument("--variant", choices = VARIANTS.keys(), help = argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant is not None:
+        print(json.dumps(measure(args.variant, args.lookups)))
+        return
+
+    # Builds the sorted file, so its building isn't counted as loading.
+    load_validation().COMMON_PASSWORDS.load()
+    results: List[Dict[str, Any]] = []
+    for variant in VARIANTS:
+        output = subprocess.run([sys.executable, "-m", "benchmarks.common_passwords",
+                                 "--variant", variant, "--lookups", str(args.lookups)],
+                                check = True, capture_output = True, text = True).stdout
+        results.append(json.loads(output))
+
+    if args.json:
+        print(json.dumps(results, indent = 2))
+        return
+    print("{:<12} {:>10} {:>12} {:>11} {:>11}".format(
+        "", "load (ms)", "private (kB)", "shared (kB)", "lookup (µs)"))
+    for result in results:
+        print("{variant:<12} {load_ms:>10.1f} {private_kb:>12} {shared_kb:>11} "
+              "{lookup_us:>11.2f}".format(**result))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""Checks the query plans of ForumDatabase's hot paths for sequential
+scans of the tables that grow with the forum's usage. The database
+should be seeded with benchmarks.seed first, as PostgreSQL prefers
+sequential scans for small tables regardless of the indexes.
+
+Exits with status 1 if a hot path scans posts, topics or users."""
+
+import argparse
+import json
+import sys
+from typing import Any, Callable, Dict, List, Tuple
+from sqlalchemy import event
+from forum import app, database
+from forum.database import ForumDatabase
+
+# The tables which grow with the amount of users and posts. Scanning
+# boards, roles and the like is fine, they stay small.
+LARGE_TABLES = { "posts", "topics", "users" }
+
+# Scans which are the right plan, by hot path. When a search word matches
+# thousands of posts (found through the GIN index), hashing the topics
+# once is cheaper than looking each post's topic up from topics_pkey.
+ALLOWED_SCANS = {
+    "search_posts": { "topics" },
+}
+
+def capture_statements(forum_database: ForumDatabase,
+                       call: Callable[[], Any]) -> List[Tuple[str, Any]]:
+    """Runs the function and returns the SQL statements it executed."""
+
+    statements: List[Tuple[str, Any]] = []
+    def before_cursor_execute(conn: Any, cursor: Any, statement: str, parameters: Any,
+                              context: Any, executemany: bool) -> None:
+        # pylint: disable = R0913, W0613
+        if not executemany:
+            statements.append((statement, parameters))
+    engine = forum_database.database.engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        call()
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    return statements
+
+def find_seq_scans(plan: Dict[str, Any]) -> List[str]:
+    """Returns the names of the relations sequentially scanned in the plan."""
+
+    relations = []
+    if plan["Node Type"] == "Seq Scan":
+        relations.append(plan["Relation Name"])
+    for subplan in plan.get("Plans", []):
+        relations += find_seq_scans(subplan)
+    return relations
+
+def get_partition_parents(forum_database: ForumDatabase) -> Dict[str, str]:
+    """Returns the parent tables of the partitions, by the partitions' names.
+    Partitions of a few pages, e.g. the ones for the upcoming months, are
+    left out, as scanning them sequentially is the right plan."""
+
+    result = forum_database.database.session.execute(
+        "select c.relname, p.relname from pg_inherits i "
+        "join pg_class c on c.oid = i.inhrelid join pg_class p on p.oid = i.inhparent "
+        "where c.relpages >= 10")
+    return { row[0]: row[1] for row in result }
+
+def explain(forum_database: ForumDatabase, statement: str, parameters: Any) -> Dict[str, Any]:
+    """Returns the query plan of the statement, without running it."""
+
+    cursor = forum_database.database.session.connection().connection.cursor()
+    cursor.execute("explain (format json) " + statement, parameters)
+    plan: Dict[str, Any] = cursor.fetchone()[0][0]["Plan"]
+    return plan
+
+def pick_arguments(forum_database: ForumDatabase) -> Dict[str, Any]:
+    """Returns ids and keys from the seeded data for calling the hot paths
+    with: the busiest board and topic, keys from the middle of their
+    listings, a post in the topic and its author, and a search word."""
+
+    session = forum_database.database.session
+    board_id = session.execute(
+        "select board_id from board_stats order by post_count desc limit 1").scalar()
+    topic_id, topic_board_id = session.execute(
+        "select topic_id, parent_board_id from topics "
+        "order by reply_count desc limit 1").first()
+    # The keys of rows in the middle of the listings, for deep pages.
+    topic_key = session.execute(
+        "select sticky, last_post_time, topic_id from topics where parent_board_id = :board_id "
+        "order by last_post_time offset 100 limit 1", { "board_id": board_id }).first()
+    post_key = session.execute(
+        "select creation_time, post_id from posts where parent_topic_id = :topic_id "
+        "order by creation_time desc offset 10 limit 1", { "topic_id": topic_id }).first()
+    post_id = post_key[1]
+    # The post's author, so the edit and delete paths go all the way through.
+    user_id, username = session.execute(
+        "select user_id, username from users join posts on user_id = author_user_id "
+        "where post_id = :post_id", { "post_id": post_id }).first()
+    # A word that some, but not most, posts contain.
+    search_word = session.execute(
+        "select word from ts_stat('select search_vector_english from posts') "
+        "order by ndoc desc offset 500 limit 1").scalar()
+    return {
+        "board_id": board_id,
+        "topic_id": topic_id,
+        "topic_board_id": topic_board_id,
+        "topic_key": tuple(topic_key),
+        "post_key": tuple(post_key),
+        "post_id": post_id,
+        "user_id": user_id,
+        "access": forum_database.get_board_access(user_id),
+        "username": username,
+        "search_word": search_word,
+    }
+
+def hot_paths(forum_database: ForumDatabase) -> Dict[str, Callable[[], Any]]:
+    """Returns the ForumDatabase calls made while serving pages and
+    handling form submissions, with arguments picked from the seeded data."""
+
+    args = pick_arguments(forum_database)
+    board_id, topic_id, post_id, user_id = \
+        args["board_id"], args["topic_id"], args["post_id"], args["user_id"]
+    return {
+        "get_user_context": lambda: forum_database.get_user_context(user_id),
+        "get_session_generation": lambda: forum_database.get_session_generation(user_id),
+        "get_board_access": lambda: forum_database.get_board_access(user_id),
+        "get_boards": lambda: forum_database.get_boards(args["access"]),
+        "get_board_data": lambda: forum_database.get_board_data(board_id),
+        "get_topics": lambda: forum_database.get_topics(board_id, 51),
+        "get_topics (deep page)": lambda: forum_database.get_topics(
+            board_id, 51, after = args["topic_key"]),
+        "get_topic_data": lambda: forum_database.get_topic_data(topic_id),
+        "get_posts": lambda: list(forum_database.get_posts(topic_id, user_id, 26)),
+        "get_posts (deep page)": lambda: list(forum_database.get_posts(
+            topic_id, user_id, 26, after = args["post_key"])),
+        "get_post_creation_time": lambda: forum_database.get_post_creation_time(post_id),
+        "search_posts": lambda: forum_database.search_posts(
+            "english", args["search_word"], args["access"], 21),
+        "login": lambda: forum_database.login(args["username"], "wrong password"),
+        "create_post": lambda: forum_database.create_post(
+            topic_id, user_id, "Re: Query plans", "Checking the query plan."),
+        "create_topic": lambda: forum_database.create_topic(
+            args["topic_board_id"], user_id, "Query plans", "Checking the query plan."),
+        "edit_post": lambda: forum_database.edit_post(
+            args["post_key"], user_id, "Edited", "Checking the query plan."),
+        "delete_post": lambda: forum_database.delete_post(args["post_key"], user_id),
+        "refresh_board_last_post": lambda: forum_database.refresh_board_last_post(board_id),
+    }
+
+def main() -> None:
+    """Explains the queries of every hot path and reports sequential scans."""
+
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument("--verbose", action = "store_true", help = "Print every query plan.")
+    args = parser.parse_args()
+
+    # The forum module exits at import if it can't set up the database.
+    assert database is not None
+    failures = []
+    with app.app_context():
+        # The write paths commit, so the session is bound to a connection
+        # whose transaction is rolled back at the end, which keeps the
+        # seeded data as it was for the next run.
+        connection = database.database.engine.connect()
+        transaction = connection.begin()
+        database.database.session.remove()
+        database.database.session.configure(bind = connection)
+        parents = get_partition_parents(database)
+        for name, call in hot_paths(database).items():
+            scanned = set()
+            for statement, parameters in capture_statements(database, call):
+                if statement.split(None, 1)[0].lower() not in ("select", "insert",
+                                                               "update", "delete", "with"):
+                    continue
+                plan = explain(database, statement, parameters)
+                if args.verbose:
+                    print(name, statement, json.dumps(plan, indent = 2), sep = "\n")
+                allowed = ALLOWED_SCANS.get(name, set())
+                relations = { parents.get(relation, relation) for relation in find_seq_scans(plan) }
+                for relation in relations & LARGE_TABLES - allowed:
+                    scanned.add(relation)
+                    print("{}: sequential scan on {}:\n    {}".format(
+                        name, relation, " ".join(statement.split())))
+            if len(scanned) > 0:
+                failures.append(name)
+            print("{}: {}".format(name, "FAIL" if len(scanned) > 0 else "ok"))
+        database.database.session.close()
+        transaction.rollback()
+        connection.close()
+
+    if len(failures) > 0:
+        print("Hot paths scanning large tables: {}".format(", ".join(failures)))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""Replays a mix of page views and form submissions against the forum
+served by gunicorn, as many logged in users at once, and reports the
+throughput and latency percentiles of each route.
+
+The server is started on a local port with the given gunicorn options,
+and with this process's environment, so DATABASE_URL should point to a
+seeded database (see benchmarks.seed). With --url, an already running
+server is used instead. The users are registered at the start, and they
+write posts, so the database grows with each run."""
+
+import argparse
+import http.client
+import http.cookies
+import json
+import os
+import random
+import re
+import secrets
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+# The relative weights of the actions in the mix.
+MIX = {
+    "GET /": 20,
+    "GET /board": 25,
+    "GET /board/topic": 30,
+    "GET /search": 8,
+    "POST /board/topic": 6,
+    "POST /board/topic/edit": 5,
+    "POST /change_language": 3,
+}
+
+CSRF_TOKEN_PATTERN = re.compile(r'name="csrf_token" value="([^"]*)"')
+BOARD_LINK_PATTERN = re.compile(r'href="(/board/\d+)"')
+TOPIC_LINK_PATTERN = re.compile(r'href="(/board/\d+/topic/\d+)"')
+WORD_PATTERN = re.compile(r"<strong>([^<]+)</strong>")
+
+class Client:
+    """One user's browser: keeps the user's cookies, CSRF token and the
+    posts they've written. The session cookie is only sent over HTTPS
+    by browsers, so the cookies are handled here instead."""
+
+    def __init__(self, url: str) -> None:
+        parts = urllib.parse.urlsplit(url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 80
+        self.cookies: Dict[str, str] = {}
+        self.csrf_token = ""
+        self.posts: List[str] = []
+
+    def request(self, method: str, path: str,
+                form: Optional[Dict[str, str]] = None) -> Tuple[int, Any, str]:
+        """Makes a request, and returns the status, headers and body."""
+
+        headers = {}
+        if len(self.cookies) > 0:
+            headers["Cookie"] = "; ".join("{}={}".format(name, value)
+                                          for name, value in self.cookies.items())
+        body = None
+        if form is not None:
+            body = urllib.parse.urlencode(form)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        connection = http.client.HTTPConnection(self.host, self.port, timeout = 60)
+        try:
+            connection.request(method, path, body, headers)
+            response = connection.getresponse()
+            content = response.read().decode("utf-8", "replace")
+        finally:
+            connection.close()
+        for header in response.headers.get_all("Set-Cookie") or []:
+            cookie = http.cookies.SimpleCookie()
+            cookie.load(header)
+            for name, morsel in cookie.items():
+                self.cookies[name] = morsel.value
+        return response.status, response.headers, content
+
+    def post_form(self, path: str, form: Dict[str, str]) -> Tuple[int, Any, str]:
+        """Submits a form with the CSRF token, getting a new token first if
+        there isn't one yet."""
+
+        if self.csrf_token == "":
+            _, _, page = self.request("GET", "/")
+            match = CSRF_TOKEN_PATTERN.search(page)
+            self.csrf_token = match.group(1) if match is not None else ""
+        return self.request("POST", path, dict(form, csrf_token = self.csrf_token,
+                                               redirect_url = "/"))
+
+    def register(self, username: str, password: str) -> None:
+        """Registers and logs in as a new user. Waits and tries again if
+        the server's password hashers are busy."""
+
+        form = { "username": username, "password": password, "confirm-password": password,
+                 "redirect_url": "/" }
+        while True:
+            status, headers, _ = self.request("POST", "/register", form)
+            if status != 503:
+                break
+            time.sleep(float(headers.get("Retry-After", "1")))
+        if status != 302 or "error" in headers.get("Location", ""):
+            raise RuntimeError("Registering {} failed: {} {}".format(
+                username, status, headers.get("Location")))
+
+class Site(NamedTuple):
+    """The boards, topics and words found from the server's pages, shared
+    by the clients."""
+    boards: List[str]
+    topics: List[str]
+    words: List[str]
+
+def explore(client: Client) -> Site:
+    """Finds the boards the client can see, the topics on their first
+    pages, and the words in the topics' titles."""
+
+    _, _, index = client.request("GET", "/")
+    boards = sorted(set(BOARD_LINK_PATTERN.findall(index)))
+    topics: List[str] = []
+    words: Set[str] = set()
+    for board in boards:
+        _, _, page = client.request("GET", board)
+        topics += sorted(set(TOPIC_LINK_PATTERN.findall(page)))
+        for title in WORD_PATTERN.findall(page):
+            words.update(word.lower() for word in title.split() if word.isalpha())
+    if len(topics) == 0 or len(words) == 0:
+        raise RuntimeError("No topics found, is the database seeded?")
+    return Site(boards, topics, sorted(words))
+
+def make_actions(site: Site, rng: random.Random) -> Dict[str, Callable[[Client], int]]:
+    """Returns the actions of the mix, which make their requests as the
+    given client and return the response's status."""
+
+    def reply(client: Client) -> int:
+        topic = rng.choice(site.topics)
+        status, headers, _ = client.post_form(topic, {
+            "title": "Re: Load test",
+            "content": "A *reply* about {}.".format(rng.choice(site.words)),
+        })
+        location = headers.get("Location", "")
+        if "#" in location:
+            client.posts.append("{}/edit/{}".format(topic, location.rsplit("#", 1)[1]))
+        return status
+
+    def edit(client: Client) -> int:
+        if len(client.posts) == 0:
+            return reply(client)
+        status, _, _ = client.post_form(rng.choice(client.posts), {
+            "title": "Re: Load test",
+            "content": "An *edited* reply about {}.".format(rng.choice(site.words)),
+            "confirm_edit": "1",
+        })
+        return status
+
+    return {
+        "GET /": lambda client: client.request("GET", "/")[0],
+        "GET /board": lambda client: client.request("GET", rng.choice(site.boards))[0],
+        "GET /board/topic": lambda client: client.request("GET", rng.choice(site.topics))[0],
+        "GET /search": lambda client: client.request("GET", "/search?" + urllib.parse.urlencode(
+            { "q": rng.choice(site.words) }))[0],
+        "POST /board/topic": reply,
+        "POST /board/topic/edit": edit,
+        "POST /change_language": lambda client: client.post_form("/change_language", {
+            "new_language": rng.choice(["en", "fi"]),
+        })[0],
+    }
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Returns the value below which the given fraction of the values are."""
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+def run_load(url: str, clients: int, duration: float, seed: int) -> Dict[str, Any]:
+    """Registers the clients, runs the mix for the duration, and returns
+    the results per route."""
+    # pylint: disable = R0914
+
+    prefix = "load-" + secrets.token_hex(3)
+    users = [Client(url) for _ in range(clients)]
+    for i, client in enumerate(users):
+        client.register("{}-{}".format(prefix, i), secrets.token_urlsafe(16))
+    site = explore(users[0])
+
+    latencies: Dict[str, List[float]] = { route: [] for route in MIX }
+    errors: Dict[str, int] = { route: 0 for route in MIX }
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def run_client(client: Client, rng: random.Random) -> None:
+        actions = make_actions(site, rng)
+        routes = list(MIX.keys())
+        weights = list(MIX.values())
+        while time.perf_counter() < deadline:
+            route = rng.choices(routes, weights)[0]
+            start = time.perf_counter()
+            try:
+                status = actions[route](client)
+            except OSError:
+                status = 0
+            latency = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies[route].append(latency)
+                if status >= 400 or status == 0:
+                    errors[route] += 1
+
+    threads = [threading.Thread(target = run_client, args = (client, random.Random(seed + i)))
+               for i, client in enumerate(users)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    routes = {}
+    for route, times in latencies.items():
+        if len(times) == 0:
+            continue
+        times.sort()
+        routes[route] = {
+            "requests": len(times),
+            "errors": errors[route],
+            "requests_per_second": len(times) / elapsed,
+            "p50_ms": percentile(times, 0.5),
+            "p95_ms": percentile(times, 0.95),
+            "p99_ms": percentile(times, 0.99),
+        }
+    total = sum(len(times) for times in latencies.values())
+    return { "clients": clients, "seconds": elapsed, "requests": total,
+             "requests_per_second": total / elapsed, "routes": routes }
+
+def start_server(port: int, workers: int, worker_class: str, threads: int) -> Any:
+    """Starts gunicorn serving the forum, and waits until it responds."""
+
+    environment = dict(os.environ)
+    environment.setdefault("SECRET_KEY", secrets.token_hex(20))
+    # Left running for the load, and terminated by the caller.
+    # pylint: disable = R1732
+    server = subprocess.Popen([sys.executable, "-m", "gunicorn",
+                               "--bind", "127.0.0.1:{}".format(port),
+                               "--workers", str(workers), "--worker-class", worker_class,
+                               "--threads", str(threads), "forum:app"],
+                              env = environment, stderr = subprocess.DEVNULL)
+    client = Client("http://127.0.0.1:{}".format(port))
+    for _ in range(600):
+        if server.poll() is not None:
+            raise RuntimeError("gunicorn exited with status {}".format(server.returncode))
+        try:
+            client.request("GET", "/")
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("gunicorn didn't start responding")
+
+def main() -> None:
+    """Runs the load against a new or an existing server and prints the results."""
+
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument("--url", help = "The URL of a running server to use, "
+                        "e.g. http://127.0.0.1:5000.")
+    parser.add_argument("--port", type = int, default = 8123)
+    parser.add_argument("--workers", type = int, default = 2)
+    parser.add_argument("--worker-class", default = "sync")
+    parser.add_argument("--threads", type = int, default = 1)
+    parser.add_argument("--clients", type = int, default = 8, help = "Simultaneous users.")
+    parser.add_argument("--duration", type = float, default = 30, help = "Seconds.")
+    parser.add_argument("--random-seed", type = int, default = 0)
+    parser.add_argument("--json", action = "store_true", help = "Print the results as JSON.")
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if url is None:
+        server = start_server(args.port, args.workers, args.worker_class, args.threads)
+        url = "http://127.0.0.1:{}".format(args.port)
+    try:
+        results = run_load(url, args.clients, args.duration, args.random_seed)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    if server is not None:
+        results["server"] = { "workers": args.workers, "worker_class": args.worker_class,
+                              "threads": args.threads }
+
+    if args.json:
+        print(json.dumps(results, indent = 2))
+        return
+    print("{requests} requests from {clients} clients in {seconds:.1f} s, "
+          "{requests_per_second:.1f} per second".format(**results))
+    print("{:<24} {:>8} {:>7} {:>8} {:>9} {:>9} {:>9}".format(
+        "", "requests", "errors", "per s", "p50 (ms)", "p95 (ms)", "p99 (ms)"))
+    for route, result in results["routes"].items():
+        print("{:<24} {requests:>8} {errors:>7} {requests_per_second:>8.1f} {p50_ms:>9.1f} "
+              "{p95_ms:>9.1f} {p99_ms:>9.1f}".format(route, **result))
+
+if __name__ == "__main__":
+    main()
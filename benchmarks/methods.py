@@ -0,0 +1,147 @@
+"""Times ForumDatabase's methods, with arguments picked like in
+benchmarks.explain_queries, and prints the median, 95th percentile and
+fastest time of each.
+
+With --sizes, the database is seeded with benchmarks.seed up to each of
+the given amounts of posts in turn (with users, topics and boards in the
+same proportions as the seed tool's defaults), and the methods are timed
+at each size. Otherwise, they're timed against the database as it is.
+The methods which write are timed too, so the database grows a little
+with each run."""
+
+import argparse
+import contextlib
+import json
+import random
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List
+from forum import app, database
+from forum.database import ForumDatabase
+from benchmarks.explain_queries import pick_arguments
+from benchmarks.seed import seed
+
+# A benchmark prepares anything its call needs, untimed, and returns the call.
+# The pages of rows are read as they're iterated over, so the calls read
+# them all, like rendering the page would.
+Benchmark = Callable[[], Callable[[], Any]]
+
+def benchmarks(forum_database: ForumDatabase) -> Dict[str, Benchmark]:
+    """Returns the benchmarks of the methods, by name."""
+
+    args = pick_arguments(forum_database)
+    board_id, topic_id, user_id = args["board_id"], args["topic_id"], args["user_id"]
+
+    def prepare_delete_post() -> Callable[[], Any]:
+        new_post_key = forum_database.create_post(topic_id, user_id, "Re: Benchmark",
+                                                  "To be deleted.")
+        assert new_post_key is not None
+        return lambda: forum_database.delete_post(new_post_key, user_id)
+
+    return {
+        "get_user_context": lambda: lambda: forum_database.get_user_context(user_id),
+        "get_session_generation": lambda: lambda: forum_database.get_session_generation(user_id),
+        "get_board_access": lambda: lambda: forum_database.get_board_access(user_id),
+        "get_boards": lambda: lambda: forum_database.get_boards(args["access"]),
+        "get_board_data": lambda: lambda: forum_database.get_board_data(board_id),
+        "get_board_version": lambda: lambda: forum_database.get_board_version(board_id),
+        "get_topics": lambda: lambda: list(forum_database.get_topics(board_id, 51)),
+        "get_topics (deep page)": lambda: lambda: list(forum_database.get_topics(
+            board_id, 51, after = args["topic_key"])),
+        "get_topic_data": lambda: lambda: forum_database.get_topic_data(topic_id),
+        "get_topic_version": lambda: lambda: forum_database.get_topic_version(topic_id),
+        "get_posts": lambda: lambda: list(forum_database.get_posts(topic_id, user_id, 26)),
+        "get_posts (deep page)": lambda: lambda: list(forum_database.get_posts(
+            topic_id, user_id, 26, after = args["post_key"])),
+        "search_posts": lambda: lambda: list(forum_database.search_posts(
+            "english", args["search_word"], args["access"], 21) or []),
+        "create_post": lambda: lambda: forum_database.create_post(
+            topic_id, user_id, "Re: Benchmark", "A *benchmark* post."),
+        "create_topic": lambda: lambda: forum_database.create_topic(
+            args["topic_board_id"], user_id, "Benchmark", "A *benchmark* topic."),
+        "edit_post": lambda: lambda: forum_database.edit_post(
+            args["post_key"], user_id, "Edited", "An *edited* post."),
+        "delete_post": prepare_delete_post,
+    }
+
+def count_rows(forum_database: ForumDatabase) -> Dict[str, int]:
+    """Returns the amounts of users, boards, topics and posts."""
+
+    session = forum_database.database.session
+    return { table: int(session.execute("select count(*) from {}".format(table)).scalar())
+             for table in ("users", "boards", "topics", "posts") }
+
+def measure(forum_database: ForumDatabase, calls: int) -> List[Dict[str, Any]]:
+    """Times each benchmark's call the given amount of times, after one
+    untimed call, and returns the results in milliseconds."""
+
+    size = count_rows(forum_database)
+    results = []
+    for name, prepare in benchmarks(forum_database).items():
+        prepare()()
+        times = []
+        for _ in range(calls):
+            call = prepare()
+            start = time.perf_counter()
+            call()
+            times.append((time.perf_counter() - start) * 1000)
+        forum_database.database.session.commit()
+        times.sort()
+        results.append({
+            "method": name,
+            "size": size,
+            "calls": calls,
+            "median_ms": statistics.median(times),
+            "p95_ms": times[min(int(len(times) * 0.95), len(times) - 1)],
+            "min_ms": times[0],
+        })
+    return results
+
+def grow(forum_database: ForumDatabase, posts: int, rng: random.Random) -> None:
+    """Seeds the database until it has the given amount of posts."""
+
+    existing = count_rows(forum_database)["posts"]
+    missing = posts - existing
+    if missing <= 0:
+        return
+    # The proportions of benchmarks.seed's defaults. The roles are only
+    # made the first time.
+    seed(forum_database, max(missing // 100, 1), 5 if existing == 0 else 0,
+         max(missing // 10000, 1), max(missing // 10, 1), missing, rng)
+
+def main() -> None:
+    """Times the methods at each size and prints the results."""
+
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument("--sizes", type = lambda sizes: [int(size) for size in sizes.split(",")],
+                        default = [], help = "Comma-separated amounts of posts, e.g. 20000,200000.")
+    parser.add_argument("--calls", type = int, default = 50, help = "Calls per method.")
+    parser.add_argument("--random-seed", type = int, default = 0)
+    parser.add_argument("--json", action = "store_true", help = "Print the results as JSON.")
+    args = parser.parse_args()
+
+    # The forum module exits at import if it can't set up the database.
+    assert database is not None
+    rng = random.Random(args.random_seed)
+    results: List[Dict[str, Any]] = []
+    with app.app_context():
+        if len(args.sizes) == 0:
+            results += measure(database, args.calls)
+        for posts in sorted(args.sizes):
+            # The seed tool's progress is kept out of the results.
+            with contextlib.redirect_stdout(sys.stderr):
+                grow(database, posts, rng)
+            results += measure(database, args.calls)
+
+    if args.json:
+        print(json.dumps(results, indent = 2))
+        return
+    print("{:<24} {:>8} {:>11} {:>9} {:>9}".format("", "posts", "median (ms)", "p95 (ms)",
+                                                   "min (ms)"))
+    for result in results:
+        print("{method:<24} {posts:>8} {median_ms:>11.2f} {p95_ms:>9.2f} {min_ms:>9.2f}".format(
+            posts = result["size"]["posts"], **result))
+
+if __name__ == "__main__":
+    main()
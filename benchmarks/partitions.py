@@ -0,0 +1,216 @@
+"""Compares the statements ForumDatabase executes to read posts against
+the monthly partitions of posts and against an unpartitioned copy of the
+same posts, counts the partitions the statements read, and measures how much archiving a
+partition compresses it.
+
+The database should be seeded with benchmarks.seed first, over a longer
+span of time (see its --days option) for more partitions, and its posts
+partitioned with `flask partition-posts`. The copy is
+made on the first run, with the indexes posts had before partitioning,
+and kept for later runs until it's dropped with --drop-copy."""
+
+import argparse
+import json
+import re
+import statistics
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Tuple
+from forum import app, database, statements
+from benchmarks.explain_queries import capture_statements
+
+COPY_NAME = "bench_posts_unpartitioned"
+
+# The indexes of posts before it was partitioned, see partition_posts.sql.
+COPY_SQL = [
+    "create table {0} as select * from posts",
+    "alter table {0} add primary key (post_id)",
+    "create index {0}_listing_idx on {0} (parent_topic_id, creation_time, post_id)",
+    "create index {0}_author_idx on {0} (author_user_id)",
+    "create index {0}_search_english_idx on {0} using gin (search_vector_english)",
+    "create index {0}_search_finnish_idx on {0} using gin (search_vector_finnish)",
+    "analyze {0}",
+]
+
+def make_copy() -> None:
+    """Copies the posts into an unpartitioned table, if it isn't there yet."""
+
+    assert database is not None
+    session = database.database.session
+    if session.execute("select to_regclass(:name)", { "name": COPY_NAME }).scalar() is not None:
+        return
+    print("Copying the posts into {}...".format(COPY_NAME))
+    for sql in COPY_SQL:
+        session.execute(sql.format(COPY_NAME))
+    session.commit()
+
+def pick_cases() -> Dict[str, Callable[[], Any]]:
+    """Returns the measured ForumDatabase calls, with arguments picked from
+    the database: the first and a deep page of the busiest topic, of an
+    old and a recent topic and of the topic with the fewest posts per
+    month, a search, and a post looked up by id."""
+
+    assert database is not None
+    forum_database = database
+    session = forum_database.database.session
+    def pick_topic(order: str) -> int:
+        topic_id: int = session.execute(
+            "select topic_id from topics where reply_count >= 50 "
+            "order by " + order + " limit 1").scalar()
+        return topic_id
+    topics = {
+        "busiest": pick_topic("reply_count desc"),
+        "old": pick_topic("first_post_time asc"),
+        "recent": pick_topic("first_post_time desc"),
+        "sparse": pick_topic("(reply_count + 1) / extract(epoch from "
+                             "last_post_time - first_post_time + interval '1 day') asc"),
+    }
+    def page(topic_id: int, key: Any = None) -> Callable[[], Any]:
+        return lambda: list(forum_database.get_posts(topic_id, 0, 26, after = key))
+    cases: Dict[str, Callable[[], Any]] = {}
+    for name, topic_id in topics.items():
+        key = tuple(session.execute(
+            "select creation_time, post_id from posts where parent_topic_id = :topic_id "
+            "order by creation_time desc, post_id desc offset 10 limit 1",
+            { "topic_id": topic_id }).first())
+        cases["{} topic".format(name)] = page(topic_id)
+        cases["{} topic, deep".format(name)] = page(topic_id, key)
+    search_word = session.execute(
+        "select word from ts_stat('select search_vector_english from posts') "
+        "order by ndoc desc offset 500 limit 1").scalar()
+    board_ids = frozenset(row[0] for row in session.execute("select board_id from boards"))
+    cases["search"] = lambda: list(forum_database.search_posts("english", search_word,
+                                                               board_ids, 21) or [])
+    post_id = session.execute("select max(post_id) / 2 from posts").scalar()
+    cases["post by id"] = lambda: forum_database.get_post_creation_time(post_id)
+    return cases
+
+def time_per_call(call: Callable[[], Any], calls: int) -> float:
+    """Returns the average time of the call in milliseconds, after warming up."""
+
+    for _ in range(max(calls // 10, 1)):
+        call()
+    start = time.perf_counter()
+    for _ in range(calls):
+        call()
+    return (time.perf_counter() - start) / calls * 1000
+
+def count_partitions(plan: Dict[str, Any]) -> int:
+    """Returns the amount of partitions of posts the analyzed plan read."""
+
+    count = 0
+    if plan.get("Relation Name", "").startswith("posts_") and plan["Actual Loops"] > 0:
+        count += 1
+    for subplan in plan.get("Plans", []):
+        count += count_partitions(subplan)
+    return count
+
+def measure(name: str, call: Callable[[], Any], calls: int, rounds: int) -> Dict[str, Any]:
+    """Measures the statements the call executes against the partitioned
+    and the unpartitioned posts, and returns the medians of the rounds."""
+
+    assert database is not None
+    executed = capture_statements(database, call)
+    cursor = database.database.session.connection().connection.cursor()
+    variants = {
+        "partitioned": executed,
+        "unpartitioned": [(re.sub(r"\bposts\b", COPY_NAME, sql), parameters)
+                          for sql, parameters in executed],
+    }
+    def executor(variant: List[Tuple[str, Any]]) -> Callable[[], None]:
+        def execute() -> None:
+            for sql, parameters in variant:
+                cursor.execute(sql, parameters)
+                if cursor.description is not None:
+                    cursor.fetchall()
+        return execute
+
+    # The variants take turns, so that a slow moment doesn't only hit one.
+    times: Dict[str, List[float]] = { variant: [] for variant in variants }
+    for _ in range(rounds):
+        for variant, variant_statements in variants.items():
+            times[variant].append(time_per_call(executor(variant_statements), calls))
+    partitions_read = 0
+    for sql, parameters in executed:
+        if sql.split(None, 1)[0].lower() not in ("select", "with"):
+            continue
+        cursor.execute("explain (analyze, format json) " + sql, parameters)
+        partitions_read += count_partitions(cursor.fetchone()[0][0]["Plan"])
+    return {
+        "call": name,
+        "statements": len(executed),
+        "partitioned_ms": statistics.median(times["partitioned"]),
+        "unpartitioned_ms": statistics.median(times["unpartitioned"]),
+        "partitions_read": partitions_read,
+    }
+
+def measure_archive() -> Dict[str, Any]:
+    """Archives the oldest partition like archive-posts does, and returns
+    the sizes of the partition, without and with indexes, and of the
+    archive. The archival is rolled back afterwards."""
+
+    assert database is not None
+    session = database.database.session
+    partition = [name for name, _, detached in database.get_post_partitions()
+                 if not detached and name != "posts_default"][0]
+    month = datetime.strptime(partition, "posts_%Y_%m").replace(tzinfo = timezone.utc)
+    table_bytes, total_bytes = session.execute(
+        "select pg_table_size(:partition), pg_total_relation_size(:partition)",
+        { "partition": partition }).first()
+    start = time.perf_counter()
+    session.execute(statements.post_partition_sql(month)["archive"])
+    seconds = time.perf_counter() - start
+    archived_bytes = session.execute("select pg_total_relation_size(:archive)",
+                                     { "archive": "archived_" + partition }).scalar()
+    session.rollback()
+    return { "partition": partition, "table_bytes": table_bytes, "total_bytes": total_bytes,
+             "archived_bytes": archived_bytes, "seconds": seconds }
+
+def main() -> None:
+    """Measures the statements and the archival and prints the results."""
+
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument("--calls", type = int, default = 100, help = "Calls per round.")
+    parser.add_argument("--rounds", type = int, default = 5)
+    parser.add_argument("--drop-copy", action = "store_true",
+                        help = "Drop the unpartitioned copy of the posts and exit.")
+    parser.add_argument("--json", action = "store_true", help = "Print the results as JSON.")
+    args = parser.parse_args()
+
+    # The forum module exits at import if it can't set up the database.
+    assert database is not None
+    with app.app_context():
+        if not database.are_posts_partitioned():
+            raise SystemExit("The posts aren't partitioned, see `flask partition-posts`.")
+        if args.drop_copy:
+            database.database.session.execute("drop table if exists " + COPY_NAME)
+            database.database.session.commit()
+            return
+        make_copy()
+        partition_count = len(database.get_post_partitions())
+        results = [measure(name, call, args.calls, args.rounds)
+                   for name, call in pick_cases().items()]
+        database.database.session.rollback()
+        archive = measure_archive()
+
+    if args.json:
+        print(json.dumps({ "partitions": partition_count, "statements": results,
+                           "archive": archive }, indent = 2, default = str))
+        return
+    print("Milliseconds per call, medians of {} rounds, {} partitions:".format(
+        args.rounds, partition_count))
+    print("{:<20} {:>10} {:>12} {:>14} {:>16}".format(
+        "", "statements", "partitioned", "unpartitioned", "partitions read"))
+    for result in results:
+        print("{call:<20} {statements:>10} {partitioned_ms:>12.2f} {unpartitioned_ms:>14.2f} "
+              "{partitions_read:>16}".format(**result))
+    print("Archiving {partition}: {table_bytes_mb:.1f} MB ({total_bytes_mb:.1f} MB with "
+          "indexes) into {archived_bytes_mb:.1f} MB in {seconds:.1f} s.".format(
+              partition = archive["partition"],
+              table_bytes_mb = archive["table_bytes"] / 1e6,
+              total_bytes_mb = archive["total_bytes"] / 1e6,
+              archived_bytes_mb = archive["archived_bytes"] / 1e6,
+              seconds = archive["seconds"]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""Fills a database with generated users, roles, boards, topics and posts."""
+
+import argparse
+import itertools
+import random
+import secrets
+from datetime import datetime, timedelta, timezone
+from typing import List, Set, Tuple
+from psycopg2.extras import execute_values # type: ignore
+from werkzeug.security import generate_password_hash
+from forum import app, database as forum_database
+from forum.database import ForumDatabase
+from forum.rendering import render_post
+
+# Every generated user has this password, so that they can be logged in as.
+SEED_PASSWORD = "seed-user-password"
+
+SYLLABLES = ["ka", "lo", "mi", "ne", "su", "ta", "ri", "vo", "pe", "ju", "ha", "in", "or", "el"]
+
+def make_vocabulary(rng: random.Random, size: int) -> List[str]:
+    """Returns a list of distinct made-up words."""
+
+    words: Set[str] = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+class TextGenerator:
+    """Generates post titles and contents. Word frequencies follow Zipf's
+    law, like in natural languages, so some words are common and most are
+    rare."""
+
+    def __init__(self, rng: random.Random, vocabulary_size: int = 5000) -> None:
+        self.rng = rng
+        self.vocabulary = make_vocabulary(rng, vocabulary_size)
+        self.cumulative_weights = list(itertools.accumulate(
+            1 / rank for rank in range(1, vocabulary_size + 1)))
+
+    def words(self, count: int) -> List[str]:
+        """Returns a list of random words."""
+        return self.rng.choices(self.vocabulary, cum_weights = self.cumulative_weights, k = count)
+
+    def title(self) -> str:
+        """Returns a random topic title, short enough to be replied to with
+        "Re: " in front of it."""
+        words = self.words(self.rng.randint(2, 6))
+        while len(" ".join(words)) > 46:
+            words.pop()
+        return " ".join(words).capitalize()
+
+    def paragraph(self) -> str:
+        """Returns a paragraph of markdown, with some inline formatting."""
+        words = self.words(self.rng.randint(10, 60))
+        for i, word in enumerate(words):
+            roll = self.rng.random()
+            if roll < 0.02:
+                words[i] = "**{}**".format(word)
+            elif roll < 0.04:
+                words[i] = "*{}*".format(word)
+            elif roll < 0.05:
+                words[i] = "`{}`".format(word)
+            elif roll < 0.055:
+                words[i] = "[{0}](https://example.com/{0})".format(word)
+        return " ".join(words)
+
+    def block(self) -> str:
+        """Returns a markdown block: mostly paragraphs, sometimes a list,
+        a quote or a code block."""
+        roll = self.rng.random()
+        if roll < 0.1:
+            return "\n".join("- " + " ".join(self.words(self.rng.randint(2, 8)))
+                             for _ in range(self.rng.randint(2, 5)))
+        if roll < 0.2:
+            return "> " + self.paragraph()
+        if roll < 0.25:
+            return "```\n" + "\n".join(" ".join(self.words(self.rng.randint(1, 5)))
+                                       for _ in range(self.rng.randint(1, 6))) + "\n```"
+        return self.paragraph()
+
+    def content(self) -> Tuple[str, str]:
+        """Returns the original markdown and the rendered content of a random
+        post, rendered like the forum renders posts."""
+        original = "\n\n".join(self.block() for _ in range(self.rng.randint(1, 4)))
+        rendered = render_post("Title", original)
+        assert rendered is not None
+        return original, rendered[1]
+
+def seed(database: ForumDatabase, user_count: int, role_count: int, board_count: int,
+         topic_count: int, post_count: int, rng: random.Random, thread_skew: float = 3,
+         restricted_boards: float = 0.2, days: float = 365, contents: int = 0) -> None:
+    """Inserts the given amounts of users, roles, boards, topics and posts.
+    Each user gets up to two of the roles, and the restricted_boards share
+    of the boards are only accessible with one of them. The first post of
+    each topic counts towards the post count, and the rest are distributed
+    unevenly, so most topics get a few replies and a few topics get very
+    many. The higher thread_skew is, the more uneven the distribution.
+    The posts are spread over the given amount of days up to now. If
+    contents is above zero, the posts' contents are picked from that many
+    generated ones, which is considerably faster for millions of posts."""
+    # pylint: disable = R0913, R0914, R0915
+
+    session = database.database.session
+    cursor = session.connection().connection.cursor()
+    text = TextGenerator(rng)
+    prefix = "s" + secrets.token_hex(3)
+    now = datetime.now(timezone.utc)
+
+    password_hash = generate_password_hash(SEED_PASSWORD)
+    user_ids = [row[0] for row in execute_values(
+        cursor,
+        "insert into users (username, password_hash, creation_time, password_set_time) "
+        "values %s returning user_id",
+        [("{}-{}".format(prefix, i), password_hash, now, now) for i in range(user_count)],
+        page_size = 1000, fetch = True)]
+    session.commit()
+    print("Inserted {} users.".format(len(user_ids)))
+
+    role_ids = [database.create_role("{} {}".format(text.title(), i), [])
+                for i in range(role_count)]
+    if len(role_ids) > 0:
+        execute_values(
+            cursor, "insert into user_roles (user_id, role_id) values %s",
+            [(user_id, role_id) for user_id in user_ids
+             for role_id in rng.sample(role_ids, min(rng.randint(0, 2), len(role_ids)))],
+            page_size = 1000)
+        database.bump_board_acl_version()
+        session.commit()
+    print("Inserted {} roles.".format(len(role_ids)))
+
+    board_ids = []
+    for _ in range(board_count):
+        board_roles = []
+        if len(role_ids) > 0 and rng.random() < restricted_boards:
+            board_roles = [str(rng.choice(role_ids))]
+        board_ids.append(database.create_board(text.title(), " ".join(text.words(12)),
+                                               board_roles))
+    topic_boards = [rng.choice(board_ids) for _ in range(topic_count)]
+    topic_ids = [row[0] for row in execute_values(
+        cursor,
+        "insert into topics (parent_board_id, sticky) values %s returning topic_id",
+        [(board_id, False) for board_id in topic_boards],
+        page_size = 1000, fetch = True)]
+    session.commit()
+    print("Inserted {} boards and {} topics.".format(len(board_ids), len(topic_ids)))
+
+    # Topics are started at random points of the span, and their replies
+    # come after that. The topic picked for each reply is skewed towards
+    # the first topics.
+    span = timedelta(days = days)
+    topic_starts = [now - span * rng.random() for _ in topic_ids]
+    topic_titles = [text.title() for _ in topic_ids]
+    posts: List[Tuple[datetime, int, str]] = list(zip(topic_starts, topic_ids, topic_titles))
+    for _ in range(max(post_count - len(topic_ids), 0)):
+        index = int(len(topic_ids) * rng.random() ** thread_skew)
+        start = topic_starts[index]
+        posts.append((start + (now - start) * rng.random(), topic_ids[index],
+                      "Re: " + topic_titles[index]))
+    posts.sort()
+    if database.are_posts_partitioned():
+        database.create_post_partitions(now - span, now)
+    content_pool = [text.content() for _ in range(contents)]
+
+    batch_size = 5000
+    for batch_start in range(0, len(posts), batch_size):
+        rows = []
+        for creation_time, topic_id, title in posts[batch_start:batch_start + batch_size]:
+            content_original, content = rng.choice(content_pool) if contents > 0 \
+                else text.content()
+            rows.append((topic_id, rng.choice(user_ids), title, title,
+                         content, content_original, creation_time))
+        execute_values(
+            cursor,
+            "insert into posts (parent_topic_id, author_user_id, title, title_original, "
+            "content, content_original, creation_time) values %s",
+            rows, page_size = 1000)
+        session.commit()
+        print("Inserted {}/{} posts.".format(batch_start + len(rows), len(posts)))
+
+    for i, topic_id in enumerate(topic_ids):
+        database.refresh_topic_summary(topic_id)
+        if i % 1000 == 999:
+            session.commit()
+    session.commit()
+    database.rebuild_board_stats()
+    last_post_id = database.backfill_search_vectors(0, batch_size)
+    while last_post_id is not None:
+        last_post_id = database.backfill_search_vectors(last_post_id, batch_size)
+    print("Updated topic summaries, board statistics and search vectors.")
+
+    session.execute("analyze")
+    session.commit()
+
+def main() -> None:
+    """Seeds the database given on the command line."""
+
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument("--users", type = int, default = 2000)
+    parser.add_argument("--roles", type = int, default = 5)
+    parser.add_argument("--boards", type = int, default = 20)
+    parser.add_argument("--topics", type = int, default = 20000)
+    parser.add_argument("--posts", type = int, default = 200000)
+    parser.add_argument("--thread-skew", type = float, default = 3,
+                        help = "How unevenly replies are spread over the topics. "
+                        "1 spreads them evenly.")
+    parser.add_argument("--restricted-boards", type = float, default = 0.2,
+                        help = "The share of boards only accessible with a role.")
+    parser.add_argument("--days", type = float, default = 365,
+                        help = "The span of time the posts are spread over, up to now.")
+    parser.add_argument("--contents", type = int, default = 0,
+                        help = "Pick the posts' contents from this many generated ones, "
+                        "instead of generating each, for seeding millions of posts.")
+    parser.add_argument("--random-seed", type = int, default = 0)
+    args = parser.parse_args()
+
+    # The forum module exits at import if it can't set up the database.
+    assert forum_database is not None
+    with app.app_context():
+        seed(forum_database, args.users, args.roles, args.boards, args.topics, args.posts,
+             random.Random(args.random_seed), args.thread_skew, args.restricted_boards,
+             args.days, args.contents)
+
+if __name__ == "__main__":
+    main()
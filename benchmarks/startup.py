@@ -0,0 +1,70 @@
+"""Measures how long a fresh server process takes from importing the app to
+its first response, with an empty template bytecode cache (like the first
+worker after a deploy) and with a filled one (like the workers after it).
+
+Each run is a new process, with TEMPLATE_CACHE_DIR pointed to a temporary
+directory. The app is imported normally, so DATABASE_URL has to be set."""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List
+
+# Run in each measured process. The first response is the login page, as
+# the request isn't logged in, so it renders the base template.
+MEASURED_PROCESS = """
+import json, time
+start = time.perf_counter()
+from forum import app
+imported = time.perf_counter()
+response = app.test_client().get("/")
+assert response.status_code == 401, response.status_code
+responded = time.perf_counter()
+print(json.dumps({ "import_ms": (imported - start) * 1000,
+                   "first_response_ms": (responded - imported) * 1000,
+                   "total_ms": (responded - start) * 1000 }))
+"""
+
+def measure(template_cache_dir: str) -> Dict[str, float]:
+    """Starts the app in a new process and returns its timings."""
+
+    environment = dict(os.environ, TEMPLATE_CACHE_DIR = template_cache_dir)
+    output = subprocess.run([sys.executable, "-c", MEASURED_PROCESS], env = environment,
+                            check = True, capture_output = True, text = True).stdout
+    timings: Dict[str, float] = json.loads(output.splitlines()[-1])
+    return timings
+
+def main() -> None:
+    """Measures the startup with a cold and a warm cache and prints the medians."""
+
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument("--runs", type = int, default = 5)
+    parser.add_argument("--json", action = "store_true", help = "Print the results as JSON.")
+    args = parser.parse_args()
+
+    results: Dict[str, List[Dict[str, float]]] = { "cold cache": [], "warm cache": [] }
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory() as template_cache_dir:
+            results["cold cache"].append(measure(template_cache_dir))
+            results["warm cache"].append(measure(template_cache_dir))
+
+    medians = {
+        name: { key: statistics.median(run[key] for run in runs) for key in runs[0] }
+        for name, runs in results.items()
+    }
+    if args.json:
+        print(json.dumps(medians, indent = 2))
+        return
+    print("Medians of {} runs:".format(args.runs))
+    print("{:<12} {:>11} {:>20} {:>10}".format("", "import (ms)", "first response (ms)",
+                                               "total (ms)"))
+    for name, timings in medians.items():
+        print("{:<12} {import_ms:>11.1f} {first_response_ms:>20.1f} {total_ms:>10.1f}".format(
+            name, **timings))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Measures the time SQLAlchemy spends on each execution of a statement,
+executing the statement objects of forum.statements, and their SQL as
+plain strings (as ForumDatabase used to), against executing the compiled
+SQL straight with psycopg2. The difference to the latter is the overhead.
+
+The statements are the ones every page view executes, with parameters
+picked from the database, so it should have some users and posts in it."""
+
+import argparse
+import json
+import statistics
+import time
+from typing import Any, Callable, Dict, List, Tuple
+from sqlalchemy.sql.elements import TextClause
+from forum import app, database, statements
+
+def pick_parameters() -> List[Tuple[str, TextClause, Dict[str, Any]]]:
+    """Returns the measured statements with parameters for them."""
+
+    # The database is only None if the server couldn't start.
+    assert database is not None
+    session = database.database.session
+    user_id, board_id, topic_id = session.execute(
+        "select author_user_id, parent_board_id, topic_id from topics "
+        "where first_post_id is not null order by topic_id limit 1").first()
+    board_ids = list(database.get_board_access(user_id))
+    first_time, last_time, _ = session.execute(statements.GET_TOPIC_POST_TIMES,
+                                               { "topic_id": topic_id }).first()
+    return [
+        ("user context", statements.GET_USER_CONTEXT, { "user_id": user_id }),
+        ("boards", statements.GET_BOARDS, { "board_ids": board_ids }),
+        ("topics", statements.GET_TOPICS, { "board_id": board_id, "limit": 50 }),
+        ("posts", statements.GET_POSTS, { "topic_id": topic_id, "limit": 25,
+                                          "first_time": first_time, "last_time": last_time }),
+        ("topic version", statements.GET_TOPIC_VERSION, { "topic_id": topic_id }),
+    ]
+
+def time_per_call(call: Callable[[], Any], calls: int) -> float:
+    """Returns the average time of the call in microseconds, after warming up."""
+
+    for _ in range(calls // 10):
+        call()
+    start = time.perf_counter()
+    for _ in range(calls):
+        call()
+    return (time.perf_counter() - start) / calls * 1000000
+
+def measure(name: str, statement: TextClause, parameters: Dict[str, Any],
+            calls: int, rounds: int) -> Dict[str, Any]:
+    """Measures the statement executed in each way, and returns the medians
+    of the rounds."""
+    # pylint: disable = R0914
+
+    assert database is not None
+    session = database.database.session
+    compiled = statement.compile(dialect = database.database.engine.dialect)
+    cursor = session.connection().connection.cursor()
+    raw_parameters = compiled.construct_params(parameters)
+    def execute_raw() -> None:
+        cursor.execute(str(compiled), raw_parameters)
+        cursor.fetchall()
+
+    sql = str(statement)
+    variants: Dict[str, Callable[[], Any]] = {
+        "psycopg2": execute_raw,
+        "string": lambda: session.execute(sql, parameters).fetchall(),
+        "statement": lambda: session.execute(statement, parameters).fetchall(),
+    }
+    # The variants take turns, so that a slow moment doesn't only hit one.
+    times: Dict[str, List[float]] = { variant: [] for variant in variants }
+    for _ in range(rounds):
+        for variant, call in variants.items():
+            times[variant].append(time_per_call(call, calls))
+    medians = { variant: statistics.median(runs) for variant, runs in times.items() }
+    return {
+        "statement": name,
+        "psycopg2_us": medians["psycopg2"],
+        "string_overhead_us": medians["string"] - medians["psycopg2"],
+        "statement_overhead_us": medians["statement"] - medians["psycopg2"],
+    }
+
+def main() -> None:
+    """Measures the statements and prints the overheads."""
+
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument("--calls", type = int, default = 1000, help = "Calls per round.")
+    parser.add_argument("--rounds", type = int, default = 5)
+    parser.add_argument("--json", action = "store_true", help = "Print the results as JSON.")
+    args = parser.parse_args()
+
+    assert database is not None
+    with app.app_context():
+        results = [measure(name, statement, parameters, args.calls, args.rounds)
+                   for name, statement, parameters in pick_parameters()]
+        database.database.session.rollback()
+
+    if args.json:
+        print(json.dumps(results, indent = 2))
+        return
+    print("Microseconds per call, overhead on top of psycopg2, medians of {} rounds:".format(
+        args.rounds))
+    print("{:<14} {:>9} {:>16} {:>19}".format("", "psycopg2", "string overhead",
+                                             "statement overhead"))
+    for result in results:
+        print("{statement:<14} {psycopg2_us:>9.1f} {string_overhead_us:>16.1f} "
+              "{statement_overhead_us:>19.1f}".format(**result))
+
+if __name__ == "__main__":
+    main()
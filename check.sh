@@ -1,3 +1,3 @@
 #!/bin/sh
-mypy forum --strict
-pylint forum
+mypy forum benchmarks tests --strict
+pylint forum benchmarks tests
@@ -5,6 +5,7 @@ from os import getenv
 from flask import Flask
 import forum.database
 import forum.routes
+import forum.commands
 
 app = Flask(__name__)
 app.secret_key = getenv("SECRET_KEY")
@@ -17,3 +18,4 @@ admin = getenv("ADMIN_USERNAME")
 if admin is not None and len(admin) > 0:
     database.set_admin(admin)
 forum.routes.setup(app, database)
+forum.commands.setup(app, database)
@@ -0,0 +1,165 @@
+"""Maintenance commands, run with `flask <command>` like the server itself."""
+
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from os import cpu_count
+from typing import Optional, Deque, List
+import click
+from flask import Flask
+from forum import migrations
+from forum.database import ForumDatabase
+from forum.rendering import render_posts, RenderedPost
+from forum.validation import build_common_passwords, COMMON_PASSWORDS_SORTED
+
+def setup(app: Flask, database: ForumDatabase) -> None: # pylint: disable = R0915
+    """Registers the maintenance commands to the Flask command line interface."""
+
+    @app.cli.command("migrate")
+    def migrate() -> None:
+        """Applies any pending database migrations."""
+        if not migrations.run(app, database.database):
+            raise click.ClickException("Migrating the database failed.")
+        click.echo("Database is at version {}.".format(migrations.get_latest_version()))
+
+    @app.cli.command("check-board-stats")
+    @click.option("--rebuild", is_flag = True,
+                  help = "Recompute the statistics if they're inconsistent.")
+    def check_board_stats(rebuild: bool) -> None:
+        """Checks that the maintained board statistics match the posts."""
+        board_ids = database.check_board_stats()
+        if len(board_ids) == 0:
+            click.echo("Board statistics are consistent.")
+            return
+        click.echo("Inconsistent statistics for boards: {}".format(
+            ", ".join(str(board_id) for board_id in board_ids)))
+        if not rebuild:
+            raise click.ClickException("Run with --rebuild to fix the statistics.")
+        database.rebuild_board_stats()
+        click.echo("Board statistics rebuilt.")
+
+    @app.cli.command("backfill-search-vectors")
+    @click.option("--batch-size", default = 1000, show_default = True,
+                  help = "Posts updated per transaction.")
+    @click.option("--after-post-id", default = 0, show_default = True,
+                  help = "Continue from where an interrupted run left off.")
+    def backfill_search_vectors(batch_size: int, after_post_id: int) -> None:
+        """Computes the search vectors of existing posts."""
+        last_post_id: Optional[int] = after_post_id
+        while last_post_id is not None:
+            after_post_id = last_post_id
+            last_post_id = database.backfill_search_vectors(after_post_id, batch_size)
+            if last_post_id is not None:
+                click.echo("Updated posts up to id {}.".format(last_post_id))
+        click.echo("Search vectors are up to date.")
+
+    @app.cli.command("build-common-passwords")
+    def build_common_passwords_file() -> None:
+        """Builds the sorted common password list searched at registration."""
+        data = build_common_passwords()
+        click.echo("Wrote {} passwords into {}.".format(data.count(b"\n"), COMMON_PASSWORDS_SORTED))
+
+    @app.cli.command("rerender-posts")
+    @click.option("--batch-size", default = 500, show_default = True,
+                  help = "Posts rendered by a worker and updated per transaction.")
+    @click.option("--processes", type = int, default = None,
+                  help = "Worker processes to render with. Defaults to the amount of CPUs.")
+    @click.option("--after-post-id", default = 0, show_default = True,
+                  help = "Continue from where an interrupted run left off.")
+    def rerender_posts(batch_size: int, processes: Optional[int], after_post_id: int) -> None:
+        """Re-renders the HTML of existing posts from their original markdown,
+        e.g. after the markdown renderer or the sanitization has changed."""
+        processes = processes or cpu_count() or 1
+        totals = { "posts": 0, "changed": 0, "invalid": 0 }
+
+        def store(rendered: List[RenderedPost]) -> None:
+            changed = database.store_rendered_posts(rendered)
+            invalid = [post[0] for post in rendered if post[3] is None]
+            totals["posts"] += len(rendered)
+            totals["changed"] += changed
+            totals["invalid"] += len(invalid)
+            click.echo("Rendered posts up to id {} ({} posts, {} changed).".format(
+                rendered[-1][0], totals["posts"], totals["changed"]))
+            if len(invalid) > 0:
+                click.echo("Left as they were, as they no longer render into valid posts: "
+                           "{}".format(", ".join(str(post_id) for post_id in invalid)))
+
+        # The workers are forked, so they don't have to set the app up
+        # again. Batches are written in order, so the last reported post id
+        # is always safe to continue from, and only a few batches are
+        # queued at a time, so the posts aren't all read into memory.
+        pending: Deque[Future[List[RenderedPost]]] = deque()
+        with ProcessPoolExecutor(processes, multiprocessing.get_context("fork")) as executor:
+            for posts in database.stream_post_sources(after_post_id, batch_size):
+                pending.append(executor.submit(render_posts, posts))
+                if len(pending) >= processes * 2:
+                    store(pending.popleft().result())
+            while len(pending) > 0:
+                store(pending.popleft().result())
+        click.echo("Re-rendered {} posts, of which {} changed and {} were invalid.".format(
+            totals["posts"], totals["changed"], totals["invalid"]))
+
+    def require_partitions() -> None:
+        if not database.are_posts_partitioned():
+            raise click.ClickException("The posts aren't partitioned, "
+                                       "see `flask partition-posts`.")
+
+    @app.cli.command("partition-posts")
+    def partition_posts() -> None:
+        """Moves the posts into a table partitioned by month, so that old
+        months can be archived. Copies every post, which takes a while on a
+        large forum. The forum should be restarted afterwards."""
+        if database.are_posts_partitioned():
+            raise click.ClickException("The posts are already partitioned.")
+        database.partition_posts()
+        click.echo("Partitioned the posts into {} partitions.".format(
+            len(database.get_post_partitions())))
+
+    @app.cli.command("create-post-partitions")
+    @click.option("--months-ahead", default = 3, show_default = True,
+                  help = "Create the partitions up to this many months from now.")
+    def create_post_partitions(months_ahead: int) -> None:
+        """Creates the monthly partitions for upcoming posts. Posts written
+        in months without a partition go to a default partition, which can't
+        be archived, so this should be run e.g. monthly."""
+        require_partitions()
+        now = datetime.now(timezone.utc)
+        created = database.create_post_partitions(now, now + timedelta(days = 31 * months_ahead))
+        click.echo("Created {} partitions.".format(created))
+
+    @app.cli.command("archive-posts")
+    @click.option("--before", type = click.DateTime(["%Y-%m"]), required = True,
+                  help = "Archive the months before this month (YYYY-MM).")
+    def archive_posts(before: datetime) -> None:
+        """Detaches the partitions of old posts and compresses them into
+        archive tables. The archived posts aren't shown on the forum."""
+        require_partitions()
+        before = before.replace(tzinfo = timezone.utc)
+        total_size, total_archived_size = 0, 0
+        for name, _, detached in database.get_post_partitions():
+            if not name.startswith("posts_") or name == "posts_default":
+                continue
+            month = datetime.strptime(name, "posts_%Y_%m").replace(tzinfo = timezone.utc)
+            if month >= before:
+                continue
+            sizes = database.archive_post_partition(month)
+            if sizes is None:
+                continue
+            size, archived_size = sizes
+            total_size += size
+            total_archived_size += archived_size
+            click.echo("Archived {}{}: {:.1f} MB, archived {:.1f} MB.".format(
+                name, " (already detached)" if detached else "",
+                size / 1e6, archived_size / 1e6))
+        click.echo("Archived {:.1f} MB of posts into {:.1f} MB.".format(
+            total_size / 1e6, total_archived_size / 1e6))
+
+    @app.cli.command("restore-posts")
+    @click.argument("month", type = click.DateTime(["%Y-%m"]))
+    def restore_posts(month: datetime) -> None:
+        """Attaches the archived posts of the month (YYYY-MM) back."""
+        require_partitions()
+        if not database.restore_post_partition(month.replace(tzinfo = timezone.utc)):
+            raise click.ClickException("There are no archived posts from {:%Y-%m}.".format(month))
+        click.echo("Restored the posts from {:%Y-%m}.".format(month))
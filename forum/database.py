@@ -1,41 +1,111 @@
 """Database access and maintenance functionality."""
 
-from typing import Any, Optional, Callable, cast, List, Dict, Set
+from typing import Any, Optional, List, Dict, Tuple, NamedTuple, FrozenSet, Iterable, \
+    Iterator
 from os import getenv
-from datetime import datetime
-import secrets
+from datetime import datetime, timedelta, timezone
 from flask_sqlalchemy import SQLAlchemy # type: ignore
 from flask import Flask
-from werkzeug.security import generate_password_hash, check_password_hash
-from mistletoe import HTMLRenderer, Document # type: ignore
-import bleach
-from forum.validation import is_valid_title, is_valid_post_content
-from forum import migrations
-
-class ForumDatabase: # pylint: disable = R0904
+from markupsafe import escape
+from sqlalchemy.exc import OperationalError
+from psycopg2.errors import QueryCanceled # pylint: disable = E0611
+from forum.passwords import PasswordHasher, PasswordHasherBusy
+from forum.rendering import render_post, PostSource, RenderedPost
+from forum.pool import engine_options, MeasuredQueuePool, MeasuredNullPool
+from forum.replicas import Replicas
+from forum.sessions import SessionGenerations
+from forum import migrations, statements
+from forum.statements import SEARCH_VECTOR_COLUMNS
+
+# Keyset pagination keys. Topics are listed by (sticky, last_post_time,
+# topic_id) descending, posts by (creation_time, post_id) ascending.
+TopicKey = Tuple[bool, datetime, int]
+PostKey = Tuple[datetime, int]
+# Search results are listed by (rank, post_id) descending.
+SearchKey = Tuple[float, int]
+
+# The version of a page's contents, which changes whenever they do, and
+# the time they last changed, for answering conditional requests.
+PageVersion = Tuple[int, Optional[datetime]]
+
+# Search snippets mark the matching words with these characters, which
+# are replaced with <mark> tags after the rest of the snippet is escaped.
+SNIPPET_START = "\x02"
+SNIPPET_STOP = "\x03"
+SNIPPET_OPTIONS = ("StartSel={}, StopSel={}, MaxWords=35, MinWords=15, "
+                   "MaxFragments=2, FragmentDelimiter=\" … \"").format(SNIPPET_START, SNIPPET_STOP)
+
+def _month_start(time: datetime) -> datetime:
+    """Returns the start of the time's month in UTC, like the posts'
+    partitions start."""
+    return time.astimezone(timezone.utc).replace(day = 1, hour = 0, minute = 0, second = 0,
+                                                 microsecond = 0)
+
+def _add_months(month: datetime, months: int) -> datetime:
+    """Returns the start of the month the given amount of months after the
+    start of a month."""
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year = index // 12, month = index % 12 + 1)
+
+class UserContext(NamedTuple):
+    """The logged in user's information needed by most requests."""
+    user_id: int
+    username: str
+    admin_scopes: Optional[Dict[str, bool]]
+    board_access: FrozenSet[int]
+    acl_version: int
+
+class ForumDatabase: # pylint: disable = R0902, R0904
     """Holder of database access, provider of persistent data."""
 
-    def __init__(self, database: Any) -> None:
+    def __init__(self, database: Any, search_timeout: int = 5000,
+                 password_hasher: Optional[PasswordHasher] = None,
+                 replicas: Optional[Replicas] = None,
+                 session_cache_seconds: float = 10) -> None:
         self.database = database
-        self.markdown_renderer = HTMLRenderer()
+        self.search_timeout = search_timeout
+        self.password_hasher = password_hasher or PasswordHasher()
+        self.replicas = replicas
+        # Accessible board ids per set of role ids, valid as long as the
+        # board_acl_version in the database is board_acl_cache_version.
+        self.board_acl_cache: Dict[FrozenSet[int], FrozenSet[int]] = {}
+        self.board_acl_cache_version = -1
+        self.board_acl_cache_stats = { "hits": 0, "misses": 0, "invalidations": 0 }
+        self.session_generations = SessionGenerations(session_cache_seconds)
+        # Whether posts are partitioned, looked up on first use.
+        self.posts_partitioned: Optional[bool] = None
+
+    def reader(self) -> Any:
+        """Returns the session for the methods which only read data shown on
+        the pages: the current request's replica session, if it reads from
+        a replica, otherwise the primary's. Logins, sessions, CSRF tokens
+        and board access are always checked against the primary."""
+
+        if self.replicas is not None:
+            replica_session = self.replicas.get_session()
+            if replica_session is not None:
+                return replica_session
+        return self.database.session
+
+    def get_write_lsn(self) -> str:
+        """Returns the primary's current position in its write-ahead log,
+        which replicas have to reach to have everything written so far."""
+
+        lsn: str = self.database.session.execute(statements.GET_WAL_LSN).scalar()
+        return lsn
 
     def set_admin(self, username: str) -> None:
         """Makes the given user an administrator. Used to set admin rights via
         the ADMIN_USERNAME environment variable."""
-        sql = ("insert into user_roles (role_id, user_id) "
-               "values (1, (select user_id from users where username = :username)) "
-               "on conflict do nothing")
-        self.database.session.execute(sql, { "username": username })
+        self.database.session.execute(statements.SET_ADMIN, { "username": username })
         self.database.session.commit()
 
     def get_admin_scopes(self, user_id: int) -> Optional[Dict[str, bool]]:
         """Returns administration scopes for the given user."""
 
-        sql = ("select bool_or(can_create_boards), "
-               "bool_or(can_create_roles), "
-               "bool_or(can_assign_roles) "
-               "from user_roles join roles using (role_id) where user_id = :user_id")
-        result = self.database.session.execute(sql, { "user_id": user_id }).first()
+        result = self.database.session.execute(statements.GET_ADMIN_SCOPES, {
+            "user_id": user_id
+        }).first()
         if result is None or True not in result:
             return None
         scopes = {
@@ -45,148 +115,191 @@ class ForumDatabase: # pylint: disable = R0904
         }
         return scopes
 
-    def logged_in(self, user_id: Optional[int]) -> bool:
-        """Returns true if the given user id is not None, and is an actual user's user id."""
-        if user_id is None:
-            return False
-        sql = "select * from users where user_id = :user_id"
-        result = self.database.session.execute(sql, { "user_id": user_id }).first()
-        return result is not None
+    def get_user_context(self, user_id: int) -> Optional[UserContext]:
+        """Returns the username, admin scopes and accessible boards of the
+        user in one query, or None if there's no such user."""
+
+        result = self.database.session.execute(statements.GET_USER_CONTEXT, {
+            "user_id": user_id
+        }).first()
+        if result is None:
+            return None
+        username, can_create_boards, can_create_roles, can_assign_roles, \
+            role_ids, acl_version = result
+        admin_scopes = None
+        if True in (can_create_boards, can_create_roles, can_assign_roles):
+            admin_scopes = {
+                "can_create_boards": can_create_boards,
+                "can_create_roles": can_create_roles,
+                "can_assign_roles": can_assign_roles,
+            }
+        board_access = self.get_role_board_access(frozenset(role_ids), acl_version)
+        return UserContext(user_id, username, admin_scopes, board_access, acl_version)
+
+    def get_session_generation(self, user_id: int, at_least: int = 0) -> Optional[int]:
+        """Returns the user's current session generation, or None if there's
+        no such user. Sessions started in earlier generations have been
+        revoked. The generation is cached for session_cache_seconds, unless
+        it's older than at_least, the generation of the session at hand."""
+
+        def load() -> Optional[int]:
+            generation: Optional[int] = self.database.session.execute(
+                statements.GET_SESSION_GENERATION, { "user_id": user_id }).scalar()
+            return generation
+        return self.session_generations.get(user_id, load, at_least)
 
     def register(self, username: str, password: str) -> bool:
         """Creates a new user with the given username and password,
         if the username has not been taken. If it has, does nothing and returns False."""
 
-        sql = "select * from users where username = :username"
-        result = self.database.session.execute(sql, { "username": username }).first()
-        if result is not None:
-            return False
-
-        password_hash = generate_password_hash(password)
-        sql = ("insert into users "
-               "(username, password_hash, creation_time, password_set_time, latest_login_time) "
-               "values (:username, :password_hash, 'now', 'now', null)")
-        self.database.session.execute(sql, { "username": username, "password_hash": password_hash })
+        password_hash = self.password_hasher.hash(password)
+        user_id = self.database.session.execute(statements.REGISTER, {
+            "username": username,
+            "password_hash": password_hash
+        }).scalar()
         self.database.session.commit()
 
-        return True
+        return user_id is not None
 
-    def login(self, username: str, password: str) -> Optional[int]:
-        """Returns the user id for a user with a matching username and password.
-        If no such combination is found, None is returned."""
+    def login(self, username: str, password: str) -> Optional[Tuple[int, int]]:
+        """Returns the user id and current session generation for a user with a
+        matching username and password. If no such combination is found, None
+        is returned."""
 
-        sql = "select user_id, password_hash from users where username = :username"
-        result = self.database.session.execute(sql, { "username": username }).first()
+        result = self.database.session.execute(statements.GET_PASSWORD_HASH, {
+            "username": username
+        }).first()
         if result is None:
             return None
 
         user_id, password_hash = result
         if password_hash is None: # Locked account
             return None
-        if cast(Callable[[str, str], bool], check_password_hash)(password_hash, password):
-            csrf_token = secrets.token_urlsafe()
-            sql = ("update users set latest_login_time = 'now', csrf_token = :csrf_token "
-                   "where user_id = :user_id")
-            self.database.session.execute(sql, { "user_id": user_id, "csrf_token": csrf_token })
+        if self.password_hasher.verify(password_hash, password):
+            generation: int = self.database.session.execute(statements.LOGIN, {
+                "user_id": user_id
+            }).scalar()
+            if self.password_hasher.needs_rehash(password_hash):
+                # The password is at hand only now, so outdated hashes are
+                # upgraded here. If the hashers are busy, it can wait until
+                # the next login.
+                try:
+                    self.database.session.execute(statements.SET_PASSWORD_HASH, {
+                        "user_id": user_id,
+                        "password_hash": self.password_hasher.hash(password)
+                    })
+                except PasswordHasherBusy:
+                    pass
             self.database.session.commit()
-            return int(user_id) # reassuring the type system that user_id is an int
+            self.session_generations.set(user_id, generation)
+            return int(user_id), generation
         return None
 
-    def logout(self, user_id: str) -> None:
-        """Clears any session-specific database entries related to the user."""
+    def logout(self, user_id: int) -> None:
+        """Revokes all of the user's sessions by bumping their session
+        generation. Other workers notice it when their cached generation
+        expires."""
 
-        sql = "update users set csrf_token = null where user_id = :user_id"
-        self.database.session.execute(sql, { "user_id": user_id })
+        generation: int = self.database.session.execute(statements.LOGOUT, {
+            "user_id": user_id
+        }).scalar()
         self.database.session.commit()
+        self.session_generations.set(user_id, generation)
 
-    def validate_csrf_token(self, user_id: int, csrf_token: str) -> bool:
-        """Returns true if the user session has a matching CSRF-prevention token.
-
-        Implemented according to the Synchronizer Token Pattern in the OWASP cheatsheet."""
-
-        sql = "select count(*) from users where user_id = :user_id and csrf_token = :csrf_token"
-        variables = { "user_id": user_id, "csrf_token": csrf_token }
-        matches: int = self.database.session.execute(sql, variables).scalar()
-        return matches == 1
+    def delete_post(self, post_key: PostKey, user_id: int) -> None:
+        """Deletes the post with the given key (creation time and id) if
+        the user owns it."""
 
-    def get_csrf_token(self, user_id: int) -> Optional[str]:
-        """Returns the synchronizer token to be served to the user, to prevent CSRF attacks.
-
-        Implemented according to the Synchronizer Token Pattern in the OWASP cheatsheet."""
-
-        sql = "select csrf_token from users where user_id = :user_id"
-        token: Optional[str] = self.database.session.execute(sql, { "user_id": user_id }).scalar()
-        return token
-
-    def delete_post(self, post_id: int, user_id: int) -> None:
-        """Deletes the post if the user owns it."""
-
-        sql = ("delete from posts where author_user_id = :user_id and post_id = :post_id "
-               "returning parent_topic_id")
-        result = self.database.session.execute(sql, { "user_id": user_id, "post_id": post_id })
+        creation_time, post_id = post_key
+        session = self.database.session
+        result = session.execute(statements.DELETE_POST, {
+            "user_id": user_id,
+            "post_id": post_id,
+            "creation_time": creation_time
+        })
         topic_id = result.scalar()
-        sql = "select count(*) = 0 from posts where parent_topic_id = :topic_id"
-        emptied_topic = self.database.session.execute(sql, { "topic_id": topic_id }).scalar()
+        if topic_id is None:
+            return
+        variables = { "topic_id": topic_id }
+        board_id = session.execute(statements.GET_TOPIC_BOARD_ID, variables).scalar()
+        emptied_topic = session.execute(statements.IS_TOPIC_EMPTY, variables).scalar()
         if emptied_topic:
-            sql = "delete from topics where topic_id = :topic_id"
-            self.database.session.execute(sql, { "topic_id": topic_id })
+            session.execute(statements.DELETE_TOPIC, variables)
+        else:
+            first_post_id, last_post_id = session.execute(statements.REMOVE_TOPIC_REPLY,
+                                                          variables).first()
+            if post_id in (first_post_id, last_post_id):
+                self.refresh_topic_summary(topic_id)
+
+        variables = { "board_id": board_id, "deleted_topics": 1 if emptied_topic else 0 }
+        last_post_id = session.execute(statements.REMOVE_BOARD_POST, variables).scalar()
+        if last_post_id == post_id:
+            self.refresh_board_last_post(board_id)
         self.database.session.commit()
 
-    def edit_post(self, post_id: int, user_id: int, title: str, content: str) -> bool:
-        """Edits the topic with the new title and content."""
+    def edit_post(self, post_key: PostKey, user_id: int, title: str, content: str) -> bool:
+        """Edits the post with the given key (creation time and id) with the
+        new title and content."""
 
-        sql = ("select count(*) = 1 from posts "
-               "where post_id = :post_id and author_user_id = :user_id")
-        result = self.database.session.execute(sql, { "post_id": post_id, "user_id": user_id })
+        creation_time, post_id = post_key
+        result = self.database.session.execute(statements.IS_POST_OWNED, {
+            "post_id": post_id,
+            "creation_time": creation_time,
+            "user_id": user_id
+        })
         post_exists = result.scalar()
         if not post_exists:
             return False
 
         title_original = title
-        title = bleach.clean(title.strip())
         content_original = content
-        content = bleach.clean(content.strip()).replace("&gt;", ">")
-        content = self.markdown_renderer.render(Document(content)).strip()
-        if not is_valid_title(title) or not is_valid_post_content(content):
+        rendered = render_post(title, content)
+        if rendered is None:
             return False
+        title, content = rendered
 
-        sql = ("update posts set title = :title, title_original = :title_original, "
-               "content = :content, content_original = :content_original, edit_time = 'now' "
-               "where author_user_id = :user_id and post_id = :post_id")
         variables = {
             "user_id": user_id,
             "post_id": post_id,
+            "creation_time": creation_time,
             "title": title,
             "title_original": title_original,
             "content": content,
             "content_original": content_original
         }
-        self.database.session.execute(sql, variables)
+        self.database.session.execute(statements.EDIT_POST, variables)
+        board_id = self.database.session.execute(statements.UPDATE_TOPIC_POST_TITLE, {
+            "title": title,
+            "post_id": post_id,
+            "creation_time": creation_time
+        }).scalar()
+        self.database.session.execute(statements.UPDATE_BOARD_POST_TITLE, {
+            "title": title,
+            "post_id": post_id,
+            "board_id": board_id
+        })
         self.database.session.commit()
 
         return True
 
-    def create_post(self, topic_id: int, user_id: int, title: str, content: str) -> Optional[int]:
-        """Creates a new topic in the given topic."""
+    def create_post(self, topic_id: int, user_id: int, title: str,
+                    content: str) -> Optional[PostKey]:
+        """Creates a new post in the given topic, and returns its key
+        (creation time and id)."""
 
-        sql = "select count(*) from topics where topic_id = :topic_id"
-        result = self.database.session.execute(sql, { "topic_id": topic_id }).scalar()
+        result = self.database.session.execute(statements.COUNT_TOPICS, {
+            "topic_id": topic_id
+        }).scalar()
         if result == 0:
             return None
 
         title_original = title
-        title = bleach.clean(title.strip())
         content_original = content
-        content = bleach.clean(content.strip()).replace("&gt;", ">")
-        content = self.markdown_renderer.render(Document(content)).strip()
-        if not is_valid_title(title) or not is_valid_post_content(content):
+        rendered = render_post(title, content)
+        if rendered is None:
             return None
+        title, content = rendered
 
-        sql = ("insert into posts (parent_topic_id, author_user_id, title, title_original, "
-               "content, content_original, creation_time) "
-               "values (:topic_id, :user_id, :title, :title_original, "
-               ":content, :content_original, 'now') "
-               "returning post_id")
         variables = {
             "topic_id": topic_id,
             "user_id": user_id,
@@ -195,26 +308,41 @@ class ForumDatabase: # pylint: disable = R0904
             "content": content,
             "content_original": content_original
         }
-        post_id: int = self.database.session.execute(sql, variables).scalar()
+        post_id, creation_time = self.database.session.execute(statements.CREATE_POST,
+                                                               variables).first()
+
+        self.database.session.execute(statements.ADD_TOPIC_POST, {
+            "post_id": post_id,
+            "user_id": user_id,
+            "topic_id": topic_id,
+            "title": title,
+            "creation_time": creation_time
+        })
+
+        self.database.session.execute(statements.ADD_BOARD_POST, {
+            "post_id": post_id,
+            "topic_id": topic_id,
+            "title": title,
+            "creation_time": creation_time
+        })
         self.database.session.commit()
 
-        return post_id
+        return creation_time, int(post_id)
 
     def create_topic(self, board_id: int, user_id: int, title: str, content: str) -> Optional[int]:
         """Creates a new topic on the board, with the initial post containing
         the given title and content."""
 
-        sql = "select count(*) from boards where board_id = :board_id"
-        result = self.database.session.execute(sql, { "board_id": board_id }).scalar()
+        variables = { "board_id": board_id }
+        result = self.database.session.execute(statements.COUNT_BOARDS, variables).scalar()
         if result == 0:
             return None
 
-        sql = ("insert into topics (parent_board_id, sticky) values (:board_id, FALSE) "
-               "returning topic_id")
-        topic_id: int = self.database.session.execute(sql, { "board_id": board_id }).scalar()
+        topic_id: int = self.database.session.execute(statements.CREATE_TOPIC, variables).scalar()
+        self.database.session.execute(statements.ADD_BOARD_TOPIC, variables)
         # Don't commit yet, as create_post may fail.
-        post_id = self.create_post(topic_id, user_id, title, content)
-        if post_id is None:
+        post_key = self.create_post(topic_id, user_id, title, content)
+        if post_key is None:
             return None
         # This is technically not needed, create_post already
         # committed, but future refactoring may change this.
@@ -224,66 +352,61 @@ class ForumDatabase: # pylint: disable = R0904
     def edit_board(self, board_id: int, title: str, description: str, roles: List[str]) -> None:
         """Updates the board to the new values."""
 
-        sql = "update boards set title = :title, description = :desc where board_id = :board_id"
-        self.database.session.execute(sql, {
+        self.database.session.execute(statements.EDIT_BOARD, {
             "title": title,
             "desc": description,
             "board_id": board_id
         })
-        self.database.session.commit()
 
-        sql = "delete from board_roles where board_id = :board_id"
-        self.database.session.execute(sql, { "board_id": board_id })
-        self.database.session.commit()
+        # The old and new roles are swapped in the same transaction, so the
+        # board is never accessible to everyone in between.
+        self.database.session.execute(statements.DELETE_BOARD_ROLES, { "board_id": board_id })
         if len(roles) > 0:
             board_role_tuples = []
             for role_id in roles:
                 board_role_tuples.append({ "board_id": board_id, "role_id": role_id })
-            sql = "insert into board_roles (board_id, role_id) values (:board_id, :role_id)"
-            self.database.session.execute(sql, board_role_tuples)
-            self.database.session.commit()
+            self.database.session.execute(statements.ADD_BOARD_ROLE, board_role_tuples)
+        self.bump_board_acl_version()
+        self.database.session.commit()
 
     def delete_board(self, board_id: int) -> None:
         """Deletes the board."""
 
-        sql = "update boards set deleted = TRUE where board_id = :board_id"
-        self.database.session.execute(sql, { "board_id": board_id })
+        self.database.session.execute(statements.DELETE_BOARD, { "board_id": board_id })
+        # Deleted boards aren't listed, so they don't need statistics.
+        self.database.session.execute(statements.DELETE_BOARD_STATS, { "board_id": board_id })
+        self.bump_board_acl_version()
         self.database.session.commit()
 
     def create_board(self, title: str, description: str, roles: List[str]) -> int:
         """Creates a new board with the given title, description and roles."""
 
-        sql = ("insert into boards (title, description) values (:title, :description) "
-               "returning board_id")
-        board_id: int = self.database.session.execute(sql, {
+        board_id: int = self.database.session.execute(statements.CREATE_BOARD, {
             "title": title,
             "description": description
         }).scalar()
-        self.database.session.commit()
+        self.database.session.execute(statements.CREATE_BOARD_STATS, { "board_id": board_id })
 
         if len(roles) > 0:
             board_role_tuples = []
             for role_id in roles:
                 board_role_tuples.append({ "board_id": board_id, "role_id": role_id })
-            sql = "insert into board_roles (board_id, role_id) values (:board_id, :role_id)"
-            self.database.session.execute(sql, board_role_tuples)
-            self.database.session.commit()
+            self.database.session.execute(statements.ADD_BOARD_ROLE, board_role_tuples)
+        self.bump_board_acl_version()
+        self.database.session.commit()
 
         return board_id
 
     def create_role(self, title: str, scopes: List[str]) -> int:
         """Creates a new role with the given title and scopes."""
 
-        sql = ("insert into roles "
-               "(role_name, can_create_boards, can_create_roles, can_assign_roles) values "
-               "(:title, :can_create_boards, :can_create_roles, :can_assign_roles) "
-               "returning role_id")
-        role_id: int = self.database.session.execute(sql, {
+        role_id: int = self.database.session.execute(statements.CREATE_ROLE, {
             "title": title,
             "can_create_boards": "can_create_boards" in scopes,
             "can_create_roles": "can_create_roles" in scopes,
             "can_assign_roles": "can_assign_roles" in scopes
         }).scalar()
+        self.bump_board_acl_version()
         self.database.session.commit()
         return role_id
 
@@ -294,142 +417,443 @@ class ForumDatabase: # pylint: disable = R0904
         for role_id in roles:
             for user_id in users:
                 role_user_tuples.append({ "role_id": role_id, "user_id": user_id })
-        sql = "insert into user_roles (role_id, user_id) values (:role_id, :user_id)"
-        self.database.session.execute(sql, role_user_tuples)
+        self.database.session.execute(statements.ASSIGN_ROLE, role_user_tuples)
+        self.bump_board_acl_version()
         self.database.session.commit()
 
-    def get_board_access(self, user_id: int) -> Set[int]:
-        """Returns a set containing all ids of the boards the user can access."""
+    def bump_board_acl_version(self) -> None:
+        """Marks every worker's cached board access lists as outdated. Should
+        be called in the transaction that changes the access rules. Does
+        not commit."""
 
-        sql = "select role_id from user_roles where user_id = :user_id"
-        result = self.database.session.execute(sql, { "user_id": user_id }).fetchall()
-        user_roles = set()
-        for row in result:
-            user_roles.add(int(row[0]))
+        self.database.session.execute(statements.BUMP_BOARD_ACL_VERSION)
 
-        sql = ("select board_id, role_id from boards left join board_roles using (board_id) "
-               "where deleted = FALSE")
-        result = self.database.session.execute(sql).fetchall()
-        board_roles: Set[int] = set()
-        for row in result:
-            if row[1] is None or int(row[1]) in user_roles:
-                board_roles.add(int(row[0]))
-        return board_roles
+    def get_board_access(self, user_id: int) -> FrozenSet[int]:
+        """Returns a set containing all ids of the boards the user can access."""
+
+        role_ids, acl_version = self.database.session.execute(statements.GET_USER_ROLES, {
+            "user_id": user_id
+        }).first()
+        return self.get_role_board_access(frozenset(role_ids), acl_version)
+
+    def get_role_board_access(self, role_ids: FrozenSet[int],
+                              acl_version: int) -> FrozenSet[int]:
+        """Returns the ids of the boards accessible with the given roles. The
+        result is cached until the board_acl_version changes from acl_version."""
+
+        if acl_version != self.board_acl_cache_version:
+            if len(self.board_acl_cache) > 0:
+                self.board_acl_cache_stats["invalidations"] += 1
+            self.board_acl_cache = {}
+            self.board_acl_cache_version = acl_version
+        cached_access = self.board_acl_cache.get(role_ids)
+        if cached_access is not None:
+            self.board_acl_cache_stats["hits"] += 1
+            return cached_access
+        self.board_acl_cache_stats["misses"] += 1
+
+        result = self.database.session.execute(statements.GET_ROLE_BOARD_ACCESS, {
+            "role_ids": list(role_ids)
+        }).fetchall()
+        board_access = frozenset(int(row[0]) for row in result)
+        self.board_acl_cache[role_ids] = board_access
+        return board_access
+
+    def get_board_acl_cache_stats(self) -> Dict[str, Any]:
+        """Returns this worker's board access cache counters, for monitoring."""
+
+        stats: Dict[str, Any] = dict(self.board_acl_cache_stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups > 0 else None
+        stats["cached_role_sets"] = len(self.board_acl_cache)
+        stats["version"] = self.board_acl_cache_version
+        return stats
+
+    def get_pool_stats(self) -> Dict[str, Any]:
+        """Returns this worker's connection pool counters, for monitoring."""
+
+        pool = self.database.engine.pool
+        if not isinstance(pool, (MeasuredQueuePool, MeasuredNullPool)):
+            return {}
+        stats: Dict[str, Any] = pool.get_stats()
+        return stats
 
     def get_board_role_ids(self, board_id: int) -> List[int]:
         """Returns the role ids that are allowed to use the board, or an empty
         list if everyone is."""
 
-        sql = "select role_id from board_roles where board_id = :board_id"
-        result = self.database.session.execute(sql, { "board_id": board_id }).fetchall()
+        result = self.reader().execute(statements.GET_BOARD_ROLE_IDS, {
+            "board_id": board_id
+        }).fetchall()
         role_ids: List[int] = []
         for row in result:
             role_ids.append(int(row[0]))
         return role_ids
 
-    def get_boards(self) -> List[Any]:
-        """Returns a list of boards with the relevant information for index.html's listing."""
-
-        sql = "select board_id, title, description from boards order by title"
-        results = self.database.session.execute(sql).fetchall()
-        boards = []
-        for result in results:
-            board_id, title, description = result
-            sql = "select count(*) from topics where parent_board_id = :board_id"
-            topics = self.database.session.execute(sql, { "board_id": board_id }).scalar()
-            sql = ("select count(*) from posts "
-                   "join topics on parent_topic_id = topic_id "
-                   "where parent_board_id = :board_id")
-            posts = self.database.session.execute(sql, { "board_id": board_id }).scalar()
-            sql = ("select parent_topic_id, post_id, title, creation_time from posts "
-                   "join topics on parent_topic_id = topic_id "
-                   "where parent_board_id = :board_id "
-                   "order by creation_time desc limit 1")
-            result = self.database.session.execute(sql, { "board_id": board_id }).first()
-            last_topic_id, last_post_id, last_title, last_time = (None, None, None, None)
-            if result is not None:
-                last_topic_id, last_post_id, last_title, last_time = result
-            boards.append((board_id, title, description, topics, posts, last_topic_id,
-                           last_post_id, last_title, last_time))
+    def get_boards(self, board_ids: FrozenSet[int]) -> List[Any]:
+        """Returns a list of the given boards, the ones the user can access,
+        with the relevant information for index.html's listing."""
+
+        boards: List[Any] = self.reader().execute(statements.GET_BOARDS, {
+            "board_ids": list(board_ids)
+        }).fetchall()
         return boards
 
-    def get_topics(self, board_id: int) -> List[Any]:
-        """Returns a list of topics for the given board."""
-
-        sql = "select topic_id from topics where parent_board_id = :board_id"
-        results = self.database.session.execute(sql, { "board_id": board_id }).fetchall()
-        topics: List[Any] = []
-        for result in results:
-            topic_id = result[0]
-            sql = ("select title, author_user_id from posts "
-                   "where parent_topic_id = :topic_id "
-                   "order by creation_time asc limit 1")
-            result = self.database.session.execute(sql, { "topic_id": topic_id }).first()
-            if result is None:
-                # This shouldn't happen anymore, but old versions of
-                # tsoha-forum could get the database in this state.
-                continue
-            title, author_user_id = result
-            sql = ("select post_id, title, creation_time from posts "
-                   "where parent_topic_id = :topic_id "
-                   "order by creation_time desc limit 1")
-            result = self.database.session.execute(sql, { "topic_id": topic_id }).first()
-            last_post_id, last_title, last_time = (None, None, None)
-            if result is not None:
-                last_post_id, last_title, last_time = result
-            sql = "select username from users where user_id = :user_id"
-            author = self.database.session.execute(sql, { "user_id": author_user_id }).scalar()
-            sql = "select count(*) - 1 from posts where parent_topic_id = :topic_id"
-            replies = self.database.session.execute(sql, { "topic_id": topic_id }).scalar()
-            topics.append((topic_id, title, author, replies, last_post_id, last_title, last_time))
-        topics.sort(key = lambda row: cast(datetime, row[4]), reverse = True)
+    def refresh_board_last_post(self, board_id: int) -> None:
+        """Looks up the latest post of the board from its topics' summaries
+        and stores it in board_stats. The summaries of the affected topics
+        should be up to date. Does not commit."""
+
+        self.database.session.execute(statements.REFRESH_BOARD_LAST_POST, { "board_id": board_id })
+
+    def check_board_stats(self) -> List[int]:
+        """Returns the ids of boards whose board_stats row is missing,
+        outdated, or shouldn't exist (because the board is deleted)."""
+
+        result = self.database.session.execute(statements.CHECK_BOARD_STATS).fetchall()
+        return [int(row[0]) for row in result]
+
+    def refresh_board_stats(self, topic_ids: List[int]) -> None:
+        """Recomputes the post counts and latest posts of the boards of the
+        given topics from their topics' summaries, which should be up to
+        date, and commits."""
+
+        result = self.database.session.execute(statements.LOCK_TOPICS_BOARD_STATS, {
+            "topic_ids": topic_ids
+        })
+        board_ids = [int(row[0]) for row in result]
+        self.database.session.execute(statements.REFRESH_BOARD_STATS, { "board_ids": board_ids })
+        self.database.session.commit()
+
+    def rebuild_board_stats(self) -> None:
+        """Recomputes the entire board_stats table from the posts and topics."""
+
+        self.database.session.execute(statements.LOCK_BOARD_STATS)
+        self.database.session.execute(statements.DELETE_ALL_BOARD_STATS)
+        self.database.session.execute(statements.REBUILD_BOARD_STATS)
+        self.database.session.commit()
+
+    def execute_streamed(self, sql: Any, variables: Dict[str, Any]) -> Any:
+        """Executes the query through a server-side cursor, and returns the
+        result, which reads the rows in growing batches as it's iterated
+        over. The first row is read before returning, so the query has
+        run, and raised any errors, by then."""
+
+        return self.reader().execute(sql, variables,
+                                     execution_options = { "stream_results": True })
+
+    def get_topics(self, board_id: int, limit: int, after: Optional[TopicKey] = None,
+                   before: Optional[TopicKey] = None) -> Iterable[Any]:
+        """Returns a page of at most `limit` topics for the given board, sticky
+        topics first, then the most recently active ones. The page starts
+        right after the `after` key, or ends right before the `before` key.
+        Pages starting after a key are read as they're iterated over, pages
+        ending before one are read in reverse, so they're read all at once."""
+
+        variables: Dict[str, Any] = { "board_id": board_id, "limit": limit }
+        sql = statements.GET_TOPICS
+        if after is not None:
+            variables["sticky"], variables["time"], variables["topic_id"] = after
+            sql = statements.GET_TOPICS_AFTER
+        elif before is not None:
+            variables["sticky"], variables["time"], variables["topic_id"] = before
+            sql = statements.GET_TOPICS_BEFORE
+        if before is None:
+            topics: Iterable[Any] = self.execute_streamed(sql, variables)
+        else:
+            topics = self.reader().execute(sql, variables).fetchall()[::-1]
         return topics
 
-    def get_posts(self, topic_id: int, user_id: int) -> List[Any]:
-        """Returns a list of posts for the given topic."""
-        # pylint: disable = R0914
-
-        sql = ("select p.post_id, u.username, p.title, p.title_original, "
-               "p.content, p.content_original, p.creation_time, p.edit_time, p.author_user_id "
-               "from posts as p join users as u on author_user_id = user_id "
-               "where parent_topic_id = :topic_id "
-               "order by p.creation_time asc")
-        results = self.database.session.execute(sql, { "topic_id": topic_id }).fetchall()
-        posts: List[Any] = []
-        for result in results:
-            post_id, username, title, title_original, content, content_original, \
-                creation_time, edit_time, author_user_id = result
-            owned = author_user_id == user_id
-            posts.append((post_id, username, title, title_original, content, content_original,
-                          creation_time, edit_time, owned))
-        return posts
+    def refresh_topic_summary(self, topic_id: int) -> None:
+        """Recomputes the first and last post, and the reply count, stored
+        in the topic's row. Does not commit."""
+
+        self.database.session.execute(statements.REFRESH_TOPIC_SUMMARY, { "topic_id": topic_id })
+
+    def get_posts(self, topic_id: int, user_id: int, limit: int,
+                  after: Optional[PostKey] = None,
+                  before: Optional[PostKey] = None) -> Iterable[Any]:
+        """Returns a page of at most `limit` posts for the given topic, oldest
+        first. The page starts right after the `after` key, or ends right
+        before the `before` key. Read as iterated over, like get_topics."""
+        # pylint: disable = R0913
+
+        times = self.reader().execute(statements.GET_TOPIC_POST_TIMES, {
+            "topic_id": topic_id
+        }).first()
+        if times is None or times[0] is None:
+            return iter([])
+        if before is None:
+            results: Iterable[Any] = self.read_post_windows(topic_id, limit, times, after, True)
+        else:
+            results = list(self.read_post_windows(topic_id, limit, times, before, False))[::-1]
+        def posts() -> Iterator[Any]:
+            for result in results:
+                post_id, username, title, title_original, content, content_original, \
+                    creation_time, edit_time, author_user_id = result
+                owned = author_user_id == user_id
+                yield (post_id, username, title, title_original, content, content_original,
+                       creation_time, edit_time, owned)
+        return posts()
+
+    def read_post_windows(self, topic_id: int, limit: int,
+                          times: Tuple[datetime, datetime, int],
+                          key: Optional[PostKey], ascending: bool) -> Iterator[Any]:
+        """Yields at most `limit` posts of the topic after the key, or before
+        it if not ascending, given the topic's first and last post times and
+        its amount of posts. If the posts are partitioned, they're read a
+        window of months at a time, starting from the key's month, as
+        planning a read of every month of a long-lived topic takes longer
+        than reading a page. The first window is as long as a page's worth
+        of posts would take if they were written evenly, and the next ones
+        double in length."""
+        # pylint: disable = R0913, R0914
+
+        variables: Dict[str, Any] = { "topic_id": topic_id }
+        first_time, last_time, post_count = times
+        if key is not None:
+            start = _month_start(key[0])
+        else:
+            start = _month_start(first_time if ascending else last_time)
+        first_month, last_month = _month_start(first_time), _month_start(last_time)
+        span = (last_month.year - first_month.year) * 12 + last_month.month - first_month.month + 1
+        if self.are_posts_partitioned():
+            months = max(span * limit // max(post_count, 1), 1)
+        else:
+            # Without partitions, there's nothing to plan for each month.
+            months = span
+        while limit > 0:
+            if ascending:
+                end = _add_months(start, months)
+                variables["first_time"] = max(start, first_time)
+                variables["last_time"] = min(end - timedelta(microseconds = 1), last_time)
+            else:
+                end = _add_months(start, 1 - months)
+                variables["first_time"] = max(end, first_time)
+                variables["last_time"] = min(_add_months(start, 1) - timedelta(microseconds = 1),
+                                             last_time)
+            variables["limit"] = limit
+            sql = statements.GET_POSTS
+            if key is not None:
+                variables["time"], variables["post_id"] = key
+                sql = statements.GET_POSTS_AFTER if ascending else statements.GET_POSTS_BEFORE
+            if ascending:
+                results: Iterable[Any] = self.execute_streamed(sql, variables)
+            else:
+                results = self.reader().execute(sql, variables).fetchall()
+            for result in results:
+                key = (result[6], result[0])
+                limit -= 1
+                yield result
+            if (end > last_time) if ascending else (end <= first_time):
+                return
+            start = end if ascending else _add_months(end, -1)
+            months *= 2
+
+    def get_post_creation_time(self, post_id: int) -> Optional[datetime]:
+        """Returns the creation time of the post, for finding the page it's on.
+        This reads every partition of posts, so it's only for when the
+        post's key isn't known."""
+
+        variables = { "post_id": post_id }
+        time: Optional[datetime] = self.reader().execute(
+            statements.GET_POST_CREATION_TIME, variables).scalar()
+        return time
 
     def get_users(self) -> List[Any]:
         """Returns a list of all the user id's and their associated usernames."""
-        sql = "select user_id, username from users"
-        users: List[Any] = self.database.session.execute(sql).fetchall()
+        users: List[Any] = self.reader().execute(statements.GET_USERS).fetchall()
         return users
 
     def get_roles(self) -> List[Any]:
         """Returns a list of all the role id's and their associated names."""
-        sql = "select role_id, role_name from roles"
-        roles: List[Any] = self.database.session.execute(sql).fetchall()
+        roles: List[Any] = self.reader().execute(statements.GET_ROLES).fetchall()
         return roles
 
-    def search_posts(self, dictionary: str, search_string: str) -> List[Any]:
-        """Returns a list of posts related to the given search string."""
-
-        sql = ("select p.post_id, t.topic_id, b.board_id, u.username, "
-               "p.title, p.content, p.creation_time, p.edit_time "
-               "from posts p "
-               "join users u on author_user_id = user_id "
-               "join topics t on parent_topic_id = topic_id "
-               "join boards b on parent_board_id = board_id "
-               "where to_tsvector(:dict, p.title || ' ' || p.content) "
-               "@@ plainto_tsquery(:dict, :query)")
-        result = self.database.session.execute(sql, { "dict": dictionary, "query": search_string })
-        posts: List[Any] = result.fetchall()
-        return posts
+    def search_posts(self, dictionary: str, search_string: str, board_ids: FrozenSet[int],
+                     limit: int, after: Optional[SearchKey] = None) -> Optional[Iterable[Any]]:
+        """Returns a page of at most `limit` posts from the given boards matching the
+        search string, best matches first, with highlighted snippets of the
+        matching parts. The page starts right after the `after` key. Returns None if
+        the search was cancelled for taking longer than the search timeout. The posts are ranked
+        and sorted before the first one is read, so only the rest of the
+        reading happens as they're iterated over."""
+        # pylint: disable = R0913, R0914
+
+        variables: Dict[str, Any] = {
+            "dict": dictionary,
+            "query": search_string,
+            "board_ids": list(board_ids),
+            "limit": limit,
+            "snippet_options": SNIPPET_OPTIONS
+        }
+        if after is not None:
+            variables["rank"], variables["post_id"] = after
+        indexed_dictionary = dictionary if dictionary in SEARCH_VECTOR_COLUMNS else None
+        sql = statements.SEARCH_POSTS[(indexed_dictionary, after is not None)]
+
+        session = self.reader()
+        try:
+            session.execute(statements.SET_STATEMENT_TIMEOUT, { "timeout": self.search_timeout })
+            results = self.execute_streamed(sql, variables)
+            session.execute(statements.RESET_STATEMENT_TIMEOUT)
+        except OperationalError as error:
+            session.rollback()
+            # Only the search timeout is expected, other errors are real.
+            if not isinstance(error.orig, QueryCanceled):
+                raise
+            return None
+
+        def posts() -> Iterator[Any]:
+            for result in results:
+                post_id, topic_id, board_id, username, title, snippet, \
+                    creation_time, edit_time, rank = result
+                snippet = str(escape(snippet)).replace(SNIPPET_START, "<mark>")
+                snippet = snippet.replace(SNIPPET_STOP, "</mark>")
+                yield (post_id, topic_id, board_id, username, title, snippet,
+                       creation_time, edit_time, rank)
+        return posts()
+
+    def backfill_search_vectors(self, after_post_id: int, batch_size: int) -> Optional[int]:
+        """Computes the search vectors for the next batch of posts with ids
+        above after_post_id, and commits. Returns the last post id of the
+        batch, or None if there were no posts left."""
+
+        result = self.database.session.execute(statements.BACKFILL_SEARCH_VECTORS, {
+            "after_post_id": after_post_id,
+            "batch_size": batch_size
+        }).fetchall()
+        self.database.session.commit()
+        if len(result) == 0:
+            return None
+        return max(int(row[0]) for row in result)
+
+    def stream_post_sources(self, after_post_id: int,
+                            batch_size: int) -> Iterator[List[PostSource]]:
+        """Yields the original titles and contents of the posts with ids
+        above after_post_id, in batches ordered by post id. The posts are
+        read through a server-side cursor on a connection of their own, so
+        the session can be committed in between batches. Posts from before
+        the originals were stored can't be re-rendered and are skipped."""
+
+        with self.database.engine.connect() as connection:
+            result = connection.execution_options(stream_results = True).execute(
+                statements.STREAM_POST_SOURCES, { "after_post_id": after_post_id })
+            for rows in result.partitions(batch_size):
+                yield [(int(row[0]), row[1], row[2]) for row in rows]
+
+    def store_rendered_posts(self, posts: List[RenderedPost]) -> int:
+        """Stores the re-rendered titles and contents of the posts, and
+        updates the copies of the titles and the versions in topics and
+        board_stats.
+        Posts which have been edited since they were read, or rendered
+        into something invalid, are left as they are. Commits, and
+        returns the amount of posts that changed."""
+
+        posts = [post for post in posts if post[3] is not None and post[4] is not None]
+        result = self.database.session.execute(statements.STORE_RENDERED_POSTS, {
+            "post_ids": [post[0] for post in posts],
+            "title_originals": [post[1] for post in posts],
+            "content_originals": [post[2] for post in posts],
+            "titles": [post[3] for post in posts],
+            "contents": [post[4] for post in posts],
+        }).fetchall()
+        changed_post_ids = [int(row[0]) for row in result]
+
+        if len(changed_post_ids) > 0:
+            session = self.database.session
+            variables = { "post_ids": changed_post_ids }
+            session.execute(statements.STORE_RENDERED_TOPIC_TITLES, variables)
+            session.execute(statements.STORE_RENDERED_TOPIC_LAST_TITLES, variables)
+            session.execute(statements.STORE_RENDERED_BOARD_LAST_TITLES, variables)
+            result = session.execute(statements.BUMP_POST_TOPIC_VERSIONS, variables)
+            board_ids = list({ row[0] for row in result })
+            session.execute(statements.BUMP_BOARD_VERSIONS, { "board_ids": board_ids })
+        self.database.session.commit()
+        return len(changed_post_ids)
+
+    def are_posts_partitioned(self) -> bool:
+        """Returns true if the posts have been partitioned by month with
+        partition_posts. Looked up once, so the forum should be restarted
+        after partitioning the posts."""
+
+        if self.posts_partitioned is None:
+            self.posts_partitioned = bool(self.database.session.execute(
+                statements.ARE_POSTS_PARTITIONED).scalar())
+        return self.posts_partitioned
+
+    def partition_posts(self) -> None:
+        """Moves the posts into a table partitioned by month, and commits.
+        Copies every post, so it takes a while on a large forum."""
+
+        migrations.run_script(self.database, "partition_posts.sql")
+        self.posts_partitioned = True
+
+    def create_post_partitions(self, from_time: datetime, until_time: datetime) -> int:
+        """Creates the missing monthly partitions of the posts table, from
+        the month of from_time to the month of until_time, and commits.
+        Returns the amount of partitions created."""
+
+        created: int = self.database.session.execute(statements.CREATE_POST_PARTITIONS, {
+            "from_time": from_time,
+            "until_time": until_time
+        }).scalar()
+        self.database.session.commit()
+        return created
+
+    def get_post_partitions(self) -> List[Tuple[str, int, bool]]:
+        """Returns the name and size in bytes of each partition of the posts
+        table, and whether it's detached (e.g. archived), oldest first."""
+
+        result = self.database.session.execute(statements.GET_POST_PARTITIONS).fetchall()
+        return [(row[0], int(row[1]), bool(row[2])) for row in result]
+
+    def archive_post_partition(self, month: datetime) -> Optional[Tuple[int, int]]:
+        """Detaches the partition of the posts written in the given month (in
+        UTC), so they aren't shown anymore, and moves them into a table of
+        their own, which compresses their contents. Topics left without
+        posts are hidden. Returns the size of the posts in bytes before and
+        after, or None if there's no such partition."""
+
+        partition = "posts_{:%Y_%m}".format(month)
+        partitions = { name: (size, detached) for name, size, detached
+                       in self.get_post_partitions() }
+        if partition not in partitions:
+            return None
+        session = self.database.session
+        sql = statements.post_partition_sql(month)
+        size, detached = partitions[partition]
+        if not detached:
+            # Detaching is quick, and copying the posts can take a while,
+            # so the posts table isn't locked during the latter.
+            result = session.execute(sql["topic_ids"])
+            topic_ids = [int(row[0]) for row in result]
+            session.execute(sql["detach"])
+            session.execute(statements.REFRESH_TOPIC_SUMMARIES, { "topic_ids": topic_ids })
+            session.commit()
+            self.refresh_board_stats(topic_ids)
+        session.execute(sql["archive"])
+        session.commit()
+        sizes = { name: size for name, size, _ in self.get_post_partitions() }
+        return size, sizes["archived_" + partition]
+
+    def restore_post_partition(self, month: datetime) -> bool:
+        """Attaches the archived posts of the given month (in UTC) back to the
+        posts table, and commits. Returns False if there's no archive of the
+        month."""
+
+        partition = "posts_{:%Y_%m}".format(month)
+        if not any(name == "archived_" + partition for name, _, _ in self.get_post_partitions()):
+            return False
+        session = self.database.session
+        sql = statements.post_partition_sql(month)
+        session.execute(sql["restore"])
+        result = session.execute(sql["topic_ids"])
+        topic_ids = [int(row[0]) for row in result]
+        session.execute(statements.REFRESH_TOPIC_SUMMARIES, { "topic_ids": topic_ids })
+        session.commit()
+        self.refresh_board_stats(topic_ids)
+        return True
 
     def get_username(self, user_id: Optional[int]) -> Optional[str]:
         """Returns the username of the user with the given id, or None if there is no
@@ -437,18 +861,62 @@ class ForumDatabase: # pylint: disable = R0904
 
         if user_id is None:
             return None
-        sql = "select username from users where user_id = :user_id"
-        user: Optional[str] = self.database.session.execute(sql, { "user_id": user_id }).scalar()
+        user: Optional[str] = self.reader().execute(statements.GET_USERNAME, {
+            "user_id": user_id
+        }).scalar()
         return user
 
+    def get_topic_data(self, topic_id: int) -> Optional[Any]:
+        """Returns the parent board id and the title of the topic with the
+        given id, or None if there is no topic with the id."""
+
+        result = self.reader().execute(statements.GET_TOPIC_DATA, {
+            "topic_id": topic_id
+        }).first()
+        if result is None:
+            return None
+        board_id, title = result
+        return board_id, title
+
+    def get_boards_version(self, board_ids: FrozenSet[int]) -> PageVersion:
+        """Returns the version of the board list, made up of the given boards."""
+
+        version, modified_time = self.reader().execute(statements.GET_BOARDS_VERSION, {
+            "board_ids": list(board_ids)
+        }).first()
+        return int(version), modified_time
+
+    def get_board_version(self, board_id: int) -> Optional[PageVersion]:
+        """Returns the version of the board's topic list, or None if there's
+        no such board."""
+
+        result = self.reader().execute(statements.GET_BOARD_VERSION, {
+            "board_id": board_id
+        }).first()
+        if result is None:
+            return None
+        return int(result[0]), result[1]
+
+    def get_topic_version(self, topic_id: int) -> Optional[PageVersion]:
+        """Returns the version of the topic's posts, or None if there's no
+        such topic."""
+
+        result = self.reader().execute(statements.GET_TOPIC_VERSION, {
+            "topic_id": topic_id
+        }).first()
+        if result is None:
+            return None
+        return int(result[0]), result[1]
+
     def get_board_data(self, board_id: Optional[int]) -> Optional[Any]:
         """Returns the name of the board with the given id, or None if there is no
         board with the id, or the id is None."""
 
         if board_id is None:
             return None
-        sql = "select title, description from boards where board_id = :board_id"
-        result = self.database.session.execute(sql, { "board_id": board_id }).first()
+        result = self.reader().execute(statements.GET_BOARD_DATA, {
+            "board_id": board_id
+        }).first()
         if result is None:
             return None
         title, description = result
@@ -467,9 +935,27 @@ def setup(app: Flask) -> Optional[ForumDatabase]:
 
     app.config["SQLALCHEMY_DATABASE_URI"] = url
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app)
     sql_alchemy_db = SQLAlchemy(app)
-    migrations_successful = migrations.run(app, sql_alchemy_db)
+    check_only = getenv("DATABASE_MIGRATIONS", default = "apply") == "check"
+    migrations_successful = migrations.run(app, sql_alchemy_db, check_only)
     if not migrations_successful:
         return None
 
-    return ForumDatabase(sql_alchemy_db)
+    replicas = None
+    replica_urls = [replica_url.strip().replace("postgres://", "postgresql://")
+                    for replica_url in getenv("DATABASE_REPLICA_URLS", default = "").split(",")
+                    if len(replica_url.strip()) > 0]
+    if len(replica_urls) > 0:
+        sticky_seconds = float(getenv("DATABASE_REPLICA_STICKY_SECONDS", default = "10"))
+        replicas = Replicas(replica_urls, engine_options(app), sticky_seconds, app.logger)
+
+    search_timeout = int(getenv("SEARCH_TIMEOUT", default = "5000"))
+    password_hasher = PasswordHasher(
+        getenv("PASSWORD_HASH_METHOD", default = "pbkdf2:sha256"),
+        int(getenv("PASSWORD_HASH_WORKERS", default = "1")),
+        int(getenv("PASSWORD_HASH_QUEUE", default = "4")),
+        float(getenv("PASSWORD_HASH_TIMEOUT", default = "5")))
+    session_cache_seconds = float(getenv("SESSION_CACHE_SECONDS", default = "10"))
+    return ForumDatabase(sql_alchemy_db, search_timeout, password_hasher, replicas,
+                         session_cache_seconds)
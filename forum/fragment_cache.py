@@ -0,0 +1,57 @@
+"""A cache for rendered pieces of pages, kept in each worker's memory."""
+
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+class FragmentCache:
+    """Rendered HTML fragments by key, evicting the least recently used
+    ones when their total length exceeds max_size characters.
+
+    Each fragment is stored with a checksum of the data it was rendered
+    from, and rendered again if the checksum doesn't match, in case the
+    data changed without the key changing."""
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self.size = 0
+        self.fragments: "OrderedDict[Hashable, Tuple[int, str]]" = OrderedDict()
+        self.lock = Lock()
+        self.stats = { "hits": 0, "misses": 0, "evictions": 0 }
+
+    def get(self, key: Hashable, checksum: int, render: Callable[[], str]) -> str:
+        """Returns the cached fragment, or renders and caches it."""
+
+        with self.lock:
+            cached = self.fragments.get(key)
+            if cached is not None and cached[0] == checksum:
+                self.fragments.move_to_end(key)
+                self.stats["hits"] += 1
+                return cached[1]
+            self.stats["misses"] += 1
+
+        fragment = render()
+        if len(fragment) > self.max_size:
+            return fragment
+        with self.lock:
+            previous = self.fragments.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous[1])
+            self.fragments[key] = (checksum, fragment)
+            self.size += len(fragment)
+            while self.size > self.max_size:
+                _, (_, evicted) = self.fragments.popitem(last = False)
+                self.size -= len(evicted)
+                self.stats["evictions"] += 1
+        return fragment
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Returns the cache's counters and size, for monitoring."""
+
+        with self.lock:
+            stats: Dict[str, Any] = dict(self.stats)
+            lookups = stats["hits"] + stats["misses"]
+            stats["hit_rate"] = stats["hits"] / lookups if lookups > 0 else None
+            stats["fragments"] = len(self.fragments)
+            stats["size"] = self.size
+            return stats
@@ -1,50 +1,112 @@
 """Database migrations. Only upgrades are supported (i.e. not
-downgrades). Launching multiple instances of the forum may cause
-issues with duplicate migrations, so it's recommended to wait until
-the first instance is up and running before starting the other
-ones."""
+downgrades). Each migration is applied in a transaction of its own,
+while holding an advisory lock, so several instances of the forum can
+be started at the same time: one of them applies the migrations, and
+the others wait for it, and then find the database up-to-date."""
 
+import os
+import re
 from typing import Any
 from flask import Flask
+from sqlalchemy.exc import ProgrammingError
 
-def run(app: Flask, sql_alchemy_db: Any) -> bool:
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), "migrations")
+
+# The key of the advisory lock held while migrating. Any number works, as
+# long as nothing else in the database uses the same one.
+MIGRATION_LOCK_ID = 7413620958
+
+def get_latest_version() -> int:
+    """Returns the version the migration files in the migrations directory
+    upgrade the database to."""
+
+    versions = [int(match.group(1)) for match in
+                (re.fullmatch(r"version_(\d+)\.sql", name) for name in os.listdir(MIGRATIONS_DIR))
+                if match is not None]
+    return max(versions, default = -1)
+
+def query_forum_version(sql_alchemy_db: Any) -> int:
+    """Returns the database's version, or -1 if it hasn't been set up at
+    all. Doesn't end the transaction."""
+
+    table_exists = sql_alchemy_db.session.execute(
+        "select to_regclass('forum_schema_version') is not null").scalar()
+    if not table_exists:
+        return -1
+    db_version: int = sql_alchemy_db.session.execute(
+        "select version from forum_schema_version").scalar()
+    return db_version
+
+def run(app: Flask, sql_alchemy_db: Any, check_only: bool = False) -> bool:
     """Checks the database's forum_version table for the current version,
     and applies any unapplied migration files from the migrations
-    directory at the root of the repository. Returns False if all
-    migrations can't be applied.
+    directory. With check_only, only checks that there aren't any.
+    Returns False if the database isn't up-to-date afterwards.
     """
 
-    def query_forum_version() -> int:
-        result = sql_alchemy_db.session.execute("select version from forum_schema_version")
-        db_version: int = result.scalar()
-        return db_version
-
-    db_exists = sql_alchemy_db.session.execute("select exists ( select from "
-                                               "information_schema.tables where "
-                                               "table_name = 'forum_schema_version' )").scalar()
-    if db_exists:
-        db_version = query_forum_version()
-    else:
+    latest_version = get_latest_version()
+    # The usual case, an up-to-date database, only costs this one query.
+    try:
+        db_version: int = sql_alchemy_db.session.execute(
+            "select version from forum_schema_version").scalar()
+    except ProgrammingError: # No forum_schema_version table, an empty database
         db_version = -1
-
+    sql_alchemy_db.session.rollback()
     app.logger.info("Database version: {}".format(db_version))
-    while True:
+    if db_version >= latest_version:
+        app.logger.info("Database up-to-date.")
+        return True
+    if check_only:
+        app.logger.error(("Database version is {}, but this version of the forum needs {}. "
+                          "Apply the migrations with DATABASE_MIGRATIONS=apply."
+                          ).format(db_version, latest_version))
+        return False
+
+    while db_version < latest_version:
+        next_db_version = db_version + 1
+        # Migrations may take a while, and so may waiting for another
+        # instance's migrations, so DATABASE_STATEMENT_TIMEOUT doesn't apply.
+        sql_alchemy_db.session.execute("set local statement_timeout = 0")
+        # Released when the transaction ends. Another instance may have
+        # applied the migration while this one was waiting for the lock.
+        sql_alchemy_db.session.execute("select pg_advisory_xact_lock(:lock_id)",
+                                       { "lock_id": MIGRATION_LOCK_ID })
+        db_version = query_forum_version(sql_alchemy_db)
+        if db_version >= next_db_version:
+            sql_alchemy_db.session.commit()
+            continue
+
+        next_sql_path = os.path.join(MIGRATIONS_DIR, "version_{}.sql".format(next_db_version))
         try:
-            next_db_version = db_version + 1
-            next_sql_path = "forum/migrations/version_{}.sql".format(next_db_version)
             with open(next_sql_path, "r") as migration_sql:
-                app.logger.info("Migrating to version {}.".format(next_db_version))
                 sql = migration_sql.read()
-                sql_alchemy_db.session.execute(sql)
-            db_version = query_forum_version()
-            if db_version != next_db_version:
-                app.logger.error(("Abort! After running migration sql, "
-                                  "the version is {}, "
-                                  "instead of the expected {}."
-                                  ).format(db_version, next_db_version))
-                return False
-            sql_alchemy_db.session.commit()
         except FileNotFoundError:
-            app.logger.info("Database up-to-date.")
-            break
+            app.logger.error("Abort! Migration file {} is missing.".format(next_sql_path))
+            sql_alchemy_db.session.rollback()
+            return False
+        app.logger.info("Migrating to version {}.".format(next_db_version))
+        sql_alchemy_db.session.execute(sql)
+        db_version = query_forum_version(sql_alchemy_db)
+        if db_version != next_db_version:
+            app.logger.error(("Abort! After running migration sql, "
+                              "the version is {}, "
+                              "instead of the expected {}."
+                              ).format(db_version, next_db_version))
+            sql_alchemy_db.session.rollback()
+            return False
+        sql_alchemy_db.session.commit()
+    app.logger.info("Database up-to-date.")
     return True
+
+def run_script(sql_alchemy_db: Any, name: str) -> None:
+    """Runs an SQL script from the migrations directory which isn't a
+    migration, but opted into, in a transaction holding the migration
+    lock, and commits."""
+
+    with open(os.path.join(MIGRATIONS_DIR, name), "r") as script:
+        sql = script.read()
+    sql_alchemy_db.session.execute("set local statement_timeout = 0")
+    sql_alchemy_db.session.execute("select pg_advisory_xact_lock(:lock_id)",
+                                   { "lock_id": MIGRATION_LOCK_ID })
+    sql_alchemy_db.session.execute(sql)
+    sql_alchemy_db.session.commit()
@@ -0,0 +1,85 @@
+-- Not a migration, but run by `flask partition-posts` for forums which
+-- opt into it. Posts are partitioned by creation_time, a partition per
+-- month (in UTC), so that vacuuming and indexing mostly touch the recent
+-- months, topic pages only read the months the topic was active in, and
+-- old months can be detached and archived. Posts from months without a
+-- partition go to the default partition, which create_post_partitions
+-- empties. The existing posts are copied into the new table, which
+-- takes a while on a large forum. Migrations which change posts have to
+-- work on both the partitioned and the unpartitioned table.
+
+alter table posts rename to posts_unpartitioned;
+
+create table posts (
+    post_id integer not null default nextval('posts_post_id_seq'),
+    parent_topic_id integer not null,
+    author_user_id integer not null,
+    title text not null,
+    content text not null,
+    creation_time timestamp with time zone not null,
+    edit_time timestamp with time zone null,
+    content_original text,
+    title_original text,
+    search_vector_english tsvector null,
+    search_vector_finnish tsvector null
+) partition by range (creation_time);
+alter sequence posts_post_id_seq owned by posts.post_id;
+
+create table posts_default partition of posts default;
+
+-- Creates the missing monthly partitions from the month of from_time to
+-- the month of until_time, moving their posts out of the default
+-- partition. Returns the amount of partitions created.
+create function create_post_partitions(from_time timestamp with time zone,
+                                       until_time timestamp with time zone)
+returns integer language plpgsql as $$
+declare
+    month_start timestamp with time zone := date_trunc('month', from_time, 'UTC');
+    month_end timestamp with time zone;
+    partition_name text;
+    created integer := 0;
+begin
+    while month_start <= until_time loop
+        month_end := month_start + interval '1 month';
+        partition_name := 'posts_' || to_char(month_start at time zone 'UTC', 'YYYY_MM');
+        if to_regclass(partition_name) is null then
+            execute format('create table %I (like posts including defaults)', partition_name);
+            execute format('with moved as (delete from posts_default '
+                           '               where creation_time >= %L and creation_time < %L '
+                           '               returning *) '
+                           'insert into %I select * from moved',
+                           month_start, month_end, partition_name);
+            execute format('alter table posts attach partition %I for values from (%L) to (%L)',
+                           partition_name, month_start, month_end);
+            created := created + 1;
+        end if;
+        month_start := month_end;
+    end loop;
+    return created;
+end
+$$;
+
+select create_post_partitions(
+    coalesce((select min(creation_time) from posts_unpartitioned), now()),
+    now() + interval '3 months');
+
+insert into posts (post_id, parent_topic_id, author_user_id, title, content, creation_time,
+                   edit_time, content_original, title_original,
+                   search_vector_english, search_vector_finnish)
+select post_id, parent_topic_id, author_user_id, title, content, creation_time,
+       edit_time, content_original, title_original,
+       search_vector_english, search_vector_finnish
+from posts_unpartitioned;
+
+drop table posts_unpartitioned;
+
+-- The indexes and constraints are made for every partition, which is
+-- quicker after the posts are in. Unique indexes of partitioned tables
+-- have to include the partition key.
+alter table posts add primary key (post_id, creation_time);
+alter table posts add foreign key (parent_topic_id) references topics(topic_id);
+alter table posts add foreign key (author_user_id) references users(user_id);
+create index posts_listing_idx on posts (parent_topic_id, creation_time, post_id);
+create index posts_author_idx on posts (author_user_id);
+create index posts_search_english_idx on posts using gin (search_vector_english);
+create index posts_search_finnish_idx on posts using gin (search_vector_finnish);
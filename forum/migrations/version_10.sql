@@ -0,0 +1,4 @@
+-- The order of a topic's post listing.
+create index posts_listing_idx on posts (parent_topic_id, creation_time, post_id);
+
+update forum_schema_version set version = 10;
@@ -0,0 +1,9 @@
+-- Bumped whenever board access rules may have changed, so that cached
+-- board access lists can be invalidated.
+create table board_acl_version (
+    version bigint not null
+);
+
+insert into board_acl_version (version) values (0);
+
+update forum_schema_version set version = 11;
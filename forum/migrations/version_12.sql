@@ -0,0 +1,10 @@
+-- Search vectors for each postgres-search-dictionary used by the
+-- translations. Filled in by the write paths, and for old posts by the
+-- backfill-search-vectors command.
+alter table posts add column search_vector_english tsvector null;
+alter table posts add column search_vector_finnish tsvector null;
+
+create index posts_search_english_idx on posts using gin (search_vector_english);
+create index posts_search_finnish_idx on posts using gin (search_vector_finnish);
+
+update forum_schema_version set version = 12;
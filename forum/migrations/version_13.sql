@@ -0,0 +1,28 @@
+-- Usernames are unique, which lets registration rely on the index
+-- instead of checking for the username first. The earlier registration
+-- could create duplicates when two people registered the same name at
+-- once, and those have to be renamed or removed by hand first.
+do $$
+declare
+    duplicates text;
+begin
+    select string_agg(format('%s (user ids %s)', username, user_ids), ', ')
+    into duplicates
+    from (select username, string_agg(cast(user_id as text), ', ' order by user_id) as user_ids
+          from users group by username having count(*) > 1) duplicate_users;
+    if duplicates is not null then
+        raise exception 'Usernames have to be unique before upgrading, rename or remove '
+                        'the duplicate users: %', duplicates;
+    end if;
+end
+$$;
+create unique index users_username_idx on users (username);
+
+-- Posts by author, for the ownership checks and user lookups.
+create index posts_author_idx on posts (author_user_id);
+
+-- The other lookups are covered by the primary keys, and by the
+-- posts_listing_idx and topics_listing_idx indexes, whose leading
+-- columns are posts(parent_topic_id) and topics(parent_board_id).
+
+update forum_schema_version set version = 13;
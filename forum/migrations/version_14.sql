@@ -0,0 +1,9 @@
+-- Bumped whenever something shown on the board's page, or the topic's
+-- page, changes. Used as validators for conditional requests, so that
+-- pages which haven't changed don't need to be rendered again.
+alter table board_stats add column version bigint not null default 0;
+alter table board_stats add column modified_time timestamp with time zone not null default now();
+alter table topics add column version bigint not null default 0;
+alter table topics add column modified_time timestamp with time zone not null default now();
+
+update forum_schema_version set version = 14;
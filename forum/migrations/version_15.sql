@@ -0,0 +1,9 @@
+-- Topic pages read the posts between their topic's first and last
+-- post's creation times, which limits them to the months the topic was
+-- active in when the posts are partitioned by month. The partitioning
+-- is opted into with `flask partition-posts`, see partition_posts.sql.
+alter table topics add column first_post_time timestamp with time zone null;
+update topics t set first_post_time = p.creation_time
+from posts p where p.post_id = t.first_post_id;
+
+update forum_schema_version set version = 15;
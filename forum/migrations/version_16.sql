@@ -0,0 +1,9 @@
+-- CSRF tokens are derived from the session instead of being stored for
+-- each user. A session is valid while it was started in the user's
+-- current session generation, which logging out bumps, revoking all
+-- of the user's sessions. Sessions started before this version don't
+-- have a generation, so everyone has to log in again.
+alter table users add column session_generation integer not null default 0;
+alter table users drop column csrf_token;
+
+update forum_schema_version set version = 16;
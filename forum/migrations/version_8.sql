@@ -0,0 +1,28 @@
+create table board_stats (
+    board_id integer primary key references boards(board_id),
+    topic_count integer not null default 0,
+    post_count integer not null default 0,
+    last_post_id integer null,
+    last_topic_id integer null,
+    last_post_title text null,
+    last_post_time timestamp with time zone null
+);
+
+-- Only boards that are listed (i.e. not deleted) have statistics.
+insert into board_stats (board_id, topic_count, post_count,
+                         last_post_id, last_topic_id, last_post_title, last_post_time)
+select b.board_id,
+       (select count(*) from topics t where t.parent_board_id = b.board_id),
+       (select count(*) from posts p join topics t on p.parent_topic_id = t.topic_id
+        where t.parent_board_id = b.board_id),
+       latest.post_id, latest.parent_topic_id, latest.title, latest.creation_time
+from boards b
+left join lateral (
+    select p.post_id, p.parent_topic_id, p.title, p.creation_time
+    from posts p join topics t on p.parent_topic_id = t.topic_id
+    where t.parent_board_id = b.board_id
+    order by p.creation_time desc, p.post_id desc limit 1
+) latest on true
+where b.deleted = FALSE;
+
+update forum_schema_version set version = 8;
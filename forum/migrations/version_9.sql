@@ -0,0 +1,25 @@
+alter table topics add column first_post_id integer null;
+alter table topics add column author_user_id integer null references users(user_id);
+alter table topics add column title text null;
+alter table topics add column reply_count integer not null default 0;
+alter table topics add column last_post_id integer null;
+alter table topics add column last_post_title text null;
+alter table topics add column last_post_time timestamp with time zone null;
+
+update topics t set
+    (first_post_id, author_user_id, title) =
+        (select p.post_id, p.author_user_id, p.title from posts p
+         where p.parent_topic_id = t.topic_id
+         order by p.creation_time asc, p.post_id asc limit 1),
+    (last_post_id, last_post_title, last_post_time) =
+        (select p.post_id, p.title, p.creation_time from posts p
+         where p.parent_topic_id = t.topic_id
+         order by p.creation_time desc, p.post_id desc limit 1),
+    reply_count = greatest((select count(*) from posts p
+                            where p.parent_topic_id = t.topic_id) - 1, 0);
+
+-- The order of the board's topic listing.
+create index topics_listing_idx
+    on topics (parent_board_id, sticky desc, last_post_time desc, topic_id desc);
+
+update forum_schema_version set version = 9;
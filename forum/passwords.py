@@ -0,0 +1,106 @@
+"""Password hashing and verification. The hashing is deliberately slow, so
+it's done in a small pool of worker processes, to keep bursts of logins
+from taking all the CPU time that serving pages needs."""
+
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from threading import Lock
+from typing import Any, Callable, Dict, Optional, cast
+from werkzeug.security import generate_password_hash, check_password_hash, \
+    DEFAULT_PBKDF2_ITERATIONS
+
+class PasswordHasherBusy(Exception):
+    """Raised when there are too many passwords waiting to be hashed, or
+    one has waited too long. The request should be retried later."""
+
+    def __init__(self, retry_after: int) -> None:
+        super().__init__("Password hashing is saturated")
+        self.retry_after = retry_after
+
+def normalize_method(method: str) -> str:
+    """Returns the hashing method as werkzeug writes it at the start of the
+    hashes, which includes the default iteration count if it's left out."""
+
+    parts = method.split(":")
+    if parts[0] == "pbkdf2":
+        hash_name = parts[1] if len(parts) > 1 else "sha256"
+        iterations = parts[2] if len(parts) > 2 else str(DEFAULT_PBKDF2_ITERATIONS)
+        return "pbkdf2:{}:{}".format(hash_name, iterations)
+    return method
+
+class PasswordHasher: # pylint: disable = R0902
+    """Hashes and verifies passwords in a process pool of the given size.
+    At most queue_limit passwords wait for a free worker, and none wait
+    longer than timeout seconds: past those, PasswordHasherBusy is raised
+    instead of tying the request up."""
+
+    def __init__(self, method: str = "pbkdf2:sha256", workers: int = 1,
+                 queue_limit: int = 4, timeout: float = 5) -> None:
+        self.method = normalize_method(method)
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.timeout = timeout
+        # Created on first use, so that each server worker process gets a
+        # pool of its own, instead of sharing one created before forking.
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.lock = Lock()
+        self.in_flight = 0
+        self.stats = { "hashed": 0, "verified": 0, "rejected": 0, "timeouts": 0 }
+
+    def run(self, function: Callable[..., Any], *args: Any) -> Any:
+        """Runs the function in the pool and returns its result."""
+
+        with self.lock:
+            if self.in_flight >= self.workers + self.queue_limit:
+                self.stats["rejected"] += 1
+                raise PasswordHasherBusy(int(self.timeout) + 1)
+            self.in_flight += 1
+            if self.executor is None:
+                # Spawned rather than forked: the server might be running
+                # threads, and the workers only need werkzeug, not the app.
+                self.executor = ProcessPoolExecutor(self.workers,
+                                                    multiprocessing.get_context("spawn"))
+            executor = self.executor
+        future = executor.submit(function, *args)
+        # The job counts against the limit until it's actually done, even if
+        # the request stops waiting for it.
+        future.add_done_callback(self.job_done)
+        try:
+            return future.result(timeout = self.timeout)
+        except FutureTimeoutError as error:
+            future.cancel()
+            with self.lock:
+                self.stats["timeouts"] += 1
+            raise PasswordHasherBusy(int(self.timeout) + 1) from error
+
+    def job_done(self, future: "Future[Any]") -> None: # pylint: disable = W0613
+        """Frees up the job's place in the queue."""
+        with self.lock:
+            self.in_flight -= 1
+
+    def hash(self, password: str) -> str:
+        """Returns a new salted hash of the password."""
+        password_hash: str = self.run(generate_password_hash, password, self.method)
+        with self.lock:
+            self.stats["hashed"] += 1
+        return password_hash
+
+    def verify(self, password_hash: str, password: str) -> bool:
+        """Returns True if the password matches the hash."""
+        check = cast(Callable[[str, str], bool], check_password_hash)
+        matches: bool = self.run(check, password_hash, password)
+        with self.lock:
+            self.stats["verified"] += 1
+        return matches
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        """Returns True if the hash was made with other parameters than the
+        ones currently configured."""
+        return password_hash.split("$", 1)[0] != self.method
+
+    def get_stats(self) -> Dict[str, int]:
+        """Returns the counts of hashed, verified and rejected passwords, and
+        of the ones waiting to be done right now."""
+        with self.lock:
+            return dict(self.stats, in_flight = self.in_flight)
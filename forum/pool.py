@@ -0,0 +1,142 @@
+"""Database connection pool configuration and measurement."""
+
+from os import getenv
+from threading import Lock
+import time
+from typing import Any, Callable, Dict
+from flask import Flask
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import NullPool, Pool, QueuePool
+
+class PoolMetrics:
+    """Counters for a pool's checkouts: how many there have been, how long
+    they waited for a connection, and how many connections are in use."""
+
+    def __init__(self) -> None:
+        self.lock = Lock()
+        self.in_use = 0
+        self.stats = { "checkouts": 0, "timeouts": 0, "wait_total_ms": 0.0, "wait_max_ms": 0.0 }
+
+    def listen(self, pool: Pool) -> None:
+        """Counts the connections in use with the pool's checkout and
+        checkin events."""
+
+        event.listen(pool, "checkout", self.checked_out)
+        event.listen(pool, "checkin", self.checked_in)
+
+    def measure_checkout(self, checkout: Callable[[], Any]) -> Any:
+        """Calls checkout, which returns a connection from the pool, and
+        records how long it took."""
+
+        start = time.perf_counter()
+        try:
+            connection = checkout()
+        except PoolTimeoutError:
+            with self.lock:
+                self.stats["timeouts"] += 1
+            raise
+        wait_ms = (time.perf_counter() - start) * 1000
+        with self.lock:
+            self.stats["checkouts"] += 1
+            self.stats["wait_total_ms"] += wait_ms
+            self.stats["wait_max_ms"] = max(self.stats["wait_max_ms"], wait_ms)
+        return connection
+
+    def checked_out(self, *_: Any) -> None:
+        """Records a connection being taken from the pool."""
+
+        with self.lock:
+            self.in_use += 1
+
+    def checked_in(self, *_: Any) -> None:
+        """Records a connection being returned to the pool."""
+
+        with self.lock:
+            self.in_use -= 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Returns the counters, for monitoring."""
+
+        with self.lock:
+            stats: Dict[str, Any] = dict(self.stats)
+            checkouts = stats["checkouts"]
+            stats["wait_average_ms"] = stats["wait_total_ms"] / checkouts if checkouts > 0 else None
+            stats["in_use"] = self.in_use
+            return stats
+
+class MeasuredQueuePool(QueuePool): # type: ignore
+    """SQLAlchemy's default pool, which keeps pool_size connections open
+    and opens up to max_overflow more when they're all in use."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+        self.metrics.listen(self)
+
+    def connect(self) -> Any:
+        """Returns a connection from the pool, measuring the wait for it."""
+
+        return self.metrics.measure_checkout(super().connect)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Returns the checkout counters and the pool's current size."""
+
+        stats = self.metrics.get_stats()
+        stats["pool"] = "queue"
+        stats["size"] = self.size()
+        stats["open"] = self.size() + self.overflow()
+        stats["idle"] = self.checkedin()
+        stats["overflow"] = max(self.overflow(), 0)
+        stats["max_overflow"] = self._max_overflow
+        return stats
+
+class MeasuredNullPool(NullPool): # type: ignore
+    """A pool which opens a new connection for every checkout, for when
+    the connections are pooled outside the forum, by PgBouncer."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+        self.metrics.listen(self)
+
+    def connect(self) -> Any:
+        """Returns a connection from the pool, measuring the wait for it."""
+
+        return self.metrics.measure_checkout(super().connect)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Returns the checkout counters. The wait times include opening
+        the connection, as every checkout does that."""
+
+        stats = self.metrics.get_stats()
+        stats["pool"] = "null"
+        return stats
+
+def engine_options(app: Flask) -> Dict[str, Any]:
+    """Returns the SQLALCHEMY_ENGINE_OPTIONS configured with the DATABASE_*
+    environment variables."""
+
+    statement_timeout = int(getenv("DATABASE_STATEMENT_TIMEOUT", default = "0"))
+    if getenv("DATABASE_PGBOUNCER", default = "0") == "1":
+        # PgBouncer pools the connections, and in transaction pooling mode,
+        # consecutive transactions may run on different server connections,
+        # so nothing is set for the whole session.
+        if statement_timeout > 0:
+            app.logger.warning("DATABASE_STATEMENT_TIMEOUT is ignored with DATABASE_PGBOUNCER, "
+                               "set statement_timeout for the database role instead.")
+        return { "poolclass": MeasuredNullPool }
+
+    options: Dict[str, Any] = {
+        "poolclass": MeasuredQueuePool,
+        "pool_size": int(getenv("DATABASE_POOL_SIZE", default = "5")),
+        "max_overflow": int(getenv("DATABASE_MAX_OVERFLOW", default = "10")),
+        "pool_timeout": float(getenv("DATABASE_POOL_TIMEOUT", default = "30")),
+        "pool_recycle": int(getenv("DATABASE_POOL_RECYCLE", default = "-1")),
+        "pool_pre_ping": getenv("DATABASE_POOL_PRE_PING", default = "0") == "1",
+    }
+    if statement_timeout > 0:
+        options["connect_args"] = {
+            "options": "-c statement_timeout={}".format(statement_timeout)
+        }
+    return options
@@ -0,0 +1,110 @@
+"""Counting and timing the SQL statements executed for each request."""
+
+from logging import Logger
+from threading import Lock
+import time
+from typing import Any, Dict
+import flask
+from flask import request
+from sqlalchemy import event
+
+def normalize_sql(statement: str) -> str:
+    """Returns the statement on one line. The parameters are placeholders in
+    the statement, so their values don't end up in the logs."""
+    return " ".join(statement.split())
+
+class QueryStats:
+    """Counts the statements executed while handling each request and the
+    time spent on them, totaled per route. Statements which take longer
+    than slow_query_ms are logged."""
+
+    def __init__(self, logger: Logger, slow_query_ms: float) -> None:
+        self.logger = logger
+        self.slow_query_ms = slow_query_ms
+        self.lock = Lock()
+        self.routes: Dict[str, Dict[str, Any]] = {}
+        self.slow_queries = 0
+
+    def attach(self, engine: Any) -> None:
+        """Starts timing the statements executed through the engine."""
+
+        event.listen(engine, "before_cursor_execute", self.before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self.after_cursor_execute)
+        event.listen(engine, "handle_error", self.handle_error)
+
+    def before_cursor_execute(self, conn: Any, cursor: Any, statement: str, parameters: Any,
+                              context: Any, executemany: bool) -> None:
+        """Notes the time the statement starts."""
+        # pylint: disable = R0913, W0613
+        conn.info.setdefault("query_start_times", []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn: Any, cursor: Any, statement: str, parameters: Any,
+                             context: Any, executemany: bool) -> None:
+        """Adds the statement to the current request's totals."""
+        # pylint: disable = R0913, W0613
+        duration_ms = (time.perf_counter() - conn.info["query_start_times"].pop()) * 1000
+        self.record_query(statement, duration_ms)
+
+    def handle_error(self, exception_context: Any) -> None:
+        """Adds a failed statement, e.g. one cancelled by a timeout, to the
+        current request's totals like the ones that succeeded."""
+
+        conn = exception_context.connection
+        # Errors while connecting or fetching the results have no start time.
+        if conn is None or exception_context.statement is None or \
+           not conn.info.get("query_start_times"):
+            return
+        duration_ms = (time.perf_counter() - conn.info["query_start_times"].pop()) * 1000
+        self.record_query(exception_context.statement, duration_ms)
+
+    def record_query(self, statement: str, duration_ms: float) -> None:
+        """Adds a statement that took duration_ms to the current request's
+        totals, and logs it if it was slow."""
+
+        if not flask.has_request_context():
+            return
+        flask.g.query_count = flask.g.get("query_count", 0) + 1
+        flask.g.query_ms = flask.g.get("query_ms", 0.0) + duration_ms
+        if 0 < self.slow_query_ms < duration_ms:
+            with self.lock:
+                self.slow_queries += 1
+            self.logger.warning("Slow query ({:.1f} ms) for {}: {}".format(
+                duration_ms, request.path, normalize_sql(statement)))
+
+    def start_request(self) -> None:
+        """Resets the current request's totals."""
+
+        flask.g.request_start_time = time.perf_counter()
+        flask.g.query_count = 0
+        flask.g.query_ms = 0.0
+
+    def finish_request(self) -> str:
+        """Adds the current request's totals to its route's, and returns them
+        as a Server-Timing header value."""
+
+        total_ms = (time.perf_counter() - flask.g.get("request_start_time", time.perf_counter())) \
+            * 1000
+        query_count: int = flask.g.get("query_count", 0)
+        query_ms: float = flask.g.get("query_ms", 0.0)
+        route = request.endpoint or "(no route)"
+        with self.lock:
+            totals = self.routes.setdefault(route, {
+                "requests": 0, "queries": 0, "query_ms": 0.0, "max_queries": 0
+            })
+            totals["requests"] += 1
+            totals["queries"] += query_count
+            totals["query_ms"] += query_ms
+            totals["max_queries"] = max(totals["max_queries"], query_count)
+        return "db;dur={:.1f};desc=\"{} queries\", total;dur={:.1f}".format(
+            query_ms, query_count, total_ms)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Returns the totals per route, for monitoring."""
+
+        with self.lock:
+            routes = {}
+            for route, totals in self.routes.items():
+                route_stats = dict(totals)
+                route_stats["queries_per_request"] = totals["queries"] / totals["requests"]
+                routes[route] = route_stats
+            return { "slow_queries": self.slow_queries, "routes": routes }
@@ -0,0 +1,42 @@
+"""The sanitization and rendering of user-submitted posts into the HTML
+stored in the database. Used both when posts are written, and when
+existing posts are re-rendered after the pipeline has changed."""
+
+from typing import Optional, Tuple, List
+from mistletoe import HTMLRenderer, Document # type: ignore
+import bleach
+from forum.validation import is_valid_title, is_valid_post_content
+
+# The renderer registers its HTML tokens with mistletoe when created, so
+# one is shared by the whole process.
+MARKDOWN_RENDERER = HTMLRenderer()
+
+# A post's id, original title and original content, as written by the user.
+PostSource = Tuple[int, str, str]
+# A post's id, original title and original content, and the title and
+# content rendered from them, or None if they're no longer valid.
+RenderedPost = Tuple[int, str, str, Optional[str], Optional[str]]
+
+def render_post(title: str, content: str) -> Optional[Tuple[str, str]]:
+    """Returns the sanitized title and the content rendered from markdown
+    into sanitized HTML, or None if either of them isn't allowed."""
+
+    title = bleach.clean(title.strip())
+    content = bleach.clean(content.strip()).replace("&gt;", ">")
+    content = MARKDOWN_RENDERER.render(Document(content)).strip()
+    if not is_valid_title(title) or not is_valid_post_content(content):
+        return None
+    return title, content
+
+def render_posts(posts: List[PostSource]) -> List[RenderedPost]:
+    """Renders a batch of posts. Used by the re-rendering command's worker
+    processes, so it's kept picklable at the module level."""
+
+    rendered: List[RenderedPost] = []
+    for post_id, title_original, content_original in posts:
+        result = render_post(title_original, content_original)
+        if result is None:
+            rendered.append((post_id, title_original, content_original, None, None))
+        else:
+            rendered.append((post_id, title_original, content_original, result[0], result[1]))
+    return rendered
@@ -0,0 +1,86 @@
+"""Reading from read replicas of the database."""
+
+from logging import Logger
+import random
+from threading import Lock
+import time
+from typing import Any, Dict, List, Optional
+import flask
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from forum import statements
+from forum.pool import MeasuredQueuePool, MeasuredNullPool
+
+class Replicas:
+    """Engines for the read replicas, and the session of the replica the
+    current request reads from, if any. Requests read from a replica picked
+    at random, except after the user has written something: then they read
+    from the primary for sticky_seconds, or until the replica has replayed
+    the write, whichever is first, so users always see their own posts."""
+
+    def __init__(self, urls: List[str], engine_options: Dict[str, Any],
+                 sticky_seconds: float, logger: Logger) -> None:
+        self.engines = [create_engine(url, **engine_options) for url in urls]
+        self.sticky_seconds = sticky_seconds
+        self.logger = logger
+        self.lock = Lock()
+        self.stats = { "replica_requests": 0, "sticky_requests": 0, "caught_up_checks": 0,
+                       "unavailable": 0 }
+
+    def start_request(self, write_lsn: Optional[str], sticky_until: float) -> bool:
+        """Picks the replica the request reads from, unless the user's last
+        write, at write_lsn in the primary's log, may not have reached it.
+        Returns False while the user should still read from the primary."""
+
+        engine = random.choice(self.engines)
+        replica_session = Session(bind = engine)
+        if write_lsn is not None and time.time() < sticky_until:
+            try:
+                caught_up = replica_session.execute(statements.GET_REPLICA_CAUGHT_UP, {
+                    "lsn": write_lsn
+                }).scalar()
+            except OperationalError as error:
+                replica_session.close()
+                self.logger.warning("Replica unavailable, reading from the primary: {}".format(
+                    error))
+                with self.lock:
+                    self.stats["unavailable"] += 1
+                return False
+            with self.lock:
+                self.stats["caught_up_checks"] += 1
+            if not caught_up:
+                replica_session.close()
+                with self.lock:
+                    self.stats["sticky_requests"] += 1
+                return False
+        flask.g.replica_session = replica_session
+        with self.lock:
+            self.stats["replica_requests"] += 1
+        return True
+
+    def finish_request(self) -> None:
+        """Closes the request's replica session, if it had one."""
+
+        replica_session = flask.g.pop("replica_session", None)
+        if replica_session is not None:
+            replica_session.close()
+
+    def get_session(self) -> Optional[Session]:
+        """Returns the session of the replica the current request reads
+        from, or None if it reads from the primary."""
+
+        if not flask.has_app_context():
+            return None
+        replica_session: Optional[Session] = flask.g.get("replica_session")
+        return replica_session
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Returns the request counters and the replicas' pool counters, for
+        monitoring."""
+
+        with self.lock:
+            stats: Dict[str, Any] = dict(self.stats)
+        stats["pools"] = [engine.pool.get_stats() for engine in self.engines
+                          if isinstance(engine.pool, (MeasuredQueuePool, MeasuredNullPool))]
+        return stats
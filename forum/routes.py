@@ -9,28 +9,64 @@
 # pylint: disable = E1136
 
 import gettext
+import hashlib
 import os
+import secrets
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
 from functools import wraps
-from typing import Any, Dict, Callable
-from jinja2 import Environment, PackageLoader, select_autoescape
+from typing import Any, Dict, Callable, Iterable, Iterator, Optional, FrozenSet, Tuple, cast
+from jinja2 import Environment, PackageLoader, FileSystemBytecodeCache, select_autoescape
 from flask import Flask, redirect, request, send_file, session
 import flask
 from werkzeug import Response
-from forum.database import ForumDatabase
+from werkzeug.http import is_resource_modified
+from forum.database import ForumDatabase, TopicKey, PostKey, SearchKey, UserContext, \
+    PageVersion
+from forum.passwords import PasswordHasherBusy
+from forum.fragment_cache import FragmentCache
+from forum.query_stats import QueryStats
+from forum.sessions import new_session_nonce, make_csrf_token, is_csrf_token_valid
+from forum.streaming import Page, stream_template
 from forum.validation import is_valid_username, is_valid_password
 
+class TemplateBytecodeCache(FileSystemBytecodeCache): # type: ignore
+    """A bytecode cache for the compiled templates, shared by all the
+    language environments and server processes. The files are written
+    atomically, so processes starting at the same time don't read each
+    other's half-written files."""
+
+    def dump_bytecode(self, bucket: Any) -> None:
+        fd, temporary_path = tempfile.mkstemp(dir = self.directory)
+        try:
+            with os.fdopen(fd, "wb") as cache_file:
+                bucket.write_bytecode(cache_file)
+            os.replace(temporary_path, self._get_cache_filename(bucket))
+        except OSError:
+            os.remove(temporary_path)
+
 def setup(app: Flask, database: ForumDatabase) -> None: # pylint: disable = R0914, R0915
     """Sets up Flask routes and the templating system.
 
     This is where the variables mentioned in the template files are set."""
 
+    template_cache_dir = os.getenv("TEMPLATE_CACHE_DIR", default = "")
+    if len(template_cache_dir) > 0:
+        os.makedirs(template_cache_dir, exist_ok = True)
+    # Without a directory, the cache is kept in the system's temporary directory.
+    template_cache = TemplateBytecodeCache(template_cache_dir or None)
+
     def make_jinja_env(lang: str, use_null_translations: bool) -> Any:
         jinja_env: Any = Environment(
             loader = PackageLoader("forum", "templates"),
             autoescape = select_autoescape([]), # No autoescape, for rendering html in user posts.
-            extensions = ["jinja2.ext.i18n"]
+            extensions = ["jinja2.ext.i18n"],
+            bytecode_cache = template_cache
         )
         jinja_env.policies["ext.i18n.trimmed"] = True
+        # Marks where streamed pages are sent out so far, see stream_template.
+        jinja_env.globals["flush"] = lambda: ""
         if use_null_translations:
             translations = gettext.NullTranslations()
         else:
@@ -45,7 +81,69 @@ def setup(app: Flask, database: ForumDatabase) -> None: # pylint: disable = R091
     for lang in os.listdir("translations/"):
         if os.path.isdir("translations/{}".format(lang)):
             jinja_envs[lang], translations[lang] = make_jinja_env(lang, False)
+    # Templates are compiled, or loaded from the bytecode cache, before
+    # the server starts taking requests, so the first ones aren't slow.
+    for jinja_env in jinja_envs.values():
+        for template_name in jinja_env.list_templates():
+            jinja_env.get_template(template_name)
     default_lang = os.getenv("DEFAULT_LANG", default = "en")
+    stats_token = os.getenv("STATS_TOKEN", default = "")
+    topics_per_page = int(os.getenv("TOPICS_PER_PAGE", default = "50"))
+    posts_per_page = int(os.getenv("POSTS_PER_PAGE", default = "25"))
+    search_results_per_page = int(os.getenv("SEARCH_RESULTS_PER_PAGE", default = "20"))
+    stream_pages = os.getenv("STREAM_PAGES", default = "1") == "1"
+    post_cache = FragmentCache(int(os.getenv("POST_CACHE_MEGABYTES", default = "16")) * 1000000)
+    query_stats = QueryStats(app.logger, float(os.getenv("SLOW_QUERY_MS", default = "250")))
+    query_stats.attach(database.database.engine)
+    if database.replicas is not None:
+        for replica_engine in database.replicas.engines:
+            query_stats.attach(replica_engine)
+
+    # Pages look different after the templates, translations or page sizes
+    # change, so they're a part of every page's ETag.
+    site_version = hashlib.sha1(repr((topics_per_page, posts_per_page)).encode())
+    for directory in ("forum/templates", "translations"):
+        for root, directories, files in sorted(os.walk(directory)):
+            directories.sort()
+            for file_name in sorted(files):
+                if file_name.endswith((".html", ".mo")):
+                    with open(os.path.join(root, file_name), "rb") as site_file:
+                        site_version.update(site_file.read())
+
+    @app.before_request
+    def start_timing() -> None:
+        query_stats.start_request()
+
+    @app.after_request
+    def add_server_timing(response: flask.wrappers.Response) -> flask.wrappers.Response:
+        response.headers["Server-Timing"] = query_stats.finish_request()
+        return response
+
+    @app.before_request
+    def pick_database() -> None:
+        """Reads from a replica if there are any, except when the request
+        may write, or the user's last write hasn't reached the replica."""
+        replicas = database.replicas
+        if replicas is None or request.method not in ("GET", "HEAD"):
+            return
+        caught_up = replicas.start_request(session.get("write_lsn"),
+                                           session.get("primary_until", 0.0))
+        if caught_up and "write_lsn" in session:
+            del session["write_lsn"]
+            del session["primary_until"]
+
+    @app.after_request
+    def stick_to_primary(response: flask.wrappers.Response) -> flask.wrappers.Response:
+        replicas = database.replicas
+        if replicas is not None and request.method == "POST" and response.status_code < 400:
+            session["write_lsn"] = database.get_write_lsn()
+            session["primary_until"] = time.time() + replicas.sticky_seconds
+        return response
+
+    @app.teardown_appcontext
+    def close_replica_session(exception: Optional[BaseException]) -> None:
+        if database.replicas is not None:
+            database.replicas.finish_request()
 
     @app.after_request
     def add_csp(response: flask.wrappers.Response) -> flask.wrappers.Response:
@@ -56,20 +154,74 @@ def setup(app: Flask, database: ForumDatabase) -> None: # pylint: disable = R091
         response.headers["Content-Security-Policy"] = csp
         return response
 
-    def fill_and_render_template(template_path: str, variables: Dict[str, Any]) -> Any:
+    def start_session(user_id: int, generation: int) -> None:
+        session["user_id"] = user_id
+        session["session_generation"] = generation
+        session["session_nonce"] = new_session_nonce()
+
+    def end_session() -> None:
+        for key in ("user_id", "session_generation", "session_nonce"):
+            session.pop(key, None)
+
+    def session_user_id() -> Optional[int]:
+        """Returns the logged in user's id, or None if the user isn't logged
+        in, or the session has been revoked. The session's generation is
+        checked against the worker's cached one, so this usually doesn't
+        need the database. Sessions newer than the cached generation are
+        checked against the database, as the user may have logged in again
+        in another worker."""
+        if "session_user_id" not in flask.g:
+            user_id = session.get("user_id")
+            generation = session.get("session_generation")
+            if user_id is not None and (
+                    "session_nonce" not in session or not isinstance(generation, int) or
+                    generation != database.get_session_generation(user_id, generation)):
+                end_session()
+                user_id = None
+            flask.g.session_user_id = user_id
+        return cast(Optional[int], flask.g.session_user_id)
+
+    def current_csrf_token() -> Optional[str]:
+        """Returns the session's CSRF token, or None if the user isn't logged in."""
+        user_id = session_user_id()
+        if user_id is None:
+            return None
+        return make_csrf_token(app.secret_key, user_id, session["session_generation"],
+                               session["session_nonce"])
+
+    def get_user_context() -> Optional[UserContext]:
+        """Returns the logged in user's context, or None if the user isn't
+        logged in. Loaded from the database once per request."""
+        if "user_context" not in flask.g:
+            user_context = None
+            user_id = session_user_id()
+            if user_id is not None:
+                user_context = database.get_user_context(user_id)
+                flask.g.user_context_loads = flask.g.get("user_context_loads", 0) + 1
+            flask.g.user_context = user_context
+        return cast(Optional[UserContext], flask.g.user_context)
+
+    @app.after_request
+    def count_user_context_loads(response: flask.wrappers.Response) -> flask.wrappers.Response:
+        if app.debug:
+            loads = flask.g.get("user_context_loads", 0)
+            response.headers["X-User-Context-Loads"] = str(loads)
+            if loads > 1:
+                app.logger.warning("User context loaded {} times for {}".format(
+                    loads, request.path))
+        return response
+
+    def fill_template(template_path: str, variables: Dict[str, Any]) -> Any:
+        """Adds the variables every page uses, and returns the template."""
         lang = session.get("lang", default_lang)
         jinja_env = jinja_envs[lang]
         template = jinja_env.get_template(template_path)
         logged_in_user = None
-        csrf_token = None
         admin_scopes = None
-        board_access = set()
-        if "user_id" in session:
-            user_id = session["user_id"]
-            logged_in_user = database.get_username(user_id)
-            csrf_token = database.get_csrf_token(user_id)
-            admin_scopes = database.get_admin_scopes(user_id)
-            board_access = database.get_board_access(user_id)
+        user_context = get_user_context()
+        if user_context is not None:
+            logged_in_user = user_context.username
+            admin_scopes = user_context.admin_scopes
         variables.update({
             "lang": lang,
             "languages": list(jinja_envs),
@@ -77,17 +229,27 @@ def setup(app: Flask, database: ForumDatabase) -> None: # pylint: disable = R091
             "current_path": request.full_path,
             "logged_in_user": logged_in_user,
             "admin_scopes": admin_scopes,
-            "accessible_boards": board_access,
-            "csrf_token": csrf_token
+            "csrf_token": current_csrf_token()
         })
-        return template.render(variables)
+        return template
+
+    def fill_and_render_template(template_path: str, variables: Dict[str, Any]) -> Any:
+        return fill_template(template_path, variables).render(variables)
+
+    def fill_and_stream_template(template_path: str, variables: Dict[str, Any]) -> Response:
+        """Returns a response which renders the page as it's being sent.
+        The status and headers are sent before the page is rendered, so
+        anything which could fail the request should be checked first."""
+        template = fill_template(template_path, variables)
+        return flask.Response(flask.stream_with_context(stream_template(template, variables)))
 
     def admin_required(route: Callable[..., Any]) -> Callable[..., Any]:
         @wraps(route)
         def decorated_function(*args: Any, **kwargs: Any) -> Any:
-            if not database.logged_in(session.get("user_id")):
+            user_context = get_user_context()
+            if user_context is None:
                 return fill_and_render_template("login.html", {}), 401
-            if database.get_admin_scopes(session["user_id"]) is None:
+            if user_context.admin_scopes is None:
                 return fill_and_render_template("error-403.html", {}), 403
             return route(*args, **kwargs)
         return decorated_function
@@ -95,7 +257,7 @@ def setup(app: Flask, database: ForumDatabase) -> None: # pylint: disable = R091
     def login_required(route: Callable[..., Any]) -> Callable[..., Any]:
         @wraps(route)
         def decorated_function(*args: Any, **kwargs: Any) -> Any:
-            if not database.logged_in(session.get("user_id")):
+            if session_user_id() is None:
                 login_params = {}
                 if "error" in request.args:
                     login_params["error"] = request.args["error"]
@@ -106,13 +268,28 @@ def setup(app: Flask, database: ForumDatabase) -> None: # pylint: disable = R091
     def csrf_token_required(route: Callable[..., Any]) -> Callable[..., Any]:
         @wraps(route)
         def decorated_function(*args: Any, **kwargs: Any) -> Any:
-            if ("csrf_token" not in request.form or
-                not database.validate_csrf_token(session["user_id"], request.form["csrf_token"])):
+            csrf_token = current_csrf_token()
+            if (csrf_token is None or "csrf_token" not in request.form or
+                not is_csrf_token_valid(csrf_token, request.form["csrf_token"])):
                 return fill_and_render_template("error-403.html", {}), 403
             return route(*args, **kwargs)
         return decorated_function
 
-    def templated(template_path: str) -> Callable[..., Any]:
+    def current_board_access() -> FrozenSet[int]:
+        user_context = get_user_context()
+        assert user_context is not None # Because of @login_required
+        return user_context.board_access
+
+    def current_admin_scopes() -> Optional[Dict[str, bool]]:
+        user_context = get_user_context()
+        assert user_context is not None # Because of @login_required
+        return user_context.admin_scopes
+
+    def templated(template_path: str, stream: bool = False) -> Callable[..., Any]:
+        """Renders the template with the variables returned by the route,
+        or the error page for its error_code. With stream, the page is sent
+        in pieces as it's rendered (unless STREAM_PAGES=0), so the route can
+        return rows which are still being read from the database."""
         def decorator(route: Callable[..., Dict[str, Any]]) -> Callable[..., Any]:
             @wraps(route)
             def decorated_function(*args: Any, **kwargs: Any) -> Any:
@@ -121,10 +298,68 @@ def setup(app: Flask, database: ForumDatabase) -> None: # pylint: disable = R091
                     code = variables["error_code"]
                     template = "error-{}.html".format(code)
                     return fill_and_render_template(template, variables), variables["error_code"]
+                if stream and stream_pages:
+                    return fill_and_stream_template(template_path, variables)
                 return fill_and_render_template(template_path, variables)
             return decorated_function
         return decorator
 
+    def conditional(get_version: Callable[..., Optional[PageVersion]]) -> Callable[..., Any]:
+        """Answers with 304 Not Modified, without running the route, if the
+        client's copy of the page is still up to date. The page's version is
+        looked up by calling get_version with the route's arguments, and
+        combined with everything else the page depends on into an ETag. Only
+        If-None-Match is answered, as the page's modified time doesn't cover
+        e.g. the language or the user."""
+        def decorator(route: Callable[..., Any]) -> Callable[..., Any]:
+            @wraps(route)
+            def decorated_function(*args: Any, **kwargs: Any) -> Any:
+                page_version = get_version(*args, **kwargs)
+                if page_version is None: # Let the route respond with the 404
+                    return route(*args, **kwargs)
+                version, _ = page_version
+                user_context = get_user_context()
+                assert user_context is not None # Because of @login_required
+                etag = hashlib.sha1(repr((
+                    request.full_path, version, user_context.user_id, current_csrf_token(),
+                    user_context.acl_version, session.get("lang", default_lang),
+                    site_version.hexdigest()
+                )).encode()).hexdigest()
+                if is_resource_modified(request.environ, etag):
+                    response = flask.make_response(route(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                else:
+                    response = flask.Response(status = 304)
+                response.set_etag(etag)
+                # Browsers may keep the page, but should always check that it's
+                # still up to date, since it changes as users post.
+                response.cache_control.private = True
+                response.cache_control.no_cache = True
+                return response
+            return decorated_function
+        return decorator
+
+    def render_post_html(board_id: int, topic_id: int, post: Tuple[Any, ...]) -> str:
+        """Returns the parts of the post that are the same for every viewer
+        as HTML, from the cache if they've been rendered already."""
+        post_id, author, title, _, content, _, creation_time, edit_time, _ = post
+        lang = session.get("lang", default_lang)
+        def render() -> str:
+            return cast(str, jinja_envs[lang].get_template("post.html").render({
+                "board_id": board_id,
+                "topic_id": topic_id,
+                "id": post_id,
+                "author": author,
+                "title": title,
+                "content": content,
+                "creation_time": creation_time,
+                "edit_time": edit_time
+            }))
+        # Edits change the edit time, but re-rendering the posts' HTML
+        # doesn't, so the title and content are checked as well.
+        return post_cache.get((post_id, edit_time, lang), hash((title, content)), render)
+
     def redirect_form_error(error: str) -> Response:
         base_url = request.form["redirect_url"]
         param = "error=" + error
@@ -132,6 +367,78 @@ def setup(app: Flask, database: ForumDatabase) -> None: # pylint: disable = R091
             return redirect(base_url + "&" + param)
         return redirect(base_url + "?" + param)
 
+    # Pagination keys are passed in the ?after= and ?before= query
+    # parameters, with the timestamps as microseconds since the epoch.
+    epoch = datetime(1970, 1, 1, tzinfo = timezone.utc)
+
+    def format_topic_key(sticky: bool, last_post_time: datetime, topic_id: int) -> str:
+        microseconds = (last_post_time - epoch) // timedelta(microseconds = 1)
+        return "{}_{}_{}".format(int(sticky), microseconds, topic_id)
+
+    def format_post_key(creation_time: datetime, post_id: int) -> str:
+        microseconds = (creation_time - epoch) // timedelta(microseconds = 1)
+        return "{}_{}".format(microseconds, post_id)
+
+    def parse_topic_key(key: Optional[str]) -> Optional[TopicKey]:
+        if key is None:
+            return None
+        try:
+            sticky, microseconds, topic_id = key.split("_")
+            last_post_time = epoch + timedelta(microseconds = int(microseconds))
+            return sticky == "1", last_post_time, int(topic_id)
+        except (ValueError, OverflowError):
+            return None
+
+    def parse_post_key(key: Optional[str]) -> Optional[PostKey]:
+        if key is None:
+            return None
+        try:
+            microseconds, post_id = key.split("_")
+            return epoch + timedelta(microseconds = int(microseconds)), int(post_id)
+        except (ValueError, OverflowError):
+            return None
+
+    def parse_search_key(key: Optional[str]) -> Optional[SearchKey]:
+        if key is None:
+            return None
+        try:
+            rank, post_id = key.split("_")
+            return float(rank), int(post_id)
+        except ValueError:
+            return None
+
+    def paginate(rows: Iterable[Any], page_size: int, after: Optional[Any],
+                 before: Optional[Any]) -> Page:
+        """Returns the page of rows, fetched with an extra row to see if
+        there's more pages. Pages ending before a key are read all at once,
+        and their extra row is the first one."""
+        if before is not None:
+            rows = list(rows)
+            has_more = len(rows) > page_size
+            return Page(rows[len(rows) - page_size:] if has_more else rows, page_size,
+                        has_more, True)
+        return Page(rows, page_size, after is not None)
+
+    def form_post_key(post_id: int) -> Optional[PostKey]:
+        """Returns the key of the post the form was sent for, from its
+        post_key field, or looked up from the post's id if the form was on a
+        page rendered without the field. None if the post doesn't exist."""
+        key = parse_post_key(request.form.get("post_key"))
+        if key is not None and key[1] == post_id:
+            return key
+        creation_time = database.get_post_creation_time(post_id)
+        return None if creation_time is None else (creation_time, post_id)
+
+    def topic_page_url(board_id: int, topic_id: int, post_id: int,
+                       creation_time: Optional[datetime]) -> str:
+        """Returns the url of the topic page ending with the given post."""
+        url = "/board/{}/topic/{}".format(board_id, topic_id)
+        if creation_time is None:
+            return url
+        # The before-key is exclusive, so the post id is bumped by one to
+        # include the post itself on the page.
+        return url + "?before={}#{}".format(format_post_key(creation_time, post_id + 1), post_id)
+
     @app.errorhandler(404)
     @templated("")
     def page_not_found(error: Any) -> Dict[str, int]:
@@ -142,15 +449,39 @@ def setup(app: Flask, database: ForumDatabase) -> None: # pylint: disable = R091
     def internal_server_error(error: Any) -> Dict[str, int]:
         return { "error_code": 500 }
 
+    @app.errorhandler(PasswordHasherBusy)
+    def password_hasher_busy(error: PasswordHasherBusy) -> Any:
+        body = fill_and_render_template("error-503.html", { "error_code": 503 })
+        return body, 503, { "Retry-After": str(error.retry_after) }
+
     @app.route("/favicon.ico")
     def favicon() -> flask.wrappers.Response:
         return send_file("favicon.ico", "image/x-icon")
 
+    @app.route("/internal/stats")
+    def internal_stats() -> Any:
+        # Only available with the STATS_TOKEN set, and given as a bearer token.
+        authorization = request.headers.get("Authorization", "")
+        if len(stats_token) == 0 or \
+           not secrets.compare_digest(authorization.encode(), ("Bearer " + stats_token).encode()):
+            flask.abort(404)
+        return flask.jsonify({
+            "pid": os.getpid(),
+            "board_acl_cache": database.get_board_acl_cache_stats(),
+            "session_generations": database.session_generations.get_stats(),
+            "database_pool": database.get_pool_stats(),
+            "password_hasher": database.password_hasher.get_stats(),
+            "post_cache": post_cache.get_stats(),
+            "queries": query_stats.get_stats(),
+            "replicas": database.replicas.get_stats() if database.replicas is not None else None
+        })
+
     @app.route("/")
     @login_required
+    @conditional(lambda: database.get_boards_version(current_board_access()))
     @templated("index.html")
     def index() -> Any:
-        return { "boards": database.get_boards() }
+        return { "boards": database.get_boards(current_board_access()) }
 
     @app.route("/admin")
     @admin_required
@@ -160,36 +491,77 @@ def setup(app: Flask, database: ForumDatabase) -> None: # pylint: disable = R091
 
     @app.route("/board/<int:board_id>")
     @login_required
-    @templated("board.html")
+    @conditional(database.get_board_version)
+    @templated("board.html", stream = True)
     def board(board_id: int) -> Any:
+        if board_id not in current_board_access():
+            return { "error_code": 404 }
         board = database.get_board_data(board_id)
         if board is None:
             return { "error_code": 404 }
-        if board_id not in database.get_board_access(session["user_id"]):
-            return { "error_code": 404 }
         board_name, board_description = board
         board_roles = None
-        admin_scopes = database.get_admin_scopes(session["user_id"])
+        admin_scopes = current_admin_scopes()
         if admin_scopes is not None and admin_scopes["can_create_boards"]:
             board_roles = database.get_board_role_ids(board_id)
+        after = parse_topic_key(request.args.get("after"))
+        before = parse_topic_key(request.args.get("before"))
+        topics = paginate(database.get_topics(board_id, topics_per_page + 1, after, before),
+                          topics_per_page, after, before)
+        if topics.first is None and (after is not None or before is not None):
+            topics = paginate(database.get_topics(board_id, topics_per_page + 1),
+                              topics_per_page, None, None)
+        def pagination() -> Tuple[Optional[str], Optional[str]]:
+            newer_page, older_page = None, None
+            first, last = topics.first, topics.last
+            if topics.has_previous and first is not None:
+                newer_page = format_topic_key(first[7], first[6], first[0])
+            if topics.has_next and last is not None:
+                older_page = format_topic_key(last[7], last[6], last[0])
+            return newer_page, older_page
         return {
             "board_id": board_id,
             "board_name": board_name,
             "board_description": board_description,
             "board_roles": board_roles,
-            "topics": database.get_topics(board_id),
+            "topics": topics,
+            "pagination": pagination,
             "roles": database.get_roles()
         }
 
     @app.route("/board/<int:board_id>/topic/<int:topic_id>")
     @login_required
-    @templated("topic.html")
+    @conditional(lambda board_id, topic_id: database.get_topic_version(topic_id))
+    @templated("topic.html", stream = True)
     def topic(board_id: int, topic_id: int) -> Any:
-        if board_id not in database.get_board_access(session["user_id"]):
+        if board_id not in current_board_access():
             return { "error_code": 404 }
-        posts = database.get_posts(topic_id, session["user_id"])
-        if len(posts) == 0:
+        topic = database.get_topic_data(topic_id)
+        if topic is None or topic[0] != board_id:
             return { "error_code": 404 }
+        _, topic_name = topic
+        user_id = session["user_id"]
+        after = parse_post_key(request.args.get("after"))
+        before = parse_post_key(request.args.get("before"))
+        posts = paginate(database.get_posts(topic_id, user_id, posts_per_page + 1, after, before),
+                         posts_per_page, after, before)
+        if posts.first is None and (after is not None or before is not None):
+            posts = paginate(database.get_posts(topic_id, user_id, posts_per_page + 1),
+                             posts_per_page, None, None)
+        if posts.first is None:
+            return { "error_code": 404 }
+        def render_posts() -> Iterator[Any]:
+            for post in posts:
+                yield post + (render_post_html(board_id, topic_id, post),
+                              format_post_key(post[6], post[0]))
+        def pagination() -> Tuple[Optional[str], Optional[str]]:
+            previous_page, next_page = None, None
+            first, last = posts.first, posts.last
+            if posts.has_previous and first is not None:
+                previous_page = format_post_key(first[6], first[0])
+            if posts.has_next and last is not None:
+                next_page = format_post_key(last[6], last[0])
+            return previous_page, next_page
         board = database.get_board_data(board_id)
         assert board is not None # Can't be a topic without a board
         board_name, board_description = board
@@ -197,8 +569,9 @@ def setup(app: Flask, database: ForumDatabase) -> None: # pylint: disable = R091
             "board_id": board_id,
             "board_name": board_name,
             "topic_id": topic_id,
-            "topic_name": posts[0][2],
-            "posts": posts
+            "topic_name": topic_name,
+            "posts": render_posts(),
+            "pagination": pagination
         }
 
     @app.route("/change_language", methods = ["POST"])
@@ -210,14 +583,14 @@ def setup(app: Flask, database: ForumDatabase) -> None: # pylint: disable = R091
     @login_required
     def logout() -> Response:
         database.logout(session["user_id"])
-        del session["user_id"]
+        end_session()
         return redirect(request.form["redirect_url"])
 
     @app.route("/login", methods = ["POST"])
     def login() -> Response:
-        user_id = database.login(request.form["username"], request.form["password"])
-        if user_id is not None and database.logged_in(user_id):
-            session["user_id"] = user_id
+        login_result = database.login(request.form["username"], request.form["password"])
+        if login_result is not None:
+            start_session(*login_result)
             return redirect(request.form["redirect_url"])
         return redirect_form_error("invalid_credentials")
 
@@ -232,8 +605,9 @@ def setup(app: Flask, database: ForumDatabase) -> None: # pylint: disable = R091
         if not is_valid_password(password):
             return redirect_form_error("invalid_password")
         if database.register(username, password):
-            user_id = database.login(username, password)
-            session["user_id"] = user_id
+            login_result = database.login(username, password)
+            if login_result is not None:
+                start_session(*login_result)
             return redirect(request.form["redirect_url"])
         return redirect_form_error("username_taken")
 
@@ -241,7 +615,7 @@ def setup(app: Flask, database: ForumDatabase) -> None: # pylint: disable = R091
     @csrf_token_required
     @login_required
     def new_topic(board_id: int) -> Any:
-        if board_id not in database.get_board_access(session["user_id"]):
+        if board_id not in current_board_access():
             return redirect(request.form["redirect_url"])
         title = request.form["title"]
         content = request.form["content"]
@@ -254,27 +628,31 @@ def setup(app: Flask, database: ForumDatabase) -> None: # pylint: disable = R091
     @csrf_token_required
     @login_required
     def new_post(board_id: int, topic_id: int) -> Any:
-        if board_id not in database.get_board_access(session["user_id"]):
+        if board_id not in current_board_access():
             return redirect(request.form["redirect_url"])
         title = request.form["title"]
         content = request.form["content"]
-        post_id = database.create_post(topic_id, session["user_id"], title, content)
-        if post_id is None:
+        post_key = database.create_post(topic_id, session["user_id"], title, content)
+        if post_key is None:
             return redirect(request.form["redirect_url"])
-        return redirect("/board/{}/topic/{}#{}".format(board_id, topic_id, post_id))
+        creation_time, post_id = post_key
+        return redirect(topic_page_url(board_id, topic_id, post_id, creation_time))
 
     @app.route("/board/<int:board_id>/topic/<int:topic_id>/edit/<int:post_id>", methods = ["POST"])
     @csrf_token_required
     @login_required
     def edit_post(board_id: int, topic_id: int, post_id: int) -> Any:
-        redirect_url = "/board/{}/topic/{}#{}".format(board_id, topic_id, post_id)
-        if board_id not in database.get_board_access(session["user_id"]):
+        post_key = form_post_key(post_id)
+        if post_key is None:
+            return redirect("/board/{}/topic/{}".format(board_id, topic_id))
+        redirect_url = topic_page_url(board_id, topic_id, post_id, post_key[0])
+        if board_id not in current_board_access():
             return redirect(redirect_url)
         if "confirm_edit" not in request.form:
             return redirect(redirect_url)
         title = request.form["title"]
         content = request.form["content"]
-        database.edit_post(post_id, session["user_id"], title, content)
+        database.edit_post(post_key, session["user_id"], title, content)
         return redirect(redirect_url)
 
     @app.route("/board/<int:board_id>/topic/<int:topic_id>/delete/<int:post_id>",
@@ -282,20 +660,24 @@ def setup(app: Flask, database: ForumDatabase) -> None: # pylint: disable = R091
     @csrf_token_required
     @login_required
     def delete_post(board_id: int, topic_id: int, post_id: int) -> Any:
-        err_redirect_url = "/board/{}/topic/{}#{}".format(board_id, topic_id, post_id)
-        if board_id not in database.get_board_access(session["user_id"]):
+        post_key = form_post_key(post_id)
+        if post_key is None:
+            return redirect("/board/{}/topic/{}".format(board_id, topic_id))
+        err_redirect_url = topic_page_url(board_id, topic_id, post_id, post_key[0])
+        if board_id not in current_board_access():
             return redirect(err_redirect_url)
         if "confirm_deletion" not in request.form:
             return redirect(err_redirect_url)
-        database.delete_post(post_id, session["user_id"])
-        posts_after = database.get_posts(topic_id, session["user_id"])
-        if len(posts_after) > 0:
-            return redirect("/board/{}/topic/{}".format(board_id, topic_id))
+        database.delete_post(post_key, session["user_id"])
+        if database.get_topic_data(topic_id) is not None:
+            # Back to the page the post was on, i.e. the one ending before it.
+            return redirect("/board/{}/topic/{}?before={}".format(
+                board_id, topic_id, format_post_key(*post_key)))
         return redirect("/board/{}".format(board_id))
 
     @app.route("/search", methods = ["GET"])
     @login_required
-    @templated("search.html")
+    @templated("search.html", stream = True)
     def search() -> Dict[str, Any]:
         query_string = request.args.get("q")
         if query_string is None:
@@ -305,16 +687,33 @@ def setup(app: Flask, database: ForumDatabase) -> None: # pylint: disable = R091
             translated_string: str = translations[lang].gettext(message)
             return translated_string
         search_language = _("postgres-search-dictionary")
+        after = parse_search_key(request.args.get("after"))
+        posts = database.search_posts(search_language, query_string, current_board_access(),
+                                      search_results_per_page + 1, after)
+        if posts is None:
+            return {
+                "query_string": query_string,
+                "posts": [],
+                "pagination": lambda: (None, None),
+                "timed_out": True
+            }
+        page = paginate(posts, search_results_per_page, after, None)
+        def pagination() -> Tuple[Optional[str], Optional[str]]:
+            last = page.last
+            if page.has_next and last is not None:
+                return None, "{!r}_{}".format(last[8], last[0])
+            return None, None
         return {
             "query_string": query_string,
-            "posts": database.search_posts(search_language, query_string)
+            "posts": page,
+            "pagination": pagination
         }
 
     @app.route("/admin/create-board", methods = ["POST"])
     @csrf_token_required
     @admin_required
     def admin_create_board() -> Any:
-        admin_scopes = database.get_admin_scopes(session["user_id"])
+        admin_scopes = current_admin_scopes()
         assert admin_scopes is not None # Because of @admin_required
         if not admin_scopes["can_create_boards"]:
             return fill_and_render_template("error-403.html", {}), 403
@@ -330,7 +729,7 @@ def setup(app: Flask, database: ForumDatabase) -> None: # pylint: disable = R091
     @csrf_token_required
     @admin_required
     def admin_create_role() -> Any:
-        admin_scopes = database.get_admin_scopes(session["user_id"])
+        admin_scopes = current_admin_scopes()
         assert admin_scopes is not None # Because of @admin_required
         if not admin_scopes["can_create_roles"]:
             return fill_and_render_template("error-403.html", {}), 403
@@ -343,7 +742,7 @@ def setup(app: Flask, database: ForumDatabase) -> None: # pylint: disable = R091
     @csrf_token_required
     @admin_required
     def admin_assign_roles() -> Any:
-        admin_scopes = database.get_admin_scopes(session["user_id"])
+        admin_scopes = current_admin_scopes()
         assert admin_scopes is not None # Because of @admin_required
         if not admin_scopes["can_assign_roles"]:
             return fill_and_render_template("error-403.html", {}), 403
@@ -356,13 +755,13 @@ def setup(app: Flask, database: ForumDatabase) -> None: # pylint: disable = R091
     @csrf_token_required
     @admin_required
     def edit_board(board_id: int) -> Any:
-        admin_scopes = database.get_admin_scopes(session["user_id"])
+        admin_scopes = current_admin_scopes()
         assert admin_scopes is not None # Because of @admin_required
         if not admin_scopes["can_create_boards"]:
             return fill_and_render_template("error-403.html", {}), 403
 
         redirect_url = "/board/{}".format(board_id)
-        if board_id not in database.get_board_access(session["user_id"]):
+        if board_id not in current_board_access():
             return redirect(redirect_url)
         if "confirm_edit" not in request.form:
             return redirect(redirect_url)
@@ -376,13 +775,13 @@ def setup(app: Flask, database: ForumDatabase) -> None: # pylint: disable = R091
     @csrf_token_required
     @login_required
     def delete_board(board_id: int) -> Any:
-        admin_scopes = database.get_admin_scopes(session["user_id"])
+        admin_scopes = current_admin_scopes()
         assert admin_scopes is not None # Because of @admin_required
         if not admin_scopes["can_create_boards"]:
             return fill_and_render_template("error-403.html", {}), 403
 
         err_redirect_url = "/board/{}".format(board_id)
-        if board_id not in database.get_board_access(session["user_id"]):
+        if board_id not in current_board_access():
             return redirect(err_redirect_url)
         if "confirm_deletion" not in request.form:
             return redirect(err_redirect_url)
@@ -0,0 +1,94 @@
+"""Signed CSRF tokens for the users' sessions, and the cache of the
+sessions' generations, kept in each worker's memory."""
+
+from collections import OrderedDict
+import hashlib
+import hmac
+import secrets
+from threading import Lock
+from time import monotonic
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+class SessionGenerations:
+    """The users' session generations by user id, each trusted for ttl
+    seconds after it's looked up, so a logout in another worker is
+    noticed within that time. Generations only grow, so a session from a
+    newer generation than the cached one means the user logged in again
+    in another worker, and the generation is looked up again. At most
+    max_users generations are kept, the least recently used ones are
+    evicted first."""
+
+    def __init__(self, ttl: float, max_users: int = 10000) -> None:
+        self.ttl = ttl
+        self.max_users = max_users
+        self.generations: "OrderedDict[int, Tuple[int, float]]" = OrderedDict()
+        self.lock = Lock()
+        self.stats = { "hits": 0, "misses": 0, "evictions": 0 }
+
+    def get(self, user_id: int, load: Callable[[], Optional[int]],
+            at_least: int = 0) -> Optional[int]:
+        """Returns the user's cached generation, or loads and caches it if
+        the cached one has expired, or is older than at_least. None, for
+        users that don't exist, isn't cached."""
+
+        with self.lock:
+            cached = self.generations.get(user_id)
+            if cached is not None and monotonic() - cached[1] < self.ttl and \
+               cached[0] >= at_least:
+                self.generations.move_to_end(user_id)
+                self.stats["hits"] += 1
+                return cached[0]
+            self.stats["misses"] += 1
+
+        generation = load()
+        if generation is None:
+            with self.lock:
+                self.generations.pop(user_id, None)
+        else:
+            self.set(user_id, generation)
+        return generation
+
+    def set(self, user_id: int, generation: int) -> None:
+        """Caches the user's generation, as it was just read or changed. A
+        newer generation cached in the meantime is kept."""
+
+        with self.lock:
+            cached = self.generations.pop(user_id, None)
+            if cached is not None:
+                generation = max(generation, cached[0])
+            self.generations[user_id] = (generation, monotonic())
+            while len(self.generations) > self.max_users:
+                self.generations.popitem(last = False)
+                self.stats["evictions"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Returns the cache's counters and size, for monitoring."""
+
+        with self.lock:
+            stats: Dict[str, Any] = dict(self.stats)
+            lookups = stats["hits"] + stats["misses"]
+            stats["hit_rate"] = stats["hits"] / lookups if lookups > 0 else None
+            stats["users"] = len(self.generations)
+            return stats
+
+def new_session_nonce() -> str:
+    """Returns a random value which tells a session apart from the user's
+    other sessions, to be stored in the session when the user logs in."""
+
+    return secrets.token_urlsafe(16)
+
+def make_csrf_token(secret_key: Union[str, bytes], user_id: int, generation: int,
+                    nonce: str) -> str:
+    """Returns the CSRF token of the session: an HMAC of the session's
+    user, generation and nonce, keyed with the server's secret key. It can
+    be checked by making it again, without storing it anywhere, and it
+    stops working when the session's generation is revoked."""
+
+    key = secret_key.encode() if isinstance(secret_key, str) else secret_key
+    message = "csrf:{}:{}:{}".format(user_id, generation, nonce).encode()
+    return hmac.new(key, message, hashlib.sha256).hexdigest()
+
+def is_csrf_token_valid(expected_token: str, csrf_token: str) -> bool:
+    """Returns true if the token sent with a form is the session's token."""
+
+    return secrets.compare_digest(expected_token.encode(), csrf_token.encode())
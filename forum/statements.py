@@ -0,0 +1,678 @@
+"""The SQL statements ForumDatabase executes, built once when the module is
+imported. SQLAlchemy caches the compiled form of each statement object,
+so executing the same object again skips parsing the SQL for its bind
+parameters. The bind parameters are declared with their types, which
+also catches a misspelled parameter name as soon as the module is
+imported."""
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import text, bindparam, Boolean, DateTime, Float, Integer, String
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.sql.elements import TextClause
+
+TIME = DateTime(timezone = True)
+INTEGERS = ARRAY(Integer)
+
+def statement(sql: str, **types: Any) -> TextClause:
+    """Returns the SQL as a statement with the given bind parameter types."""
+    return text(sql).bindparams(*(bindparam(name, type_ = type_)
+                                  for name, type_ in types.items()))
+
+# Computes the up-to-date contents of board_stats from the posts and
+# topics tables. Used for rebuilding and checking the maintained
+# statistics, not for serving pages.
+BOARD_STATS_SQL = (
+    "select b.board_id, "
+    "(select count(*) from topics t where t.parent_board_id = b.board_id) as topic_count, "
+    "(select count(*) from posts p join topics t on p.parent_topic_id = t.topic_id "
+    " where t.parent_board_id = b.board_id) as post_count, "
+    "latest.post_id as last_post_id, latest.parent_topic_id as last_topic_id, "
+    "latest.title as last_post_title, latest.creation_time as last_post_time "
+    "from boards b "
+    "left join lateral (select p.post_id, p.parent_topic_id, p.title, p.creation_time "
+    "                   from posts p join topics t on p.parent_topic_id = t.topic_id "
+    "                   where t.parent_board_id = b.board_id "
+    "                   order by p.creation_time desc, p.post_id desc limit 1) latest on true "
+    "where b.deleted = FALSE")
+
+# The tsvector columns of the posts table, by the text search dictionary
+# they're built with. The dictionaries are the ones named by the
+# translations' "postgres-search-dictionary" strings.
+SEARCH_VECTOR_COLUMNS = {
+    "english": "search_vector_english",
+    "finnish": "search_vector_finnish",
+}
+
+def search_vector_sql(title: str, content: str) -> Dict[str, str]:
+    """Returns the SQL expressions for each search vector column, given the
+    SQL expressions for the title and content the vectors are built from."""
+    return {
+        column: "to_tsvector('{}', {} || ' ' || {})".format(dictionary, title, content)
+        for dictionary, column in SEARCH_VECTOR_COLUMNS.items()
+    }
+
+# Users and sessions
+
+SET_ADMIN = statement(
+    "insert into user_roles (role_id, user_id) "
+    "values (1, (select user_id from users where username = :username)) "
+    "on conflict do nothing",
+    username = String)
+
+GET_ADMIN_SCOPES = statement(
+    "select bool_or(can_create_boards), "
+    "bool_or(can_create_roles), "
+    "bool_or(can_assign_roles) "
+    "from user_roles join roles using (role_id) where user_id = :user_id",
+    user_id = Integer)
+
+GET_USER_CONTEXT = statement(
+    "select u.username, "
+    "scopes.can_create_boards, scopes.can_create_roles, scopes.can_assign_roles, "
+    "array(select role_id from user_roles ur where ur.user_id = u.user_id), "
+    "(select version from board_acl_version) "
+    "from users u "
+    "left join lateral (select bool_or(can_create_boards) as can_create_boards, "
+    "                          bool_or(can_create_roles) as can_create_roles, "
+    "                          bool_or(can_assign_roles) as can_assign_roles "
+    "                   from user_roles join roles using (role_id) "
+    "                   where user_id = u.user_id) scopes on true "
+    "where u.user_id = :user_id",
+    user_id = Integer)
+
+REGISTER = statement(
+    "insert into users "
+    "(username, password_hash, creation_time, password_set_time, latest_login_time) "
+    "values (:username, :password_hash, 'now', 'now', null) "
+    "on conflict (username) do nothing returning user_id",
+    username = String, password_hash = String)
+
+GET_PASSWORD_HASH = statement(
+    "select user_id, password_hash from users where username = :username",
+    username = String)
+
+LOGIN = statement(
+    "update users set latest_login_time = 'now' "
+    "where user_id = :user_id returning session_generation",
+    user_id = Integer)
+
+SET_PASSWORD_HASH = statement(
+    "update users set password_hash = :password_hash where user_id = :user_id",
+    user_id = Integer, password_hash = String)
+
+LOGOUT = statement(
+    "update users set session_generation = session_generation + 1 "
+    "where user_id = :user_id returning session_generation",
+    user_id = Integer)
+
+GET_SESSION_GENERATION = statement(
+    "select session_generation from users where user_id = :user_id",
+    user_id = Integer)
+
+GET_USERNAME = statement(
+    "select username from users where user_id = :user_id",
+    user_id = Integer)
+
+GET_USERS = statement("select user_id, username from users")
+
+# Posts
+
+# Posts are found by their whole primary key, as the creation time limits
+# the lookup to the partition of the post's month.
+DELETE_POST = statement(
+    "delete from posts where author_user_id = :user_id "
+    "and post_id = :post_id and creation_time = :creation_time "
+    "returning parent_topic_id",
+    user_id = Integer, post_id = Integer, creation_time = TIME)
+
+GET_TOPIC_BOARD_ID = statement(
+    "select parent_board_id from topics where topic_id = :topic_id",
+    topic_id = Integer)
+
+IS_TOPIC_EMPTY = statement(
+    "select not exists (select 1 from posts where parent_topic_id = :topic_id)",
+    topic_id = Integer)
+
+DELETE_TOPIC = statement(
+    "delete from topics where topic_id = :topic_id",
+    topic_id = Integer)
+
+REMOVE_TOPIC_REPLY = statement(
+    "update topics set reply_count = reply_count - 1, "
+    "version = version + 1, modified_time = now() where topic_id = :topic_id "
+    "returning first_post_id, last_post_id",
+    topic_id = Integer)
+
+REMOVE_BOARD_POST = statement(
+    "update board_stats set topic_count = topic_count - :deleted_topics, "
+    "post_count = post_count - 1, version = version + 1, modified_time = now() "
+    "where board_id = :board_id returning last_post_id",
+    board_id = Integer, deleted_topics = Integer)
+
+IS_POST_OWNED = statement(
+    "select count(*) = 1 from posts "
+    "where post_id = :post_id and creation_time = :creation_time "
+    "and author_user_id = :user_id",
+    post_id = Integer, creation_time = TIME, user_id = Integer)
+
+_POST_SEARCH_VECTORS = search_vector_sql(":title_original", ":content_original")
+
+EDIT_POST = statement(
+    "update posts set title = :title, title_original = :title_original, "
+    "content = :content, content_original = :content_original, edit_time = 'now', " +
+    ", ".join("{} = {}".format(column, vector)
+              for column, vector in _POST_SEARCH_VECTORS.items()) + " "
+    "where author_user_id = :user_id "
+    "and post_id = :post_id and creation_time = :creation_time",
+    user_id = Integer, post_id = Integer, creation_time = TIME, title = String,
+    title_original = String, content = String, content_original = String)
+
+UPDATE_TOPIC_POST_TITLE = statement(
+    "update topics set "
+    "title = case when first_post_id = :post_id then :title else title end, "
+    "last_post_title = case when last_post_id = :post_id "
+    "                  then :title else last_post_title end, "
+    "version = version + 1, modified_time = now() "
+    "where topic_id = (select parent_topic_id from posts "
+    "                  where post_id = :post_id and creation_time = :creation_time) "
+    "returning parent_board_id",
+    title = String, post_id = Integer, creation_time = TIME)
+
+UPDATE_BOARD_POST_TITLE = statement(
+    "update board_stats set "
+    "last_post_title = case when last_post_id = :post_id "
+    "                  then :title else last_post_title end, "
+    "version = version + 1, modified_time = now() "
+    "where board_id = :board_id",
+    title = String, post_id = Integer, board_id = Integer)
+
+COUNT_TOPICS = statement(
+    "select count(*) from topics where topic_id = :topic_id",
+    topic_id = Integer)
+
+CREATE_POST = statement(
+    "insert into posts (parent_topic_id, author_user_id, title, title_original, "
+    "content, content_original, creation_time, " +
+    ", ".join(_POST_SEARCH_VECTORS.keys()) + ") "
+    "values (:topic_id, :user_id, :title, :title_original, "
+    ":content, :content_original, 'now', " +
+    ", ".join(_POST_SEARCH_VECTORS.values()) + ") "
+    "returning post_id, creation_time",
+    topic_id = Integer, user_id = Integer, title = String, title_original = String,
+    content = String, content_original = String)
+
+# Concurrent posts can commit in a different order than their creation
+# times, so the last post is only replaced by a newer one. Otherwise the
+# last post time could end up before the actual last post, which would
+# leave it out of the topic's pages.
+_IS_NEWER_POST = ("(last_post_time is null or "
+                  "(:creation_time, :post_id) > (last_post_time, last_post_id))")
+
+# The first post of a topic is the topic's "header", the rest are replies.
+ADD_TOPIC_POST = statement(
+    "update topics set "
+    "first_post_id = coalesce(first_post_id, :post_id), "
+    "author_user_id = coalesce(author_user_id, :user_id), "
+    "title = coalesce(title, :title), "
+    "reply_count = case when first_post_id is null then 0 else reply_count + 1 end, "
+    "first_post_time = coalesce(first_post_time, :creation_time), "
+    "last_post_id = case when {0} then :post_id else last_post_id end, "
+    "last_post_title = case when {0} then :title else last_post_title end, "
+    "last_post_time = greatest(last_post_time, :creation_time), "
+    "version = version + 1, modified_time = now() ".format(_IS_NEWER_POST) +
+    "where topic_id = :topic_id",
+    post_id = Integer, user_id = Integer, topic_id = Integer, title = String,
+    creation_time = TIME)
+
+ADD_BOARD_POST = statement(
+    "update board_stats set post_count = post_count + 1, "
+    "last_post_id = case when {0} then :post_id else last_post_id end, "
+    "last_topic_id = case when {0} then :topic_id else last_topic_id end, "
+    "last_post_title = case when {0} then :title else last_post_title end, "
+    "last_post_time = greatest(last_post_time, :creation_time), "
+    "version = version + 1, modified_time = now() ".format(_IS_NEWER_POST) +
+    "where board_id = (select parent_board_id from topics where topic_id = :topic_id)",
+    post_id = Integer, topic_id = Integer, title = String, creation_time = TIME)
+
+GET_TOPIC_POST_TIMES = statement(
+    "select first_post_time, last_post_time, reply_count + 1 from topics "
+    "where topic_id = :topic_id",
+    topic_id = Integer)
+
+# Reads every partition, so it's only for posts whose key isn't known.
+GET_POST_CREATION_TIME = statement(
+    "select creation_time from posts where post_id = :post_id",
+    post_id = Integer)
+
+def _get_posts(condition: str, direction: str) -> TextClause:
+    # The time bounds limit the posts to the partitions of the months in
+    # between. They're given as parameters, rather than looked up in the
+    # statement, so that the other partitions are left out when the
+    # statement is planned, which would otherwise take longer than
+    # executing it.
+    return statement(
+        "select p.post_id, u.username, p.title, p.title_original, "
+        "p.content, p.content_original, p.creation_time, p.edit_time, p.author_user_id "
+        "from posts as p join users as u on author_user_id = user_id "
+        "where parent_topic_id = :topic_id "
+        "and p.creation_time >= :first_time and p.creation_time <= :last_time " +
+        condition +
+        "order by p.creation_time {0}, p.post_id {0} "
+        "limit :limit".format(direction),
+        topic_id = Integer, limit = Integer, first_time = TIME, last_time = TIME,
+        **({ "time": TIME, "post_id": Integer } if condition != "" else {}))
+
+# Pages of posts, oldest first: the first page, the page after a key and
+# the page before a key (fetched newest first, and reversed).
+GET_POSTS = _get_posts("", "asc")
+# The keys' times are repeated outside the row comparisons for pruning the
+# partitions with them.
+GET_POSTS_AFTER = _get_posts("and (p.creation_time, p.post_id) > (:time, :post_id) "
+                             "and p.creation_time >= :time ", "asc")
+GET_POSTS_BEFORE = _get_posts("and (p.creation_time, p.post_id) < (:time, :post_id) "
+                              "and p.creation_time <= :time ", "desc")
+
+# Topics
+
+COUNT_BOARDS = statement(
+    "select count(*) from boards where board_id = :board_id",
+    board_id = Integer)
+
+CREATE_TOPIC = statement(
+    "insert into topics (parent_board_id, sticky) values (:board_id, FALSE) "
+    "returning topic_id",
+    board_id = Integer)
+
+ADD_BOARD_TOPIC = statement(
+    "update board_stats set topic_count = topic_count + 1 where board_id = :board_id",
+    board_id = Integer)
+
+def _get_topics(condition: str, direction: str) -> TextClause:
+    # Topics without a first post shouldn't exist anymore, but old
+    # versions of tsoha-forum could get the database in this state.
+    return statement(
+        "select t.topic_id, t.title, u.username, t.reply_count, "
+        "t.last_post_id, t.last_post_title, t.last_post_time, t.sticky "
+        "from topics t left join users u on t.author_user_id = u.user_id "
+        "where t.parent_board_id = :board_id and t.first_post_id is not null " +
+        condition +
+        "order by t.sticky {0}, t.last_post_time {0}, t.topic_id {0} "
+        "limit :limit".format(direction),
+        board_id = Integer, limit = Integer,
+        **({ "sticky": Boolean, "time": TIME, "topic_id": Integer } if condition != "" else {}))
+
+# Pages of topics, sticky and recently active first: the first page, the
+# page after a key and the page before a key (fetched in reverse).
+GET_TOPICS = _get_topics("", "desc")
+GET_TOPICS_AFTER = _get_topics(
+    "and (t.sticky, t.last_post_time, t.topic_id) < (:sticky, :time, :topic_id) ", "desc")
+GET_TOPICS_BEFORE = _get_topics(
+    "and (t.sticky, t.last_post_time, t.topic_id) > (:sticky, :time, :topic_id) ", "asc")
+
+_REFRESH_TOPIC_SUMMARIES = (
+    "update topics t set "
+    "(first_post_id, author_user_id, title, first_post_time) = "
+    "(select p.post_id, p.author_user_id, p.title, p.creation_time from posts p "
+    " where p.parent_topic_id = t.topic_id "
+    " order by p.creation_time asc, p.post_id asc limit 1), "
+    "(last_post_id, last_post_title, last_post_time) = "
+    "(select p.post_id, p.title, p.creation_time from posts p "
+    " where p.parent_topic_id = t.topic_id "
+    " order by p.creation_time desc, p.post_id desc limit 1), "
+    "reply_count = greatest((select count(*) from posts p "
+    "                        where p.parent_topic_id = t.topic_id) - 1, 0) ")
+
+REFRESH_TOPIC_SUMMARY = statement(
+    _REFRESH_TOPIC_SUMMARIES + "where t.topic_id = :topic_id",
+    topic_id = Integer)
+
+# For topics which lost or got back posts in other ways than posting and
+# deleting, so their pages' versions change too.
+REFRESH_TOPIC_SUMMARIES = statement(
+    _REFRESH_TOPIC_SUMMARIES + ", version = version + 1, modified_time = now() "
+    "where t.topic_id = any(:topic_ids)",
+    topic_ids = INTEGERS)
+
+GET_TOPIC_DATA = statement(
+    "select parent_board_id, title from topics "
+    "where topic_id = :topic_id and first_post_id is not null",
+    topic_id = Integer)
+
+GET_TOPIC_VERSION = statement(
+    "select version, modified_time from topics "
+    "where topic_id = :topic_id and first_post_id is not null",
+    topic_id = Integer)
+
+# Boards and roles
+
+EDIT_BOARD = statement(
+    "update boards set title = :title, description = :desc where board_id = :board_id",
+    title = String, desc = String, board_id = Integer)
+
+DELETE_BOARD_ROLES = statement(
+    "delete from board_roles where board_id = :board_id",
+    board_id = Integer)
+
+ADD_BOARD_ROLE = statement(
+    "insert into board_roles (board_id, role_id) values (:board_id, :role_id)",
+    board_id = Integer, role_id = Integer)
+
+DELETE_BOARD = statement(
+    "update boards set deleted = TRUE where board_id = :board_id",
+    board_id = Integer)
+
+DELETE_BOARD_STATS = statement(
+    "delete from board_stats where board_id = :board_id",
+    board_id = Integer)
+
+CREATE_BOARD = statement(
+    "insert into boards (title, description) values (:title, :description) "
+    "returning board_id",
+    title = String, description = String)
+
+CREATE_BOARD_STATS = statement(
+    "insert into board_stats (board_id) values (:board_id)",
+    board_id = Integer)
+
+CREATE_ROLE = statement(
+    "insert into roles "
+    "(role_name, can_create_boards, can_create_roles, can_assign_roles) values "
+    "(:title, :can_create_boards, :can_create_roles, :can_assign_roles) "
+    "returning role_id",
+    title = String, can_create_boards = Boolean, can_create_roles = Boolean,
+    can_assign_roles = Boolean)
+
+ASSIGN_ROLE = statement(
+    "insert into user_roles (role_id, user_id) values (:role_id, :user_id)",
+    role_id = Integer, user_id = Integer)
+
+BUMP_BOARD_ACL_VERSION = statement("update board_acl_version set version = version + 1")
+
+GET_USER_ROLES = statement(
+    "select array(select role_id from user_roles where user_id = :user_id), "
+    "(select version from board_acl_version)",
+    user_id = Integer)
+
+def _board_access(board: str, role_ids: str) -> str:
+    # Whether the board, a row of boards, can be seen with the roles: it
+    # isn't deleted, and it's either open to everyone, or to one of them.
+    return (
+        "{0}.deleted = FALSE "
+        "and (not exists (select 1 from board_roles br where br.board_id = {0}.board_id) "
+        "     or exists (select 1 from board_roles br "
+        "                where br.board_id = {0}.board_id and br.role_id = any({1}))) ").format(
+            board, role_ids)
+
+GET_ROLE_BOARD_ACCESS = statement(
+    "select b.board_id from boards b where " + _board_access("b", ":role_ids"),
+    role_ids = INTEGERS)
+
+GET_BOARD_ROLE_IDS = statement(
+    "select role_id from board_roles where board_id = :board_id",
+    board_id = Integer)
+
+# The board ids are the user's board access, read from the primary with
+# GET_ROLE_BOARD_ACCESS, so a replica's lag can't show revoked boards.
+GET_BOARDS = statement(
+    "select b.board_id, b.title, b.description, s.topic_count, s.post_count, "
+    "s.last_topic_id, s.last_post_id, s.last_post_title, s.last_post_time "
+    "from boards b join board_stats s using (board_id) "
+    "where b.board_id = any(:board_ids) "
+    "order by b.title",
+    board_ids = INTEGERS)
+
+GET_ROLES = statement("select role_id, role_name from roles")
+
+GET_BOARD_DATA = statement(
+    "select title, description from boards where board_id = :board_id",
+    board_id = Integer)
+
+GET_BOARDS_VERSION = statement(
+    "select coalesce(sum(version), 0), max(modified_time) "
+    "from board_stats where board_id = any(:board_ids)",
+    board_ids = INTEGERS)
+
+GET_BOARD_VERSION = statement(
+    "select version, modified_time from board_stats where board_id = :board_id",
+    board_id = Integer)
+
+# Board statistics
+
+REFRESH_BOARD_LAST_POST = statement(
+    "update board_stats set "
+    "(last_post_id, last_topic_id, last_post_title, last_post_time) = "
+    "(select last_post_id, topic_id, last_post_title, last_post_time "
+    " from topics where parent_board_id = :board_id and last_post_time is not null "
+    " order by last_post_time desc, last_post_id desc limit 1) "
+    "where board_id = :board_id",
+    board_id = Integer)
+
+# The boards whose topics' summaries were refreshed, with
+# REFRESH_TOPIC_SUMMARIES. Their rows are locked before they're refreshed,
+# so that posts which are being written are either seen by the refresh,
+# or added to its result once it's committed.
+LOCK_TOPICS_BOARD_STATS = statement(
+    "select board_id from board_stats "
+    "where board_id in (select parent_board_id from topics where topic_id = any(:topic_ids)) "
+    "order by board_id for update",
+    topic_ids = INTEGERS)
+
+REFRESH_BOARD_STATS = statement(
+    "update board_stats s set "
+    "post_count = (select coalesce(sum(t.reply_count + 1), 0) from topics t "
+    "              where t.parent_board_id = s.board_id and t.first_post_id is not null), "
+    "(last_post_id, last_topic_id, last_post_title, last_post_time) = "
+    "(select last_post_id, topic_id, last_post_title, last_post_time "
+    " from topics where parent_board_id = s.board_id and last_post_time is not null "
+    " order by last_post_time desc, last_post_id desc limit 1), "
+    "version = version + 1, modified_time = now() "
+    "where board_id = any(:board_ids)",
+    board_ids = INTEGERS)
+
+CHECK_BOARD_STATS = statement(
+    "select coalesce(e.board_id, s.board_id) "
+    "from (" + BOARD_STATS_SQL + ") e "
+    "full join board_stats s on e.board_id = s.board_id "
+    "where e.board_id is null or s.board_id is null "
+    "or (e.topic_count, e.post_count, e.last_post_id, e.last_topic_id, "
+    "    e.last_post_title, e.last_post_time) is distinct from "
+    "   (s.topic_count, s.post_count, s.last_post_id, s.last_topic_id, "
+    "    s.last_post_title, s.last_post_time) "
+    "order by 1")
+
+# Keeps concurrent posts from updating the rows while they're rebuilt.
+LOCK_BOARD_STATS = statement("lock table board_stats in exclusive mode")
+
+DELETE_ALL_BOARD_STATS = statement("delete from board_stats")
+
+REBUILD_BOARD_STATS = statement(
+    "insert into board_stats (board_id, topic_count, post_count, last_post_id, "
+    "last_topic_id, last_post_title, last_post_time) " + BOARD_STATS_SQL)
+
+# Search
+
+# Unlike set local, set_config takes the timeout as a bind parameter.
+SET_STATEMENT_TIMEOUT = statement(
+    "select set_config('statement_timeout', cast(:timeout as text), true)",
+    timeout = Integer)
+
+RESET_STATEMENT_TIMEOUT = statement("set local statement_timeout to default")
+
+def _search_posts(search_vector: str, after: bool) -> TextClause:
+    condition = "where (rank, post_id) < (cast(:rank as real), :post_id) " if after else ""
+    # The snippets are only made for the posts on the page, as they're
+    # considerably slower to make than the ranks. The board ids are the
+    # user's board access, like in GET_BOARDS.
+    return statement(
+        "select r.post_id, r.topic_id, r.board_id, u.username, r.title, "
+        "ts_headline(:dict, coalesce(p.content_original, p.content), "
+        "            plainto_tsquery(:dict, :query), :snippet_options), "
+        "r.creation_time, r.edit_time, r.rank "
+        "from (select * from "
+        "      (select p.post_id, t.topic_id, t.parent_board_id as board_id, "
+        "              p.author_user_id, p.title, p.creation_time, p.edit_time, "
+        "              ts_rank_cd(" + search_vector + ", query) as rank "
+        "       from posts p join topics t on parent_topic_id = topic_id, "
+        "            plainto_tsquery(:dict, :query) query "
+        "       where " + search_vector + " @@ query "
+        "       and t.parent_board_id = any(:board_ids)) matches " +
+        condition +
+        "      order by rank desc, post_id desc limit :limit) r "
+        "join posts p on p.post_id = r.post_id and p.creation_time = r.creation_time "
+        "join users u on r.author_user_id = u.user_id "
+        "order by r.rank desc, r.post_id desc",
+        dict = String, query = String, board_ids = INTEGERS, limit = Integer,
+        snippet_options = String,
+        **({ "rank": Float, "post_id": Integer } if after else {}))
+
+# The search vector expressions, by dictionary (None for the dictionaries
+# without a search vector column).
+_SEARCH_VECTORS: List[Tuple[Optional[str], str]] = [
+    (dictionary, "p." + column) for dictionary, column in SEARCH_VECTOR_COLUMNS.items()
+]
+# Not indexed, but works for any dictionary PostgreSQL has.
+_SEARCH_VECTORS.append((None, "to_tsvector(:dict, p.title || ' ' || p.content)"))
+
+# Search statements by dictionary and whether they continue after a key.
+SEARCH_POSTS: Dict[Tuple[Optional[str], bool], TextClause] = {
+    (dictionary, after): _search_posts(search_vector, after)
+    for dictionary, search_vector in _SEARCH_VECTORS
+    for after in (False, True)
+}
+
+# Maintenance
+
+_BACKFILL_SEARCH_VECTORS = search_vector_sql("coalesce(p.title_original, p.title)",
+                                             "coalesce(p.content_original, p.content)")
+
+BACKFILL_SEARCH_VECTORS = statement(
+    "with batch as (select post_id from posts where post_id > :after_post_id "
+    "               order by post_id limit :batch_size) "
+    "update posts p set " +
+    ", ".join("{} = {}".format(column, vector)
+              for column, vector in _BACKFILL_SEARCH_VECTORS.items()) + " "
+    "from batch where p.post_id = batch.post_id "
+    "returning p.post_id",
+    after_post_id = Integer, batch_size = Integer)
+
+STREAM_POST_SOURCES = statement(
+    "select post_id, title_original, content_original from posts "
+    "where post_id > :after_post_id "
+    "and title_original is not null and content_original is not null "
+    "order by post_id",
+    after_post_id = Integer)
+
+STORE_RENDERED_POSTS = statement(
+    "update posts p set title = v.title, content = v.content "
+    "from unnest(cast(:post_ids as integer[]), cast(:title_originals as text[]), "
+    "            cast(:content_originals as text[]), cast(:titles as text[]), "
+    "            cast(:contents as text[])) "
+    "     as v(post_id, title_original, content_original, title, content) "
+    "where p.post_id = v.post_id and p.title_original = v.title_original "
+    "and p.content_original = v.content_original "
+    "and (p.title, p.content) is distinct from (v.title, v.content) "
+    "returning p.post_id",
+    post_ids = INTEGERS, title_originals = ARRAY(String), content_originals = ARRAY(String),
+    titles = ARRAY(String), contents = ARRAY(String))
+
+STORE_RENDERED_TOPIC_TITLES = statement(
+    "update topics t set title = p.title from posts p "
+    "where p.post_id = any(:post_ids) and t.topic_id = p.parent_topic_id "
+    "and t.first_post_id = p.post_id and t.title is distinct from p.title",
+    post_ids = INTEGERS)
+
+STORE_RENDERED_TOPIC_LAST_TITLES = statement(
+    "update topics t set last_post_title = p.title from posts p "
+    "where p.post_id = any(:post_ids) and t.topic_id = p.parent_topic_id "
+    "and t.last_post_id = p.post_id "
+    "and t.last_post_title is distinct from p.title",
+    post_ids = INTEGERS)
+
+STORE_RENDERED_BOARD_LAST_TITLES = statement(
+    "update board_stats s set last_post_title = p.title from posts p "
+    "where p.post_id = any(:post_ids) and s.last_post_id = p.post_id "
+    "and s.last_post_title is distinct from p.title",
+    post_ids = INTEGERS)
+
+BUMP_POST_TOPIC_VERSIONS = statement(
+    "update topics set version = version + 1, modified_time = now() "
+    "where topic_id in (select parent_topic_id from posts "
+    "                   where post_id = any(:post_ids)) "
+    "returning parent_board_id",
+    post_ids = INTEGERS)
+
+BUMP_BOARD_VERSIONS = statement(
+    "update board_stats set version = version + 1, modified_time = now() "
+    "where board_id = any(:board_ids)",
+    board_ids = INTEGERS)
+
+# Read replicas
+
+# The position in the primary's write-ahead log, which is past every
+# transaction committed so far.
+GET_WAL_LSN = statement("select cast(pg_current_wal_lsn() as text)")
+
+# Whether the replica has replayed the primary's log up to the position.
+# False on a server which isn't replaying anything, i.e. isn't a replica.
+GET_REPLICA_CAUGHT_UP = statement(
+    "select coalesce(pg_last_wal_replay_lsn() >= cast(:lsn as pg_lsn), false)",
+    lsn = String)
+
+# Post partitions
+
+ARE_POSTS_PARTITIONED = statement(
+    "select exists (select 1 from pg_partitioned_table "
+    "               where partrelid = cast('posts' as regclass))")
+
+# Creates the missing monthly partitions of posts between the times, see
+# partition_posts.sql.
+CREATE_POST_PARTITIONS = statement(
+    "select create_post_partitions(:from_time, :until_time)",
+    from_time = TIME, until_time = TIME)
+
+# The partitions of posts, and the archived ones, with their sizes on disk.
+GET_POST_PARTITIONS = statement(
+    "select c.relname, pg_total_relation_size(c.oid), i.inhrelid is null "
+    "from pg_class c left join pg_inherits i "
+    "on i.inhrelid = c.oid and i.inhparent = cast('posts' as regclass) "
+    "where c.relkind = 'r' and pg_table_is_visible(c.oid) "
+    "and c.relname ~ '^(archived_)?posts_([0-9]{4}_[0-9]{2}|default)$' "
+    "order by substring(c.relname from 'posts_.*'), c.relname")
+
+def post_partition_sql(month_start: datetime) -> Dict[str, TextClause]:
+    """Returns the statements for archiving and restoring the partition of
+    the month starting at month_start (in UTC). The partition's name and
+    bounds are formatted from it, as table names and partition bounds
+    can't be bind parameters."""
+
+    month_end = month_start.replace(year = month_start.year + month_start.month // 12,
+                                    month = month_start.month % 12 + 1)
+    partition = "posts_{:%Y_%m}".format(month_start)
+    archive = "archived_" + partition
+    bounds = "'{:%Y-%m-%d %H:%M:%S}+00'".format(month_start), \
+        "'{:%Y-%m-%d %H:%M:%S}+00'".format(month_end)
+    return {
+        "topic_ids": statement("select distinct parent_topic_id from " + partition),
+        "detach": statement("alter table posts detach partition " + partition),
+        # PostgreSQL only compresses values of rows longer than about 2 kB,
+        # which few posts are, so the posts are archived as JSON arrays of
+        # a hundred posts each, without the indexes and the search vectors.
+        "archive": statement(
+            "create table {0} as "
+            "select n / 100 as chunk, jsonb_agg(post order by n) as posts "
+            "from (select row_number() over (order by creation_time, post_id) - 1 as n, "
+            "             to_jsonb(p) - {2} as post from {1} p) numbered "
+            "group by n / 100; "
+            "drop table {1}".format(archive, partition, " - ".join(
+                "'{}'".format(column) for column in SEARCH_VECTOR_COLUMNS.values()))),
+        "restore": statement(
+            "create table {1} (like posts including defaults); "
+            "insert into {1} select r.* from {0} a, "
+            "jsonb_populate_recordset(cast(null as posts), a.posts) r; "
+            "update {1} p set {4}; "
+            "alter table posts attach partition {1} for values from ({2}) to ({3}); "
+            "drop table {0}".format(archive, partition, *bounds, ", ".join(
+                "{} = {}".format(column, vector)
+                for column, vector in _BACKFILL_SEARCH_VECTORS.items()))),
+    }
@@ -0,0 +1,56 @@
+"""Sending pages to the client in pieces as they're rendered."""
+
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+class Page: # pylint: disable = R0903
+    """A page of rows, which are read as the template iterates over them,
+    so the rows can be rendered while the rest are still being read from
+    the database. The first row is read right away, so empty pages can be
+    answered with an error before the page is sent.
+
+    The rows are fetched with one extra row, which isn't a part of the
+    page, to see if there's a page after this one. has_next is only known
+    after the rows have been iterated over, which can be done once."""
+
+    def __init__(self, rows: Iterable[Any], size: int, has_previous: bool,
+                 has_next: bool = False) -> None:
+        self.rows = iter(rows)
+        self.size = size
+        self.has_previous = has_previous
+        self.has_next = has_next
+        self.first: Optional[Any] = next(self.rows, None)
+        self.last = self.first
+
+    def __iter__(self) -> Iterator[Any]:
+        if self.first is None:
+            return
+        yield self.first
+        for count, row in enumerate(self.rows, start = 1):
+            if count == self.size:
+                self.has_next = True
+                return
+            self.last = row
+            yield row
+
+def stream_template(template: Any, variables: Dict[str, Any],
+                    buffer_size: int = 8192) -> Iterator[str]:
+    """Renders the template, yielding the output in chunks of about
+    buffer_size characters, and everything rendered so far whenever the
+    template calls flush(), so the client can start on the page (e.g.
+    loading the stylesheets) before it's done."""
+
+    pieces: List[str] = []
+    length = 0
+    flushing = False
+    def flush() -> str:
+        nonlocal flushing
+        flushing = True
+        return ""
+    for piece in template.generate(dict(variables, flush = flush)):
+        pieces.append(piece)
+        length += len(piece)
+        if flushing or length >= buffer_size:
+            yield "".join(pieces)
+            pieces, length, flushing = [], 0, False
+    if len(pieces) > 0:
+        yield "".join(pieces)
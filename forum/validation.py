@@ -1,19 +1,98 @@
 """Validation methods for user-submitted data."""
 
 import gzip
-from typing import Set
+import mmap
+import os
+import tempfile
+from threading import Lock
+from typing import Optional, Union
 
-def load_common_passwords() -> Set[str]:
-    """Loads all rows from the uncompressed contents of forum/common_passwords.txt.gz
-    and creates a set containing every row. Used in is_valid_password()."""
+COMMON_PASSWORDS_SOURCE = os.path.join(os.path.dirname(__file__), "common_passwords.txt.gz")
+COMMON_PASSWORDS_SORTED = os.path.join(os.path.dirname(__file__), "common_passwords.sorted")
 
-    passwords = set()
-    with gzip.open("forum/common_passwords.txt.gz", "rt") as passwords_file:
-        for password in passwords_file.readlines():
-            passwords.add(password.strip())
-    return passwords
+def sort_common_passwords(source: str = COMMON_PASSWORDS_SOURCE) -> bytes:
+    """Returns the rows of the compressed password list sorted as UTF-8
+    bytes, one per line, in the format CommonPasswords searches."""
 
-COMMON_PASSWORDS = load_common_passwords()
+    with gzip.open(source, "rt") as passwords_file:
+        passwords = { password.strip().encode() for password in passwords_file }
+    passwords.discard(b"")
+    return b"".join(password + b"\n" for password in sorted(passwords))
+
+def build_common_passwords(source: str = COMMON_PASSWORDS_SOURCE,
+                           target: str = COMMON_PASSWORDS_SORTED) -> bytes:
+    """Writes the sorted password list into the target file, and returns
+    its contents. The file is replaced atomically, so processes which have
+    the old one open aren't affected."""
+
+    data = sort_common_passwords(source)
+    fd, temporary_path = tempfile.mkstemp(dir = os.path.dirname(target))
+    try:
+        with os.fdopen(fd, "wb") as sorted_file:
+            sorted_file.write(data)
+        os.chmod(temporary_path, 0o644)
+        os.replace(temporary_path, target)
+    except OSError:
+        os.remove(temporary_path)
+        raise
+    return data
+
+class CommonPasswords:
+    """The list of common passwords, searched from a sorted file mapped into
+    memory. The file is only opened on the first lookup, and as it's
+    mapped read-only, all the server processes share the same copy of it
+    in the operating system's page cache."""
+
+    def __init__(self, source: str = COMMON_PASSWORDS_SOURCE,
+                 sorted_path: str = COMMON_PASSWORDS_SORTED) -> None:
+        self.source = source
+        self.sorted_path = sorted_path
+        self.data: Optional[Union[mmap.mmap, bytes]] = None
+        self.lock = Lock()
+
+    def load(self) -> Union[mmap.mmap, bytes]:
+        """Maps the sorted file into memory, building it first if it's
+        missing or older than the source."""
+
+        with self.lock:
+            if self.data is not None:
+                return self.data
+            if not os.path.exists(self.sorted_path) or \
+               os.path.getmtime(self.sorted_path) < os.path.getmtime(self.source):
+                try:
+                    build_common_passwords(self.source, self.sorted_path)
+                except OSError:
+                    # E.g. a read-only file system. The list still works,
+                    # it's just not shared between the processes.
+                    self.data = sort_common_passwords(self.source)
+                    return self.data
+            with open(self.sorted_path, "rb") as sorted_file:
+                self.data = mmap.mmap(sorted_file.fileno(), 0, access = mmap.ACCESS_READ)
+            return self.data
+
+    def __contains__(self, password: object) -> bool:
+        """Binary searches the sorted lines for the password."""
+
+        if not isinstance(password, str):
+            return False
+        data = self.data if self.data is not None else self.load()
+        key = password.encode("utf-8", "surrogatepass")
+        # The range between low and high always consists of whole lines.
+        low, high = 0, len(data)
+        while low < high:
+            middle = (low + high) // 2
+            start = data.rfind(b"\n", 0, middle) + 1
+            end = data.find(b"\n", start)
+            line = data[start:end]
+            if line == key:
+                return True
+            if line < key:
+                low = end + 1
+            else:
+                high = start
+        return False
+
+COMMON_PASSWORDS = CommonPasswords()
 
 def is_valid_username(username: str) -> bool:
     """Returns True if the username is allowed."""
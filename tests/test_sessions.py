@@ -0,0 +1,86 @@
+"""Tests for the workers' caches of the users' session generations."""
+
+import os
+import sys
+import types
+import unittest
+from typing import Dict, Optional
+
+# Importing the forum package connects to the database, which these
+# tests don't need, so the package is stood in for by an empty one.
+_FORUM_PACKAGE = types.ModuleType("forum")
+_FORUM_PACKAGE.__path__ = [os.path.join(os.path.dirname(__file__), "..", "forum")]
+sys.modules.setdefault("forum", _FORUM_PACKAGE)
+from forum.sessions import SessionGenerations # pylint: disable = C0413
+
+USER_ID = 1
+
+class SessionGenerationsTest(unittest.TestCase):
+    """Two workers' caches in front of the generations in the primary."""
+
+    def setUp(self) -> None:
+        self.primary: Dict[int, int] = { USER_ID: 0 }
+        self.loads = 0
+        self.worker_a = SessionGenerations(60)
+        self.worker_b = SessionGenerations(60)
+
+    def load(self) -> Optional[int]:
+        """Reads the generation from the primary, counting the reads."""
+        self.loads += 1
+        return self.primary.get(USER_ID)
+
+    def is_valid(self, worker: SessionGenerations, generation: int) -> bool:
+        """Checks the session like routes.session_user_id does."""
+        return worker.get(USER_ID, self.load, generation) == generation
+
+    def log_in(self, worker: SessionGenerations) -> int:
+        """Logs in like ForumDatabase.login, returning the session's generation."""
+        worker.set(USER_ID, self.primary[USER_ID])
+        return self.primary[USER_ID]
+
+    def log_out(self, worker: SessionGenerations) -> None:
+        """Logs out like ForumDatabase.logout."""
+        self.primary[USER_ID] += 1
+        worker.set(USER_ID, self.primary[USER_ID])
+
+    def test_cached_generation_is_trusted(self) -> None:
+        """The generation is only read once while it's cached."""
+        session = self.log_in(self.worker_a)
+        self.assertTrue(self.is_valid(self.worker_b, session))
+        self.assertTrue(self.is_valid(self.worker_b, session))
+        self.assertEqual(self.loads, 1)
+
+    def test_logout_revokes_the_session(self) -> None:
+        """The worker which handled the logout rejects the session at once."""
+        session = self.log_in(self.worker_a)
+        self.log_out(self.worker_a)
+        self.assertFalse(self.is_valid(self.worker_a, session))
+
+    def test_login_after_logout_in_another_worker(self) -> None:
+        """A session newer than the cached generation isn't logged out."""
+        old_session = self.log_in(self.worker_a)
+        self.assertTrue(self.is_valid(self.worker_b, old_session))
+        self.log_out(self.worker_a)
+        new_session = self.log_in(self.worker_a)
+
+        # Worker B has the old generation cached, but the newer session
+        # makes it look the generation up again instead of rejecting it.
+        self.assertTrue(self.is_valid(self.worker_b, new_session))
+        self.assertFalse(self.is_valid(self.worker_b, old_session))
+        self.assertEqual(self.loads, 2)
+
+    def test_older_generation_is_not_cached_over_a_newer_one(self) -> None:
+        """A slow read can't replace a newer generation with its older one."""
+        self.worker_a.set(USER_ID, 2)
+        self.worker_a.set(USER_ID, 1)
+        self.assertEqual(self.worker_a.get(USER_ID, self.load), 2)
+
+    def test_missing_user_is_not_cached(self) -> None:
+        """Users which don't exist are read again every time."""
+        del self.primary[USER_ID]
+        self.assertIsNone(self.worker_a.get(USER_ID, self.load))
+        self.assertIsNone(self.worker_a.get(USER_ID, self.load))
+        self.assertEqual(self.loads, 2)
+
+if __name__ == "__main__":
+    unittest.main()